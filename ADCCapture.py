@@ -0,0 +1,224 @@
+# $Id$
+#
+# Free-running ADC capture of several pots into a ring buffer.
+#
+# The RP2040 ADC samples the given pins round-robin, at a fixed rate,
+# into its FIFO, and a DMA channel copies the FIFO into a ring buffer.
+# Reading the pots then costs the control loop nothing but a copy of
+# the samples that arrived since the last read(), and FilteredADC gets
+# a steady stream of samples instead of one per Timer tick.
+#
+# Firmware without rp2.DMA (and the host simulator) gets the same
+# interface from a Timer callback calling read_u16() at the same rate.
+#
+# Samples are numbered as captured, all pins together, modulo WRAP, so
+# the numbers stay small ints, and the hard IRQ code using them
+# (CurrentSense.trip_cb()) allocates nothing, however long it runs.
+# Like ticks_diff(), compare them only through their difference.  WRAP
+# is a multiple of the ring length, so a number's ring slot survives
+# the wrap.  It need not be one of the pin count : a pin's samples are
+# found by stepping whole rounds (nch samples) from its last one, never
+# from the number itself.
+#
+#   cap = ADCCapture((26,27),rate=1000)  # 1 kHz per pin
+#   cap.start()
+#   n = cap.read(cap.index(26),buf)      # new samples for GP26, as u16
+
+from machine import ADC,Timer
+from micropython import const
+from array import array
+
+try :
+    import rp2,uctypes
+    from machine import mem32
+    DMA_OK = hasattr(rp2,'DMA')
+except ImportError :
+    DMA_OK = False
+
+# RP2040 ADC registers
+_ADC_CS  = const(0x4004C000)
+_ADC_FCS  = const(0x4004C008)
+_ADC_FIFO = const(0x4004C00C)
+_ADC_DIV  = const(0x4004C010)
+_CS_EN         = const(0x0001)
+_CS_START_MANY = const(0x0008)
+_CS_READY      = const(0x0100)
+_FCS_EN      = const(0x0001)
+_FCS_DREQ_EN = const(0x0008)
+_FCS_EMPTY   = const(0x0100)
+_FCS_UNDER   = const(0x0400)
+_FCS_OVER    = const(0x0800)
+_DREQ_ADC = const(36)
+_ADC_CLK  = const(48000000)
+WRAP   = const(0x20000000)  # sample numbers wrap here.  power of 2
+_MASK  = const(0x1FFFFFFF)
+_HALF  = const(0x10000000)
+_COUNT = const(0x10000000)  # DMA transfers per arm, a multiple of n
+
+class ADCCapture() :
+    def __init__(self,pins=(26,27),rate=1000,ringLen=64,useDMA=DMA_OK) :
+        # round-robin goes up from the lowest channel, so keep pins sorted
+        self.pins = sorted(pins)
+        self.adcs = [ADC(p) for p in self.pins]  # also sets pins to analog
+        self.nch = len(self.pins)
+        self.rate = rate  # samples/s per pin
+        n = 8
+        while n < ringLen : n <<= 1
+        self.n = n        # ring length, samples, power of 2
+        self.useDMA = useDMA
+        self.rd = list(range(self.nch))  # next sample number to read, per pin
+        self.overruns = 0
+        self.running = False
+        if useDMA :
+            # DMA ring wraps on an address boundary of its own size, so
+            # allocate double and use the aligned half
+            self.raw = array('H',[0] * (2 * n))
+            addr = uctypes.addressof(self.raw)
+            self.off = ((-addr) & (2 * n - 1)) >> 1
+            self.ringBits = 1
+            while (1 << self.ringBits) < 2 * n : self.ringBits += 1
+            self.dma = None
+        else :
+            self.raw = array('H',[0] * n)
+            self.off = 0
+            self.timer = Timer()
+            self.sampleCB = self.sample_cb
+        self.base = 0   # samples before current DMA arm
+        self.total = 0  # samples written, soft capture
+
+    def index(self,pin) : # channel index of pin, for read()
+        return self.pins.index(pin)
+
+    def start(self) :
+        for i in range(self.nch) : self.rd[i] = i
+        self.total = 0
+        self.base = 0
+        if self.useDMA :
+            self.startDMA()
+        else :
+            self.timer.init(freq=self.rate, mode=Timer.PERIODIC,
+                            callback=self.sampleCB)
+        self.running = True
+
+    def stop(self) :
+        if self.useDMA :
+            mem32[_ADC_CS] = _CS_EN
+            if self.dma is not None :
+                self.dma.close()
+                self.dma = None
+            mem32[_ADC_FCS] = 0
+        else :
+            self.timer.deinit()
+        self.running = False
+
+    def startDMA(self) : # internal
+        mem32[_ADC_CS] = _CS_EN
+        while not (mem32[_ADC_CS] & _CS_READY) :
+            pass
+        # FIFO on, DREQ when 1 sample ready, clear sticky errors
+        mem32[_ADC_FCS] = _FCS_EN | _FCS_DREQ_EN | (1 << 24) | _FCS_UNDER | _FCS_OVER
+        while not (mem32[_ADC_FCS] & _FCS_EMPTY) :
+            mem32[_ADC_FIFO]
+        div = _ADC_CLK // (self.rate * self.nch) - 1
+        if div < 95 : div = 95   # 96 ADC clocks per conversion, 500 ks/s
+        mem32[_ADC_DIV] = (div & 0xFFFF) << 8
+        self.dma = rp2.DMA()
+        self.arm()
+        ch0 = self.pins[0] - 26
+        mask = 0
+        for p in self.pins : mask |= 1 << (p - 26)
+        mem32[_ADC_CS] = (_CS_EN | _CS_START_MANY | (ch0 << 12) |
+                          ((mask if self.nch > 1 else 0) << 16))
+
+    def arm(self) : # internal.  (re)start the DMA channel
+        d = self.dma
+        ctrl = d.pack_ctrl(size=1, inc_read=False, inc_write=True,
+                           treq_sel=_DREQ_ADC, ring_size=self.ringBits,
+                           ring_sel=True)
+        d.config(read=_ADC_FIFO,
+                 write=uctypes.addressof(self.raw) + 2 * self.off,
+                 count=_COUNT, ctrl=ctrl, trigger=True)
+
+    def sample_cb(self,tmr) : # internal, soft capture
+        raw = self.raw
+        t = self.total
+        for a in self.adcs :
+            raw[t & (self.n - 1)] = a.read_u16() >> 4  # 12 bits, as DMA
+            t += 1
+        self.total = t & _MASK
+
+    def written(self) : # samples captured so far
+        if not self.useDMA :
+            return self.total
+        d = self.dma
+        if not d.active() :  # ran out of transfers.  carry on
+            self.base = (self.base + _COUNT - d.count) & _MASK
+            self.arm()
+        return (self.base + _COUNT - d.count) & _MASK
+
+    # as written(), but never re-arms, so a hard IRQ can call it.  Stuck
+    # at the end of an arm until the next written()
+    def captured(self) :
+        if not self.useDMA :
+            return self.total
+        return (self.base + _COUNT - self.dma.count) & _MASK
+
+    # s, a pin's sample number, moved on by whole rounds to its first at
+    # or after sample t.  IRQ safe
+    def skipTo(self,s,t) :
+        d = ((t - s + _HALF) & _MASK) - _HALF
+        if d > 0 :
+            nch = self.nch
+            s = (s + (d + nch - 1) // nch * nch) & _MASK
+        return s
+
+    # samples of s's pin from s until sample total.  IRQ safe
+    def count(self,s,total) :
+        d = ((total - s + _HALF) & _MASK) - _HALF
+        if d <= 0 : return 0
+        return (d + self.nch - 1) // self.nch
+
+    def first(self,i,total) : # internal.  next new sample of channel i
+        s = self.rd[i]
+        # DMA may be overwriting older ones
+        oldest = (total - self.n + self.nch) & _MASK
+        if ((oldest - s + _HALF) & _MASK) - _HALF > 0 :
+            self.overruns += 1
+            s = self.skipTo(s,oldest)
+        return s
+
+    # copy new samples for channel i into buf, scaled to u16 like
+    # read_u16().  returns number copied
+    def read(self,i,buf) :
+        total = self.written()
+        nch = self.nch
+        s = self.first(i,total)
+        m = self.count(s,total)
+        if m > len(buf) : m = len(buf)
+        raw = self.raw
+        off = self.off
+        mask = self.n - 1
+        for k in range(m) :
+            v = raw[off + ((s + k * nch) & mask)]
+            buf[k] = (v << 4) | (v >> 8)
+        self.rd[i] = (s + m * nch) & _MASK
+        return m
+
+    # mean of the new samples for channel i, scaled to u16 like
+    # read_u16(), or -1 if there are none.  One loop, nothing copied
+    def mean(self,i) :
+        total = self.written()
+        nch = self.nch
+        s = self.first(i,total)
+        k = self.count(s,total)
+        raw = self.raw
+        off = self.off
+        mask = self.n - 1
+        sm = 0
+        for j in range(k) :
+            sm += raw[off + ((s + j * nch) & mask)]
+        self.rd[i] = (s + k * nch) & _MASK
+        if k == 0 : return -1
+        return ((sm << 4) + (sm >> 8) + (k >> 1)) // k
+
+# $Log$
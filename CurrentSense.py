@@ -0,0 +1,187 @@
+#
+# IBT-2 current sense.  Overcurrent trip, current limit, peak and RMS.
+#
+# The IBT-2's BTS7960 halves source a current from their IS pins of
+# about 1/8500 of the load current, into 1k on the module.  With R_IS
+# and L_IS tied together (only the side driving reports) to one ADC pin,
+# 3.3V full scale is ~28 A.  maFull sets that scale.
+#
+# update(), from the motor loop, looks at every sample captured since
+# the last call, from an ADCCapture (DMA) shared with the pots, or one
+# read_u16() when there is none.
+#  * trip : tripN samples in a row at or over trip mA.  update() returns
+#    True, and the caller stops the motors.  Raw samples, no filter, so
+#    the trip lands on the first motor loop pass after the sample that
+#    saw the overcurrent.  Raise tripN if PWM noise trips it.
+#    With a capture, a sample is up to 1/rate old when taken, then
+#    waits up to a pass to be read : over one PWM period (1 ms) at
+#    worst.  startTrip() checks samples on a hard Timer instead, as
+#    they arrive.  off(), given, zeroes the PWMs from the IRQ, and the
+#    next update() returns True, for the stop proper.  The IRQ allocates
+#    nothing : sample numbers wrap (ADCCapture.WRAP), so stay small ints.
+#  * limit : the FilteredADC current, filtering the newest sample each
+#    pass (12-bit counts, so its scaling stays in small ints), over
+#    limit mA, scales the motor's
+#    largest duty (MotorDrive.setLimit()) down in proportion.  Under it,
+#    the duty limit recovers 1/64 of full scale per pass.
+#  * peak and RMS, since clearStats().  show() prints them.
+# Integer only, and update() allocates nothing.
+
+from array import array
+from machine import Timer
+from FilteredADC import FilteredADC
+from MotorDrive import MotorDrive
+import time
+
+MAX = MotorDrive.MAX_PWM
+_SQ_SHIFT = 6  # samples squared as 10 bits, so sums stay small ints
+_SQ_N = 256    # samples per RMS window, at least
+
+class CurrentSense() :
+    def __init__(self,motor,pin,capture=None,maFull=28000,
+                 trip=0,limit=0,tripN=1,gain=0.1) :
+        self.motor = motor
+        self.maFull = maFull  # mA at u16 full scale
+        self.capture = capture
+        self.filt = FilteredADC(pin,gain,0,4095,0,65535)  # 12-bit counts
+        if capture is not None :
+            self.capIdx = capture.index(pin)
+            self.batch = array('H',[0] * capture.n)  # made once, reused
+        else :
+            self.batch = array('H',[0])
+        self.tripN = tripN
+        self.tim = None    # trip check Timer, startTrip()
+        self.tripped = False  # by the trip check.  update() reports it
+        self.setTrip(trip)
+        self.setLimit(limit)
+        self.clearStats()
+
+    def raw(self,ma) : # mA to u16 counts
+        return (ma << 16) // self.maFull if ma > 0 else 0
+
+    def mA(self,raw) : # u16 counts to mA
+        return ((raw >> 4) * self.maFull) >> 12
+
+    def setTrip(self,ma) :   # 0 : off
+        self.trip = ma
+        self.tripRaw = self.raw(ma) if ma > 0 else 0x10000
+        self.trip12 = self.tripRaw >> 4  # raw capture samples are 12 bits
+        self.over = 0        # samples in a row over trip
+        self.overIRQ = 0     # same, trip_cb()
+
+    # check the trip on every captured sample, freq times a second from
+    # a hard Timer.  off() : IRQ safe, zeroes the PWMs.  Needs a capture
+    def startTrip(self,off,freq=4000) :
+        self.stopTrip()
+        self.offCB = off
+        cap = self.capture
+        self.rdTrip = cap.skipTo(cap.rd[self.capIdx],cap.captured())
+        self.tripCB = self.trip_cb  # bound once, not in the IRQ
+        self.tim = Timer(mode=Timer.PERIODIC,freq=freq,callback=self.tripCB,hard=True)
+
+    def stopTrip(self) :
+        if self.tim is not None :
+            self.tim.deinit()
+            self.tim = None
+
+    def trip_cb(self,tmr) : # internal, hard IRQ.  allocates nothing
+        cap = self.capture
+        total = cap.captured()
+        nch = cap.nch
+        s = cap.skipTo(self.rdTrip,total - cap.n + nch)  # overrun
+        k = cap.count(s,total)
+        self.rdTrip = cap.skipTo(s,total)
+        raw = cap.raw
+        off = cap.off
+        mask = cap.n - 1
+        trip12 = self.trip12
+        over = self.overIRQ
+        for j in range(k) :
+            if raw[off + (s & mask)] >= trip12 :
+                over += 1
+                if over >= self.tripN :
+                    over = 0
+                    self.offCB()
+                    if not self.tripped :
+                        self.tripped = True
+                        self.trips += 1
+            else :
+                over = 0
+            s += nch
+        self.overIRQ = over
+
+    def setLimit(self,ma) :  # 0 : off
+        self.limit = ma
+        self.limit12 = self.raw(ma) >> 4
+        self.lim = MAX       # duty limit applied to the motor
+        self.motor.setLimit(MAX)
+
+    def clearStats(self) :
+        self.peak = 0   # u16
+        self.trips = 0
+        self.sq = 0     # sum of squares, current window
+        self.nsq = 0
+        self.msq = 0    # mean square, last whole window, 10-bit units
+
+    def update(self) : # True : trip.  stop the motors
+        batch = self.batch
+        if self.capture is None :
+            batch[0] = self.filt.adc.read_u16()
+            n = 1
+        else :
+            n = self.capture.read(self.capIdx,batch)
+        tripped = False
+        tripRaw = self.tripRaw
+        if self.tim is not None :  # trip_cb() checks.  report it
+            tripRaw = 0x10000
+            tripped = self.tripped
+            self.tripped = False
+        if n == 0 : return tripped
+        over = self.over
+        peak = self.peak
+        sq = self.sq
+        for k in range(n) :
+            v = batch[k]
+            if v >= tripRaw :
+                over += 1
+                if over >= self.tripN :
+                    over = 0  # again, if still over once restarted
+                    self.trips += 1
+                    tripped = True
+            else :
+                over = 0
+            if v > peak : peak = v
+            v >>= _SQ_SHIFT
+            sq += v * v
+        self.over = over
+        self.peak = peak
+        self.nsq += n
+        if self.nsq >= _SQ_N :
+            self.msq = sq // self.nsq
+            sq = 0
+            self.nsq = 0
+        self.sq = sq
+        self.filt.step(batch[n - 1])  # newest
+        if self.limit : self.limitDuty()
+        return tripped
+
+    def now(self) : # filtered current, mA
+        return (self.filt.peek() * self.maFull) >> 12
+
+    def limitDuty(self) : # internal.  current limit
+        i = self.filt.peek()
+        lim = self.lim
+        if i > self.limit12 :
+            lim = (lim * self.limit12) // i
+        elif lim < MAX :
+            lim += MAX >> 6
+            if lim > MAX : lim = MAX
+        if lim != self.lim :
+            self.lim = lim
+            self.motor.setLimit(lim)
+
+    def show(self,name) :
+        rms = int((self.msq << (2 * _SQ_SHIFT)) ** 0.5)
+        print(time.ticks_ms(),name,"current mA now",self.now(),
+              "peak",self.mA(self.peak),"rms",self.mA(rms),
+              "\ttrips",self.trips,"duty limit",self.lim)
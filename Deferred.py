@@ -0,0 +1,49 @@
+#
+# Deferred work for IRQ handlers.
+#
+# A hard IRQ handler, and on some ports a Timer callback, runs with the
+# heap locked : it must not allocate, so no print(), no tuples or
+# floats, no new Timers, no sleeping.  emergencyStop() and setSpeed()
+# do all of those.  So a handler does only its urgent, allocation-free
+# part there, e.g. PWMs to 0, then calls fire(), which passes fn() to
+# micropython.schedule(), to run soon, between bytecodes of the main
+# program, where it may do anything.
+#
+# fire() allocates nothing : the bound method it schedules is made once,
+# here.  A fire() while a call is already pending is folded into it.
+# If the scheduler queue is full, the call is left pending, and poll(),
+# from a regular tick, runs it instead.  A Deferred's fire can be given
+# straight to Timer.init() or Pin.irq() as the callback.
+#
+# Importing this also sets aside a buffer for exceptions raised in IRQ
+# handlers, so they are still reported, with a traceback.
+
+import micropython
+
+micropython.alloc_emergency_exception_buf(100)
+
+class Deferred() :
+    def __init__(self,fn) : # fn() : the rest of the work, no arguments
+        self.fn = fn
+        self.pending = False  # fired, fn() not run yet
+        self.fired = 0        # fire() calls
+        self.full = 0         # scheduler queue full.  left for poll()
+        self.runCB = self.run # bound once, so fire() allocates nothing
+        self.fireCB = self.fire
+
+    def fire(self,arg=None) : # from an IRQ.  Pin and Timer pass themselves
+        self.fired += 1
+        if self.pending : return
+        self.pending = True
+        try :
+            micropython.schedule(self.runCB,0)
+        except Exception :  # RuntimeError, queue full
+            self.full += 1
+
+    def run(self,arg) : # internal.  scheduled by fire()
+        if not self.pending : return  # poll() ran it already
+        self.pending = False
+        self.fn()
+
+    def poll(self) : # from a regular tick.  runs fn() if it is still pending
+        if self.pending : self.run(0)
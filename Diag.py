@@ -0,0 +1,96 @@
+#
+# Diagnostics for code that runs inside control loop callbacks.
+#
+# Messages : a Diag prints at most n more messages, at or below its level.
+# Check on() at the call site, BEFORE building any arguments, so that a
+# quiet Diag costs one method call and allocates nothing :
+#
+#    if _DIAG and self.dbg.on(INFO) : self.dbg.msg("setSpeed",cmd)
+#
+# msg() takes up to four items, and only formats them once it is going
+# to print.  Each module using this declares its own
+#
+#    _DIAG = const(1)
+#
+# Set it to const(0) for production builds, and the compiler drops every
+# "if _DIAG and ..." statement from the bytecode.
+#
+# Trace : a fixed-size ring of binary records (ticks_us, code, a, b)
+# kept regardless of message counts, for a post-mortem dump() after
+# something has gone wrong.  log() does not allocate.
+
+import time
+from array import array
+
+# message levels
+ERR   = 0
+INFO  = 1
+DEBUG = 2
+
+class Diag() :
+    def __init__(self,id,n=11,level=INFO) :
+        self.id = id      # printed with each message
+        self.n = n        # print this many more messages, then go quiet
+        self.level = level
+
+    def on(self,level=INFO) : # True if a message at level would print
+        return (self.n > 0) and (level <= self.level)
+
+    def msg(self,a,b=None,c=None,d=None) : # print.  check on() first
+        self.n -= 1
+        if   b is None : print(time.ticks_ms(),self.id,a)
+        elif c is None : print(time.ticks_ms(),self.id,a,b,sep='\t')
+        elif d is None : print(time.ticks_ms(),self.id,a,b,c,sep='\t')
+        else           : print(time.ticks_ms(),self.id,a,b,c,d,sep='\t')
+
+# trace record codes
+TR_CMD     = 1  # a=command char, b=value
+TR_FRAME   = 2  # a=L, b=R from binary frame
+TR_SPEED   = 3  # a=motor, b=speed command
+TR_REVERSE = 4  # a=motor, b=ms until restart
+TR_RESTART = 5  # a=motor, b=speed
+TR_ESTOP   = 6  # a=motor
+TR_DEADMAN = 7  # a=ms since last command
+TR_BADCMD  = 8  # a=command char
+TR_SLOW    = 9  # a=tick, b=us.  over its watchdog budget
+TR_WDT     = 10 # a=watchdog resets so far.  at boot
+TR_NAMES = ("?","CMD","FRAME","SPEED","REVERSE","RESTART","ESTOP",
+            "DEADMAN","BADCMD","SLOW","WDT")
+
+class Trace() :
+    def __init__(self,n=64) :
+        self.n = n
+        self.rec = array('i',[0] * (4 * n))
+        self.clear()
+
+    def clear(self) :
+        self.k = 0      # next record to write
+        self.count = 0  # records ever written
+
+    def log(self,code,a=0,b=0) :
+        k = self.k
+        rec = self.rec
+        j = k * 4
+        rec[j]   = time.ticks_us()
+        rec[j+1] = code
+        rec[j+2] = a
+        rec[j+3] = b
+        k += 1
+        if k >= self.n : k = 0
+        self.k = k
+        self.count += 1
+
+    def dump(self) : # print records, oldest first
+        n = self.count
+        if n > self.n : n = self.n
+        k = self.k - n
+        if k < 0 : k += self.n
+        print("trace",self.count,"records, last",n)
+        rec = self.rec
+        for i in range(n) :
+            j = 4 * ((k + i) % self.n)
+            code = rec[j+1]
+            if code >= len(TR_NAMES) : code = 0
+            print(rec[j],TR_NAMES[code],rec[j+2],rec[j+3],sep='\t')
+
+trace = Trace()
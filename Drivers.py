@@ -0,0 +1,71 @@
+#
+# Motor driver registry, and the board's pin map.
+#
+# Drivers are found by name, and their modules imported only when a
+# pin map asks for them, so a build using one kind of bridge never
+# loads the other.
+#
+#    boim   MotorDriveBoim   pins EN(PWM),IN1,IN2
+#    ibt2   MotorDriveIBT2   pins RPWM,LPWM.  enable : R_EN,L_EN
+#    sim    MotorDriveSim    no pins.  see MotorDriveSim.py
+#
+# register() adds another, from its module and class names.
+#
+# The pin map is PINS, with any top-level entry replaced by the same
+# key in pins.json, read once at boot.  e.g. the original BOIM on the
+# right :
+#
+#    {"R" : {"driver" : "boim", "pins" : [10,11,12]}}
+#
+# A motor entry may also carry "enable", pins set high once its driver
+# has its PWMs at 0, and "params", keyword arguments to the driver over
+# Settings.drvL / drvR, e.g. {"freq" : 20000}.  Motor pins here must
+# match what SafeBoot.py drives low at boot : it reads "L" and "R" from
+# pins.json too.
+
+import json
+from SafeBoot import PIN_MAP,SAFE_L,SAFE_R
+
+# name : module, class
+DRIVERS = {'boim' : ('MotorDriveBoim','MotorDriveBoim'),
+           'ibt2' : ('MotorDriveIBT2','MotorDriveIBT2'),
+           'sim'  : ('MotorDriveSim','MotorDriveSim')}
+
+PINS = {'L'        : {'driver' : 'boim','pins' : SAFE_L},
+        'R'        : {'driver' : 'ibt2','pins' : SAFE_R[:2],'enable' : SAFE_R[2:]},
+        'uart'     : (1,115200),   # id, baud.  commands and telemetry
+        'led'      : 25,           # on-board LED
+        'led2'     : 9,            # extra diagnostic LED
+        'encL'     : (2,3,0),      # A, B, PIO state machine
+        'encR'     : (14,15,1),
+        'pots'     : (26,27),      # analog override, L and R
+        'current'  : 28,           # IBT-2 R_IS and L_IS, tied together
+        'override' : 16,           # analog override switch, active low
+        'deadman'  : 17}           # deadman switch, active low
+
+def register(name,module,cls) :
+    DRIVERS[name] = (module,cls)
+
+def driverClass(name) : # imports its module, the first time
+    if name not in DRIVERS :
+        raise ValueError("no motor driver " + str(name))
+    module,cls = DRIVERS[name]
+    return getattr(__import__(module),cls)
+
+def loadPinMap(fnam=PIN_MAP) : # PINS, with pins.json over it
+    pins = dict(PINS)
+    try :
+        with open(fnam) as f :
+            pins.update(json.load(f))
+    except OSError :
+        pass  # no file.  built-in map
+    except ValueError as e :
+        print(fnam,"not valid JSON, built-in pin map used :",e)
+    return pins
+
+# driver for motor entry spec.  tune : freq,switch_us,coast,maxPWM
+def makeMotor(spec,id,tune) :
+    kw = {'freq' : tune[0],'switch_us' : tune[1],'coast' : tune[2],'maxPWM' : tune[3]}
+    if 'params' in spec : kw.update(spec['params'])
+    pins = tuple(spec.get('pins',()))
+    return driverClass(spec['driver'])(*(pins + (id,)),**kw)
@@ -0,0 +1,92 @@
+#
+# Quadrature wheel encoder counter.
+#
+# On the RP2040 a PIO state machine counts, so edges cost the CPU
+# nothing.  On each edge of A it counts forward or reverse, by the level
+# of B (2x decoding) : X down once per forward edge, Y down once per
+# reverse edge.  Each is one jmp(x_dec) or jmp(y_dec), so a count is
+# never half done.  count() runs instructions between the state
+# machine's own, and could land anywhere in its program.  It has the
+# state machine push the low 16 bits of X, then of Y, and takes Y - X,
+# forward less reverse.  Each push is under 2**16, so reading allocates
+# nothing.  Read at least once per 32k edges.
+#
+# Without rp2 (older firmware, the host simulator) the same interface
+# counts from a hard IRQ on A.
+#
+#   enc = QuadEncoder(2,3,sm=0)  # GP2 = A, GP3 = B
+#   n = enc.count()  # counts, + when A leads B
+
+from machine import Pin
+
+try :
+    import rp2
+    PIO_OK = True
+except ImportError :
+    PIO_OK = False
+
+if PIO_OK :
+    @rp2.asm_pio()
+    def _quadPIO() :
+        wrap_target()
+        label("top")
+        wait(1,pin,0)           # A rises
+        jmp(pin,"rrev")         # B high : reverse
+        jmp(x_dec,"fall")       # forward
+        jmp("fall")             # x was 0, and fell through
+        label("rrev")
+        jmp(y_dec,"fall")       # reverse
+        label("fall")
+        wait(0,pin,0)           # A falls
+        jmp(pin,"ffwd")         # B high : forward
+        jmp(y_dec,"top")        # reverse
+        jmp("top")
+        label("ffwd")
+        jmp(x_dec,"top")        # forward.  falls through to wrap
+        wrap()
+
+    # run from count(), between the state machine's own instructions
+    _IN_X16 = rp2.asm_pio_encode("in_(x,16)",0)
+    _IN_Y16 = rp2.asm_pio_encode("in_(y,16)",0)
+    _PUSH   = rp2.asm_pio_encode("push(noblock)",0)
+    _CLR_X  = rp2.asm_pio_encode("set(x,0)",0)
+    _CLR_Y  = rp2.asm_pio_encode("set(y,0)",0)
+
+class QuadEncoder() :
+    def __init__(self,pinA,pinB,sm=0,usePIO=PIO_OK) :
+        self.a = Pin(pinA,Pin.IN,Pin.PULL_UP)
+        self.b = Pin(pinB,Pin.IN,Pin.PULL_UP)
+        self.usePIO = usePIO
+        self.n = 0      # count
+        self.last = 0   # low 16 bits of PIO count, Y - X, at last read
+        if usePIO :
+            self.sm = rp2.StateMachine(sm,_quadPIO,freq=10000000,
+                                       in_base=self.a,jmp_pin=self.b)
+            self.sm.exec(_CLR_X)
+            self.sm.exec(_CLR_Y)
+            self.sm.active(1)
+        else :
+            self.a.irq(self.edge,Pin.IRQ_RISING | Pin.IRQ_FALLING,hard=True)
+
+    def edge(self,pin) : # IRQ, no PIO.  A changed
+        if self.a.value() != self.b.value() : self.n += 1
+        else                                : self.n -= 1
+
+    def count(self) :
+        if self.usePIO :
+            sm = self.sm
+            sm.exec(_IN_X16)
+            sm.exec(_PUSH)
+            sm.exec(_IN_Y16)
+            sm.exec(_PUSH)
+            x = sm.get()
+            v = (sm.get() - x) & 0xFFFF
+            d = (v - self.last) & 0xFFFF
+            if d & 0x8000 : d -= 0x10000
+            self.last = v
+            self.n += d
+        return self.n
+
+    def clear(self) :
+        self.count()
+        self.n = 0
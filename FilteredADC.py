@@ -4,37 +4,88 @@
 
 # Pi Pico ADC on GP26, GP27, GP28, board pin 31,32,34, == ADC0,ADC1,ADC2
 
+# Integer only.  The RP2040 has no FPU, and every float is a heap object
+# in MicroPython, so gain is kept as Q15 and the output scaling as an
+# integer ratio.  dv * gain is only formed for steps under largeStep,
+# at most a fifth of the u16 range, so under 2**14 * 2**15 = 2**29, a
+# small int.  Larger steps are outliers, or reset the filter, with no
+# product at all.  peek() is at most 2**16 * 2 * (out1-out0), inside
+# small-int range for outputs spanning up to 8191.
+
+# Optional oversampling averages 2**k read_u16() samples per update.
+# The Pico ADC is 12 bits scaled up to u16, so this buys back some of
+# the noise without changing the scale.
+
+# Given an ADCCapture, update() instead filters the mean of the samples
+# captured since the last update : a box average over the whole period,
+# in one loop, then one step(), so gain and the outlier window stay per
+# update, as polled.  Oversampling is not used then.
+
 from machine import ADC
 
+Q = 15        # gain fraction bits
+ONE = 1 << Q
+
 class FilteredADC() :
-    def setGain(self,gain) :
-        self.gain = gain
-        self.gain1 = 1.0 - gain
+    def setGain(self,gain) :  # 0 < gain <= 1.  float OK, only used here
+        g = int(gain * ONE + 0.5)
+        if g < 1   : g = 1
+        if g > ONE : g = ONE
+        self.gain = g  # Q15
+
     def setRange(self,in0,in1,out0,out1) :  # scale input counts in0..in1 to out0..out1
         self.in0 = in0
         self.out0 = out0
         self.out1 = out1
-        self.scale = float(out1 - out0) / float(in1 - in0)
-        
+        self.num = out1 - out0  # scale is num/den
+        self.den = in1 - in0
+
         # let a "large step" be this fraction of whole scale
-        self.largeStep = round(0.2 * float(in1 - in0))
-  
-    def __init__(self,pinID,gain=0.5,out0=-255,out1=255,in0=500,in1=65000) :
+        self.largeStep = (in1 - in0) // 5
+
+    def setOversample(self,n) : # average n samples per update.  power of 2
+        k = 0
+        while (1 << (k+1)) <= n :
+            k += 1
+        self.osShift = k
+        self.osN = 1 << k
+
+    def __init__(self,pinID,gain=0.5,out0=-255,out1=255,in0=500,in1=65000,
+                 oversample=1,capture=None) :
         # default, some "flat zone" at extreme ends of the adc [tLo > 0, tHi < 65335]
         self.adc = ADC(pinID)
         self.v = 32767  # filtered ADC output
         self.outlierCount = 0
         self.setGain(gain)
         self.setRange(in0,in1,out0,out1)
-        
+        self.setOversample(oversample)
+        self.capture = capture
+        if capture is not None :
+            self.capIdx = capture.index(pinID)
+
+    def sample(self) : # raw reading, averaged if oversampling
+        if self.osN == 1 :
+            return self.adc.read_u16()
+        adc = self.adc
+        s = 0
+        for k in range(self.osN) :
+            s += adc.read_u16()
+        return (s + (self.osN >> 1)) >> self.osShift
+
     def update(self) : # Pi Pico is actually 12-bit ADC, but scaled to u16 in uPy
-        val = self.adc.read_u16()
+        if self.capture is None :
+            self.step(self.sample())
+            return
+        m = self.capture.mean(self.capIdx)
+        if m >= 0 : self.step(m)
+
+    def step(self,val) : # filter one u16 reading
         if val == self.v : return  # no change
-        dv = float(val - self.v)
-        v = round(float(self.v) * self.gain1 + dv * self.gain)
-        
-        if dv < self.largeStep :
-            # typical case, small reading change
+        dv = val - self.v
+        if abs(dv) < self.largeStep :
+            # typical case, small reading change.
+            # move gain of the way to val, rounded
+            v = self.v + ((dv * self.gain + (ONE >> 1)) >> Q)
             self.outlierCount = 0
             if self.v == v :
                 # move by 1 count if readings not the same.
@@ -50,10 +101,11 @@ class FilteredADC() :
                 # not outlier.  step.  reset filter
                 self.v = val
                 self.outlierCount = 0
-                
+
     def peek(self) : # convert current filtered input to output
-        # scale input reading to output scale
-        y = round(self.out0 + self.scale * float(self.v - self.in0))
+        # scale input reading to output scale, rounded
+        d = self.den
+        y = self.out0 + ((self.v - self.in0) * self.num * 2 + d) // (2 * d)
         # when v is outside of in0..in1 range, y is out of range
         if y < self.out0 : return self.out0
         if y > self.out1 : return self.out1
@@ -0,0 +1,114 @@
+#
+# Lock-free hand-off of motor targets from the command core to the
+# motor loop.  One writer (post), one reader (take), no lock, so neither
+# side can ever block the other.
+#
+# The slot holds only the newest targets, not a queue : the motor loop
+# wants where to go now, not every step on the way.  Stops are never
+# lost, though.  Each post stamps what it changed with its sequence
+# number, so the reader sees any stop posted since its last take(), and
+# applies a speed only if it was posted after the last stop.
+#
+# seq wraps at 2**30, so it stays a small int and post() never
+# allocates.  take() finds what changed by comparing each stamp with the
+# one it saw last, not by ordering them, so a stamp left alone for any
+# number of posts is never mistaken for a new one.  Only stamps changed
+# since the last take() are ordered, and those are a few posts apart.
+#
+# Consistency is a sequence lock.  post() makes seq odd while it writes,
+# even when done.  take() copies the slot, then checks seq did not move
+# meanwhile, else tries again.  Single 32-bit array stores are atomic on
+# the RP2040, and its cores do not reorder memory accesses.
+
+from array import array
+
+# post() op bits, and take() result bits
+SET_L = 1
+SET_R = 2
+STOP  = 4   # stop both motors
+ESTOP = 8   # emergencyStop() both motors
+KEEP  = 16  # take() only : something was posted.  e.g. keep-alive
+
+# slot words
+_SEQ   = 0
+_STOP  = 1  # seq of last STOP
+_ESTOP = 2
+_L     = 3  # seq of last SET_L
+_R     = 4
+_VL    = 5
+_VR    = 6
+_N     = 7
+
+_MASK = 0x3FFFFFFF  # seq wraps here.  Even, so odd still means writing
+_HALF = 0x20000000
+
+def _after(a,b) : # seq a posted after seq b, both recent
+    return ((a - b) & _MASK) < _HALF
+
+class TargetSlot() :
+    def __init__(self) :
+        self.w = array('i',[0] * _N)  # written by post()
+        self.r = array('i',[0] * _N)  # reader's copy
+        self.seen = array('i',[0] * _N)  # stamps at last take()
+        self.last = 0  # seq at last take()
+        self.vL = 0    # targets from last take()
+        self.vR = 0
+        self.collisions = 0  # take() found a post() in progress
+
+    # writer side.  op 0 just marks that a command arrived
+    def post(self,op,vL=0,vR=0) :
+        w = self.w
+        s = (w[_SEQ] + 1) & _MASK
+        w[_SEQ] = s  # odd : writing
+        if op & STOP  : w[_STOP] = s
+        if op & ESTOP : w[_ESTOP] = s
+        if op & SET_L :
+            w[_VL] = vL
+            w[_L] = s
+        if op & SET_R :
+            w[_VR] = vR
+            w[_R] = s
+        w[_SEQ] = (s + 1) & _MASK
+
+    # reader side.  Returns op bits for what changed since last take(),
+    # 0 if nothing, and sets vL,vR
+    def take(self) :
+        w = self.w
+        r = self.r
+        for i in range(3) :
+            s = w[_SEQ]
+            if s == self.last : return 0
+            if s & 1 :
+                self.collisions += 1
+                continue
+            for k in range(1,_N) : r[k] = w[k]
+            if w[_SEQ] == s : break
+            self.collisions += 1
+        else :
+            return 0  # writer busy.  next time
+        self.last = s
+        seen = self.seen
+        op = KEEP
+        if r[_STOP] != seen[_STOP] :
+            op |= STOP
+            seen[_STOP] = r[_STOP]
+        if r[_ESTOP] != seen[_ESTOP] :
+            op |= ESTOP
+            seen[_ESTOP] = r[_ESTOP]
+        if r[_L] != seen[_L] :
+            seen[_L] = r[_L]
+            if self.afterStops(op,r[_L]) :
+                op |= SET_L
+                self.vL = r[_VL]
+        if r[_R] != seen[_R] :
+            seen[_R] = r[_R]
+            if self.afterStops(op,r[_R]) :
+                op |= SET_R
+                self.vR = r[_VR]
+        return op
+
+    def afterStops(self,op,t) : # internal.  seq t after any stop in op
+        r = self.r
+        if op & STOP  and not _after(t,r[_STOP])  : return False
+        if op & ESTOP and not _after(t,r[_ESTOP]) : return False
+        return True
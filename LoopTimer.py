@@ -0,0 +1,73 @@
+#
+# Timers run by a fixed-rate loop, rather than by the Timer IRQ.
+#
+# machine.Timer callbacks always run on core 0.  A motor loop running on
+# core 1 gives its drivers LoopTimers instead, so restart and dead-time
+# callbacks run on the core that owns the motors, from runDue(), at the
+# loop's resolution.  Same init()/deinit() as machine.Timer.
+#
+# Timers register once, when made, and runDue() walks that fixed list,
+# so running them allocates nothing.
+
+from machine import Timer
+import time
+
+_timers = []
+
+class LoopTimer() :
+    ONE_SHOT = Timer.ONE_SHOT
+    PERIODIC = Timer.PERIODIC
+
+    def __init__(self) :
+        self.armed = False
+        self.due = 0      # ticks_us
+        self.period = 0   # us
+        self.mode = LoopTimer.ONE_SHOT
+        self.callback = None
+        _timers.append(self)
+
+    def init(self,mode=Timer.PERIODIC,period=-1,freq=-1,callback=None,tick_hz=1000) :
+        if   freq > 0           : us = 1000000 // freq
+        elif tick_hz == 1000    : us = period * 1000
+        elif tick_hz == 1000000 : us = period
+        else                    : us = period * (1000000 // tick_hz)
+        if us < 1 : us = 1
+        self.period = us
+        self.mode = mode
+        self.callback = callback
+        self.due = time.ticks_add(time.ticks_us(),us)
+        self.armed = True
+
+    def deinit(self) :
+        self.armed = False
+
+def runDue(t) : # run callbacks due at ticks_us t
+    for tm in _timers :
+        if tm.armed and time.ticks_diff(t,tm.due) >= 0 :
+            if tm.mode == Timer.PERIODIC :
+                tm.due = time.ticks_add(tm.due,tm.period)
+            else :
+                tm.armed = False  # callback may init() it again
+            if tm.callback is not None : tm.callback(tm)
+
+# how late a fixed-rate loop starts each pass
+class LoopStats() :
+    def __init__(self) :
+        self.clear()
+
+    def clear(self) :
+        self.n = 0        # passes
+        self.sum = 0      # us late, total
+        self.max = 0      # us late, worst
+        self.overruns = 0 # passes starting a whole period late
+
+    def add(self,late,period) :
+        self.n += 1
+        self.sum += late
+        if late > self.max : self.max = late
+        if late >= period : self.overruns += 1
+
+    def show(self,name) :
+        n = self.n if self.n else 1
+        print(name,"passes",self.n,"\tlate us mean",self.sum // n,
+              "max",self.max,"\toverruns",self.overruns)
@@ -6,7 +6,11 @@
 
 
 from machine import Timer
-import time
+from micropython import const
+from array import array
+from Diag import Diag,trace,ERR,INFO,DEBUG,TR_ESTOP,TR_REVERSE
+
+_DIAG = const(1)  # 0 strips diagnostic messages from the build
 
 class MotorDrive() :
 
@@ -30,7 +34,10 @@ class MotorDrive() :
 
         self.coast = coast # below this PWM command level, just coast
         self.speed = 0         # current PWM command
-        self.msgCount = 11 # issue this many diagnostic messages before going quiet
+        self.req = 0           # speed asked for, before clipPWM()
+        self.limit = maxPWM    # largest duty for now.  see setLimit()
+        self.dbg = Diag(id,11) # issue this many diagnostic messages before going quiet
+        self.tid = ord(str(id)[0]) # ID in trace records
         self.mode = MotorDrive.MODE_STOP
 
         
@@ -40,40 +47,193 @@ class MotorDrive() :
         if self.fullPWM > self.maxPWM :
             self.fullPWM = self.maxPWM  # limit if full-power disabled
 
+        # one restart timer per motor, made once.  A direction change
+        # re-inits it, so restarts never stack up, and nothing is
+        # allocated per reversal.  Bound callback cached for the same reason.
+        self.restartTimer = Timer()
+        self.restartCB = self.restart_cb
+
+        self.prof = False # motion profile off.  see setProfile()
+        self.target = 0   # profile target speed
+        self.pv = 0       # profile output speed
+        self.pa = 0       # profile accel level, signed, index into tables
+
+        self.group = None # PWMGroup, see syncPWM()
+        self.rsHold = False # group held until the pending restart
+
     # enforce "coast" zone near zero, and saturation zone near max
     def clipPWM(self,pwm) :
         if pwm > 0 :
-            if pwm >  self.fullPWM : return  self.maxPWM
-            if pwm <  self.coast   : return   0
+            if   pwm >  self.fullPWM : pwm =  self.maxPWM
+            elif pwm <  self.coast   : return 0
+            if pwm >  self.limit : return  self.limit
         else :
-            if pwm < -self.fullPWM : return -self.maxPWM
-            if pwm > -self.coast   : return   0
+            if   pwm < -self.fullPWM : pwm = -self.maxPWM
+            elif pwm > -self.coast   : return 0
+            if pwm < -self.limit : return -self.limit
         return pwm
 
-    def diag(self,items) : # print diagnostic message from string or tupple
-        if self.msgCount <= 0 :
-            return
-        self.msgCount -= 1
-        if isinstance(items, tuple) :
-            print(time.ticks_ms(),self.ID,"\t".join([str(a) for a in items]))
-            return
-        print(time.ticks_ms(),self.ID,items)
-        
+    # cap duty, e.g. to limit current.  A running motor is re-set to the
+    # speed last asked for, within the new limit
+    def setLimit(self,lim) :
+        if lim > self.maxPWM : lim = self.maxPWM
+        self.limit = lim
+        if (self.mode == MotorDrive.MODE_RUNNING) and (self.clipPWM(self.req) != self.speed) :
+            self.setSpeed(self.req)
+
     def showState(self) :
         print("Child of MotorDrive needs to override showState() method")
 
     def show(self, n) :
-        self.msgCount = n+1
-        self.diag(("Show next",n,"messages"))
+        self.dbg.n = n+1
+        if _DIAG : self.dbg.msg("Show next",n,"messages")
         self.showState()
 
+    # restart_cb() after sd ms.  Replaces any restart already pending.
+    # Holds the PWM group meanwhile, so the other motor's duty is
+    # committed when this one restarts, not before.  restart_cb() ends
+    # with restarted()
+    def scheduleRestart(self,sd) :
+        if (self.group is not None) and not self.rsHold :
+            self.group.hold()
+            self.rsHold = True
+        self.restartTimer.init(period=sd, mode=Timer.ONE_SHOT,
+                               callback=self.restartCB)
+
+    def cancelRestart(self) :
+        self.restartTimer.deinit()
+        held = self.rsHold
+        self.rsHold = False
+        self.restarted(held)
+
+    # internal.  restart_cb() first takes held = self.rsHold and clears
+    # it, as what it runs may schedule another restart.  Then, once its
+    # duty is written, or another sequence started, it calls this
+    def restarted(self,held) :
+        if held : self.group.commit()
+
+    # run timed steps from cls() timers instead of machine.Timer, e.g.
+    # LoopTimer when the motor loop owns this motor.  Call while stopped
+    def useTimer(self,cls) :
+        self.cancelRestart()
+        self.restartTimer = cls()
+
+    # write duty through group (SyncPWM.PWMGroup), so it can commit this
+    # motor's PWM together with the other's.  Drivers wrap their PWMs,
+    # then call this
+    def syncPWM(self,group) :
+        self.group = group
+
+    # bridge outputs off now, from an IRQ handler, allocating nothing :
+    # PWM duty 0, any pending restart cancelled, and MODE_STOP, so no
+    # timed step drives the bridge again.  Follow it with emergencyStop(),
+    # outside the IRQ, for the brake, whose stop() releases any group hold
+    # the restart had.  Polymorph zeroes its PWMs, cancels its own timed
+    # steps, then calls this
+    def off(self) :
+        self.restartTimer.deinit()
+        self.speed = 0
+        self.mode = MotorDrive.MODE_STOP
+
     def stop(self) :    # polymorph needs to do actual stopping, then call this
+        self.cancelRestart()
+        self.profileStop()
         self.speed = 0
-        self.mode = MODE_STOP
+        self.mode = MotorDrive.MODE_STOP
+
+    # Motion profile.  setProfile() builds integer step tables, once.
+    # Then setTarget() only records the speed to go to, and tick(), from
+    # a fixed-rate loop, moves toward it one table step at a time, through
+    # setSpeed().  Times are ms, full scale.  tJerk > 0 ramps the
+    # acceleration itself over that time (S-curve).  Reversals pass
+    # through zero, so never wait on the brake and restart timer.
+    # Stops are not profiled.
+    def setProfile(self,tTick,tAccel,tDecel=0,tJerk=0) : # tAccel 0 : off
+        if tAccel <= 0 :
+            self.prof = False
+            return
+        if tDecel <= 0 : tDecel = tAccel
+        nj = tJerk // tTick  # ticks to reach full acceleration
+        if nj < 1 : nj = 1
+        self.nj = nj
+        self.accTab = self.stepTable(tTick,tAccel,nj)
+        self.decTab = self.stepTable(tTick,tDecel,nj)
+        self.accBrk = self.brakeTable(self.accTab)
+        self.decBrk = self.brakeTable(self.decTab)
+        self.profileStop()
+        self.prof = True
+
+    @staticmethod
+    def stepTable(tTick,tFull,nj) : # speed step per tick, per accel level
+        top = (MotorDrive.MAX_PWM * tTick + tFull - 1) // tFull
+        if top < 1 : top = 1
+        return array('i',[(top * i + nj - 1) // nj for i in range(nj + 1)])
+
+    @staticmethod
+    def brakeTable(tab) : # speed change while easing accel level i to 0
+        brk = array('i',[0] * len(tab))
+        for i in range(1,len(tab)) :
+            brk[i] = brk[i-1] + tab[i-1]
+        return brk
+
+    def profileStop(self) :
+        self.target = 0
+        self.pv = 0
+        self.pa = 0
+
+    def setTarget(self,v) : # setSpeed(), through the profile when set
+        if not self.prof :
+            self.setSpeed(v)
+            return
+        if v >  MotorDrive.MAX_PWM : v =  MotorDrive.MAX_PWM
+        if v < -MotorDrive.MAX_PWM : v = -MotorDrive.MAX_PWM
+        self.target = v
+
+    def tick(self) : # advance profile one step.  no allocation
+        if not self.prof : return
+        v = self.pv
+        err = self.target - v
+        a = self.pa
+        if (err == 0) and (a == 0) : return
+        if err < 0 :
+            s = -1
+            e = -err
+        else :
+            s = 1
+            e = err
+        # slowing down when stepping toward zero
+        if v * s < 0 :
+            tab = self.decTab
+            brk = self.decBrk
+        else :
+            tab = self.accTab
+            brk = self.accBrk
+        l = a * s  # accel level, + toward target
+        if l < 0 :
+            l += 1  # still accelerating away.  ease off first
+        elif (l > 0) and (brk[l] >= e) :
+            l -= 1  # close.  ease off so as to land on target
+        elif l < self.nj :
+            l += 1
+        if l < 0 :
+            step = -tab[-l]
+        else :
+            step = tab[l]
+            if step >= e :
+                step = e  # arrive
+                l = 0
+        nv = v + s * step
+        if nv * v < 0 :
+            nv = 0  # reversing.  land on zero for a tick
+        self.pa = l * s
+        self.pv = nv
+        if self.clipPWM(nv) != self.clipPWM(v) :
+            self.setSpeed(nv)
         
     def emergencyStop(self) :
         self.stop()
-        self.diag("Emergency stop")
+        trace.log(TR_ESTOP,self.tid)
+        if _DIAG and self.dbg.on(ERR) : self.dbg.msg("Emergency stop")
         self.show(11)
 
     # most drivers set up in __init__, but provide this to override just in case
@@ -83,25 +243,28 @@ class MotorDrive() :
     # sets speed COMMAND, actual speed change happens only in update()
     def setSpeed(self, spdReq) :
         cmd = self.clipPWM(spdReq)  # check if spdReq is supported
-        self.diag((MotorDrive.mode2str(self.mode),"setSpeed",cmd))
+        self.req = spdReq
+        if _DIAG and self.dbg.on(INFO) :
+            self.dbg.msg(MotorDrive.mode2str(self.mode),"setSpeed",cmd)
         prevSpeed = self.speed
         self.speed = cmd  # remember current command, in case delay
                 
-        if self.mode == MODE_STOPPING :
-            self.diag("delayed.  stopping...")
+        if self.mode == MotorDrive.MODE_STOPPING :
+            if _DIAG and self.dbg.on(DEBUG) : self.dbg.msg("delayed.  stopping...")
             return
 
-        if cmd * float(spd) < 0 :
+        if cmd * prevSpeed < 0 :
             # direction change
 
             sd = self.stopDelay()  # estimated ms to stop from current speed
             self.stop()
             self.speed = cmd # save command for re-start, other direction
-            self.mode = MODE_STOPPING
+            self.mode = MotorDrive.MODE_STOPPING
             # set timer to go off when stop should be complete
-            Timer(period=sd, mode=Timer.ONE_SHOT,
-                  callback=self.restart_cb)
-            self.diag(("waiting",sd,"ms before direction change."))                    
+            self.scheduleRestart(sd)
+            trace.log(TR_REVERSE,self.tid,sd)
+            if _DIAG and self.dbg.on(INFO) :
+                self.dbg.msg("waiting",sd,"ms before direction change.")
 
     def coast(self) : self.setSpeed(0)  # same as speed 0 most controllers
 
@@ -19,10 +19,31 @@
 
 # port to micropython 220518
 
+# Changing the direction pins while the PWM (EN) pin is on risks
+# shoot-through, so every change of Fwd/Rev goes through a dead-time
+# sequence :
+#      PWM 0 (coast) -- switchTime --> set Fwd,Rev -- switchTime --> PWM on
+# The waits are one-shot Timer steps, not sleeps, so setSpeed() and stop()
+# return at once and never stall the control loop.  Speed commands that
+# arrive mid-sequence are remembered, and applied when it completes.
+
 from machine import PWM,Pin,Timer
 import time
 #import _thread
 from MotorDrive import MotorDrive
+from micropython import const
+from Diag import trace,INFO,DEBUG,TR_SPEED,TR_REVERSE,TR_RESTART
+
+_DIAG = const(1)  # 0 strips diagnostic messages from the build
+
+# dead-time sequence states
+SW_IDLE   = 0  # not switching.  PWM may be on
+SW_COAST  = 1  # PWM off, waiting for MOSFETs to turn off
+SW_SETTLE = 2  # direction pins set, waiting for them to settle
+
+# what to do with PWM once direction pins have settled
+END_BRAKE = 0  # full on, with Fwd=Rev=0, hard brake
+END_RUN   = 1  # resume commanded speed
 
 class MotorDriveBoim(MotorDrive) :
     def __init__(self,
@@ -49,6 +70,16 @@ class MotorDriveBoim(MotorDrive) :
         
         self.switchTime = switch_us  # wait this long for MOSFETs to switch
         self.speed = 0         # current PWM command
+
+        # dead-time sequencer.  Timer and bound callback made once, here,
+        # so switching does not allocate
+        self.swState = SW_IDLE
+        self.swFwd = 0  # direction pin values to set
+        self.swRev = 0
+        self.swEnd = END_BRAKE
+        self.deadTimer = Timer()
+        self.deadCB = self.dead_cb
+        self.swHold = False  # holding group until the sequence resumes
         
 #    def grab(self) :
 #        print(time.ticks_ms(),self.ID,"locking")
@@ -79,15 +110,76 @@ class MotorDriveBoim(MotorDrive) :
               self.switchTime,"us\tEn,Fwd,Rev:",
               self.iPWM,self.iFwd,self.iRev)
 
-    def setEbrake(self) :  # internal.  set in e-braking state
-        self.PWM.duty_u16(0)  # coast 
-        time.sleep_us(self.switchTime) # wait until we know low MOSFETs are disabled
-        self.Fwd.value(0)
-        self.Rev.value(0)
-        time.sleep_us(self.switchTime)
+    def syncPWM(self,group) :
+        self.PWM = group.add(self.PWM,self.iPWM)
+        MotorDrive.syncPWM(self,group)
+
+    # A sequence ending in END_RUN holds the PWM group, so the other
+    # motor's duty is committed when this one resumes, not before
+    def releaseGroup(self) : # internal
+        if self.swHold :
+            self.swHold = False
+            self.group.commit()
+
+    # start dead-time sequence to set direction pins (internal).
+    # Always restarts from coast, so it is safe to call mid-sequence.
+    def switchTo(self,fwd,rev,end) :
+        self.PWM.duty_u16(0)  # coast
+        self.releaseGroup()
+        if (end == END_RUN) and (self.group is not None) :
+            self.group.hold()
+            self.swHold = True
+        self.swFwd = fwd
+        self.swRev = rev
+        self.swEnd = end
+        self.swState = SW_COAST
+        self.deadTimer.init(mode=Timer.ONE_SHOT, period=self.switchTime,
+                            tick_hz=1000000, callback=self.deadCB)
+
+    def dead_cb(self,tmr) : # internal only, dead-time sequence step
+        if self.swState == SW_COAST :
+            # wait is over, we know low MOSFETs are disabled
+            self.Fwd.value(self.swFwd)
+            self.Rev.value(self.swRev)
+            self.swState = SW_SETTLE
+            self.deadTimer.init(mode=Timer.ONE_SHOT, period=self.switchTime,
+                                tick_hz=1000000, callback=self.deadCB)
+            return
+        if self.swState != SW_SETTLE :
+            return
+        self.swState = SW_IDLE
+        if self.swEnd == END_RUN :
+            held = self.swHold   # resume() may start another sequence
+            self.swHold = False
+            self.resume()
+            if held : self.group.commit()
+            return
         self.PWM.duty_u16(MotorDrive.MAX_PWM) # set to hard-break state
+        if (self.mode == MotorDrive.MODE_STOP) and (self.speed != 0) :
+            self.setSpeed(self.speed)  # command arrived while braking
+
+    def useTimer(self,cls) : # dead-time steps too.  At a LoopTimer's
+        MotorDrive.useTimer(self,cls)  # resolution they just take longer
+        self.deadTimer.deinit()
+        self.swState = SW_IDLE
+        self.releaseGroup()
+        self.deadTimer = cls()
+
+    def setEbrake(self) :  # internal.  set in e-braking state
+        self.switchTo(0,0,END_BRAKE)
+
+    # IRQ safe.  EN low : coast, whatever IN1, IN2 are.  Any dead-time
+    # sequence dropped.  A group hold it had is released by the next
+    # switchTo(), e.g. emergencyStop()'s brake
+    def off(self) :
+        self.PWM.duty_u16(0)
+        self.deadTimer.deinit()
+        self.swState = SW_IDLE
+        MotorDrive.off(self)
 
     def stop(self) :
+        self.cancelRestart()
+        self.profileStop()
         self.setEbrake()
         self.speed = 0
         self.mode = MotorDrive.MODE_STOP
@@ -99,24 +191,24 @@ class MotorDriveBoim(MotorDrive) :
         if rev and (not fwd) : return -1
         return 0
     
-    def setDirection(self) :  # internal use. just direction, not speed
+    # internal use. just direction, not speed.
+    # returns True if a dead-time sequence was started, which will
+    # resume() when done
+    def setDirection(self) :
         #self.diag(("setting direction for",self.speed))
         if self.speed == 0 :
-            return
+            return False
         dctn = self.direction()
         toReverse = self.speed < 0
         #self.diag(("current direction",dctn,"toReverse",toReverse))
         if  ( (     toReverse  and (dctn < 0))  or
               ((not toReverse) and (dctn > 0))  ) :
-            self.diag("direction OK")
-            return
-        self.diag(("Switching Direction toReverse :",toReverse))
-        self.PWM.duty_u16(0)  # coast
-        time.sleep_us(self.switchTime)  # make sure we are coasting
-        self.Fwd.value(not toReverse)
-        self.Rev.value(    toReverse)
-        time.sleep_us(self.switchTime)  # make sure direction change has settled
-        #self.diag(("reverse",toReverse))
+            if _DIAG and self.dbg.on(DEBUG) : self.dbg.msg("direction OK")
+            return False
+        if _DIAG and self.dbg.on(INFO) :
+            self.dbg.msg("Switching Direction toReverse :",toReverse)
+        self.switchTo(int(not toReverse),int(toReverse),END_RUN)
+        return True
 
     def currentSpeed(self) :
         pwm = self.PWM.duty_u16()
@@ -124,93 +216,95 @@ class MotorDriveBoim(MotorDrive) :
         return pwm*sgn
     
     def restart_cb(self,tmr) : # internal only, for delay callback
-        self.diag("restart")
-        self.setDirection()
+        held = self.rsHold
+        self.rsHold = False
+        trace.log(TR_RESTART,self.tid,self.speed)
+        if _DIAG and self.dbg.on(INFO) : self.dbg.msg("restart")
+        self.mode = MotorDrive.MODE_RUNNING
+        if not self.setDirection() :
+            self.resume()
+        # else resume() once direction pins have settled.  The dead-time
+        # sequence holds the group till then
+        self.restarted(held)
+
+    def resume(self) : # internal.  direction pins set, apply commanded speed
+        if self.speed == 0 :
+            self.PWM.duty_u16(0)  # coast
+            self.mode = MotorDrive.MODE_RUNNING
+            return
+        if self.direction() * self.speed < 0 :
+            self.setSpeed(self.speed)  # command reversed again while switching
+            return
         #sgn = self.direction()
         self.PWM.duty_u16(abs(self.speed)) # resume commanded speed
         self.mode = MotorDrive.MODE_RUNNING
         self.speed = self.currentSpeed() # in case speed not retained EXACTLY
-        self.diag(("resume",self.speed))
+        if _DIAG and self.dbg.on(INFO) : self.dbg.msg("resume",self.speed)
     
     # Set speed -MAX_PWM for max reverse, MAX_PWM for max forward
     # sets speed COMMAND, actual speed change happens only in update()
     def setSpeed(self, spdReq) :
         cmd = self.clipPWM(spdReq)  # check if spdReq is supported
-        self.diag((MotorDrive.mode2str(self.mode),"setSpeed",cmd))
+        self.req = spdReq
+        trace.log(TR_SPEED,self.tid,cmd)
+        if _DIAG and self.dbg.on(INFO) :
+            self.dbg.msg(MotorDrive.mode2str(self.mode),"setSpeed",cmd)
         self.speed = cmd  # remember current command, in case delay
 
         if self.mode == MotorDrive.MODE_STOPPING :
-            self.diag("delayed.  stopping...")
+            if _DIAG and self.dbg.on(DEBUG) : self.dbg.msg("delayed.  stopping...")
+            return
+        if self.swState != SW_IDLE :  # applied when sequence is done
+            if _DIAG and self.dbg.on(DEBUG) : self.dbg.msg("delayed.  switching...")
             return
 
         #self.lock.acquire()  # protect command updates
         pwm = self.PWM.duty_u16()
         sgn = self.direction()
-        self.diag(("current speed",sgn,pwm))
+        if _DIAG and self.dbg.on(DEBUG) : self.dbg.msg("current speed",sgn,pwm)
         
         # not a change in direction, but make sure we are set for the
         # desired future direction
         if sgn == 0 :
-            self.setDirection()
-            sgn = self.direction()
+            if self.setDirection() :
+                self.mode = MotorDrive.MODE_RUNNING
+                return  # resume() once direction pins have settled
             
         # if RUNNING or STOP, and no change of direction, update PWM immediately
         spd = sgn * pwm # current
-        self.diag(("cmd",cmd,"current",spd))
+        if _DIAG and self.dbg.on(DEBUG) : self.dbg.msg("cmd",cmd,"current",spd)
         if ( ( (cmd > 0) and (spd > 0) ) or
              ( (cmd < 0) and (spd < 0) ) or
              (cmd == 0) ) :
             self.PWM.duty_u16(abs(cmd))
             self.speed = sgn * self.PWM.duty_u16() # in case can't set EXACTLY
             self.mode = MotorDrive.MODE_RUNNING
-            self.diag(("speed updated",self.speed))
+            if _DIAG and self.dbg.on(INFO) : self.dbg.msg("speed updated",self.speed)
             return
         
         if spd == 0 : #restart without delay.  already coasting
             self.restart_cb(0)
+            return
 
         # if we got here, there must be a direction change
         sd = self.stopDelay()  # estimated ms to stop from current speed
         self.setEbrake()
         self.mode = MotorDrive.MODE_STOPPING
         # set timer to go off when stop should be complete
-        Timer(period=sd, mode=Timer.ONE_SHOT,
-              callback=self.restart_cb)
-        self.diag(("waiting",sd,"ms before direction change."))                    
+        self.scheduleRestart(sd)
+        trace.log(TR_REVERSE,self.tid,sd)
+        if _DIAG and self.dbg.on(INFO) :
+            self.dbg.msg("waiting",sd,"ms before direction change.")
         #self.release()
 
-# test sequence
-def testMotorDriveBoim() :
-    a = MotorDriveBoim(6,7,8,'A')
-    a.show(9999)
-    a.setSpeed(33000)
-    d = 100
-    time.sleep_ms(d)
-    a.setSpeed(-33000)
-    time.sleep_ms(d)
-    a.setSpeed(0)
-    time.sleep_ms(d)
-    a.setSpeed(11000)
-    time.sleep_ms(d)
-    a.setSpeed(22000)
-    time.sleep_ms(d)
-    a.setSpeed(44000)
-    time.sleep_ms(d)
-    a.setSpeed(-22000)
-    time.sleep_ms(d)
-    a.setSpeed(-44000)
-    d=1000
-    time.sleep_ms(d)
-    
-    # noted trouble with rev-coast-fwd staying rev from TankDrive
-    # try to reproduce
-    a.setSpeed(0)
-    time.sleep_ms(d)
-    print("should switch direction")
-    a.setSpeed(22000)
-    time.sleep_ms(d)
-    a.stop()
-#testMotorDriveBoim()
+# test sequence, once setSpeed() and sleep_ms() here, blocking the board.
+# Now a macro TankDrive plays without blocking (Playback.py).  Over UART :
+#
+#   d9999 m3 S0 L128 S100 L-128 S100 L0 S100 L43 S100 L86 S100 L171
+#         S100 L-86 S100 L-171 S1000 L0 S1000 L86 S1000 L0 m4 m1
+#
+# the last reverse, coast, forward once stayed reverse from TankDrive.
+# m2 loops it, to try to reproduce that.
 
 # $Log: MotorDriveBoim.py,v $
 # Revision 1.4  2022/06/09 16:56:04  aaron
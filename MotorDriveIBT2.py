@@ -18,10 +18,14 @@
 #    * current alarm pins are not used, hence not mentioned
 
 
-from machine import PWM,Pin,Timer
+from machine import PWM,Pin
 import time
 
 from MotorDrive import MotorDrive
+from micropython import const
+from Diag import trace,ERR,INFO,DEBUG,TR_SPEED,TR_REVERSE,TR_RESTART
+
+_DIAG = const(1)  # 0 strips diagnostic messages from the build
 
 class MotorDriveIBT2(MotorDrive) :
     def __init__(self,
@@ -52,6 +56,11 @@ class MotorDriveIBT2(MotorDrive) :
         self.switchTime = switch_us  # wait this long for MOSFETs to switch
         
         
+    def syncPWM(self,group) :
+        self.Lpwm = group.add(self.Lpwm,self.iLpwm)
+        self.Rpwm = group.add(self.Rpwm,self.iRpwm)
+        MotorDrive.syncPWM(self,group)
+
     # arbitrary stop delay.  may soft-code later
     def stopDelay(self) :
         d  = self.Lpwm.duty_u16()
@@ -63,13 +72,13 @@ class MotorDriveIBT2(MotorDrive) :
         return dt
 
     def showState(self) :
-        if self.msgCount <= 0 : self.msgCount=1
-        super().diag((self.Lpwm.duty_u16(),
-             self.Rpwm.duty_u16(),
-             MotorDrive.mode2str(self.mode),
-             "\tcoast",self.coast,"counts ; switch ",
-             self.switchTime,"us\tFwd,Rev Pins:",
-             self.iLpwm,self.iRpwm))
+        print(time.ticks_ms(),self.ID,
+              self.Lpwm.duty_u16(),
+              self.Rpwm.duty_u16(),
+              MotorDrive.mode2str(self.mode),
+              "\tcoast",self.coast,"counts ; switch ",
+              self.switchTime,"us\tFwd,Rev Pins:",
+              self.iLpwm,self.iRpwm)
 
     #def setEbrake(self) :  # internal.  set in e-braking state
     #    self.PWM.duty_u16(0)  # coast 
@@ -79,10 +88,20 @@ class MotorDriveIBT2(MotorDrive) :
     #    time.sleep_us(self.switchTime)
     #    self.PWM.duty_u16(MAX_PWM) # set to hard-break state
 
+    def off(self) : # IRQ safe.  both PWMs low : outputs off
+        self.Rpwm.duty_u16(0)
+        self.Lpwm.duty_u16(0)
+        MotorDrive.off(self)
+
     def stop(self) :
+        self.halt()
+        self.profileStop()
+
+    def halt(self) : # internal.  stop, but leave any motion profile be
         #self.setEbrake()
         self.Rpwm.duty_u16(0)
         self.Lpwm.duty_u16(0)
+        self.cancelRestart()
         self.speed = 0
         self.mode = MotorDrive.MODE_STOP
         
@@ -93,9 +112,9 @@ class MotorDriveIBT2(MotorDrive) :
             return 0
         if (dL > 0) and (dR > 0) :
             self.emergencyStop()
-            diag("Both L and R running, STOP")
+            if _DIAG and self.dbg.on(ERR) : self.dbg.msg("Both L and R running, STOP")
             return 0
-        if rev > 0 :
+        if dR > 0 :
             return -1
         return 1
     
@@ -125,7 +144,10 @@ class MotorDriveIBT2(MotorDrive) :
         return pwm
 
     def restart_cb(self,tmr) : # internal only, for delay callback
-        self.diag("restart")
+        held = self.rsHold
+        self.rsHold = False
+        trace.log(TR_RESTART,self.tid,self.speed)
+        if _DIAG and self.dbg.on(INFO) : self.dbg.msg("restart")
         #self.setDirection()
         #sgn = self.direction()
         # resume commanded speed
@@ -138,17 +160,21 @@ class MotorDriveIBT2(MotorDrive) :
         
         self.mode = MotorDrive.MODE_RUNNING
         self.speed = self.currentSpeed() # in case speed not retained EXACTLY
-        self.diag(("resume",self.speed))
+        if _DIAG and self.dbg.on(INFO) : self.dbg.msg("resume",self.speed)
+        self.restarted(held)
     
     # Set speed -MAX_PWM for max reverse, MAX_PWM for max forward
     # sets speed COMMAND, actual speed change happens only in update()
     def setSpeed(self, spdReq) :
         cmd = self.clipPWM(spdReq)  # check if spdReq is supported
-        self.diag((MotorDrive.mode2str(self.mode),"setSpeed",cmd))
+        self.req = spdReq
+        trace.log(TR_SPEED,self.tid,cmd)
+        if _DIAG and self.dbg.on(INFO) :
+            self.dbg.msg(MotorDrive.mode2str(self.mode),"setSpeed",cmd)
         self.speed = cmd  # remember current command, in case delay
 
         if self.mode == MotorDrive.MODE_STOPPING :
-            self.diag("delayed.  stopping...")
+            if _DIAG and self.dbg.on(DEBUG) : self.dbg.msg("delayed.  stopping...")
             return
 
         spd = self.currentSpeed()
@@ -160,7 +186,7 @@ class MotorDriveIBT2(MotorDrive) :
         #    sgn = self.direction()
             
         # if RUNNING or STOP, and no change of direction, update PWM immediately
-        self.diag(("cmd",cmd,"current",spd))
+        if _DIAG and self.dbg.on(DEBUG) : self.dbg.msg("cmd",cmd,"current",spd)
         if ( ( (cmd <= 0) and (spd <= 0) ) or
              ( (cmd >= 0) and (spd >= 0) ) ) :
             if cmd < 0 :
@@ -172,34 +198,28 @@ class MotorDriveIBT2(MotorDrive) :
                 self.Lpwm.duty_u16(cmd)
                 self.speed = self.Lpwm.duty_u16() # incase roundoff
             self.mode = MotorDrive.MODE_RUNNING
-            self.diag(("speed updated",self.speed))
+            if _DIAG and self.dbg.on(INFO) : self.dbg.msg("speed updated",self.speed)
             return
         
         # if we got here, there must be a direction change
         sd = self.stopDelay()  # estimated ms to stop from current speed
-        self.stop()
+        self.halt()
         self.speed = cmd # save command for re-start, other direction
         self.mode = MotorDrive.MODE_STOPPING
         # set timer to go off when stop should be complete
-        Timer(period=sd, mode=Timer.ONE_SHOT,
-              callback=self.restart_cb)
-        self.diag(("waiting",sd,"ms before direction change."))
+        self.scheduleRestart(sd)
+        trace.log(TR_REVERSE,self.tid,sd)
+        if _DIAG and self.dbg.on(INFO) :
+            self.dbg.msg("waiting",sd,"ms before direction change.")
 
 # test code
 #a = MotorDriveIBT2(18,19,'A')
 #a.show(9999)
 #
-#a.setSpeed(22000)
-#time.sleep_ms(2000)
-#a.setSpeed(0)
-#time.sleep_ms(1000)
-#a.setSpeed(-22000)
-#time.sleep_ms(1000)
-#
-## I have had failures switching direction, but not reproducing now
-#a.setSpeed(22000) ; time.sleep_ms(1000) ; a.setSpeed(-22000)
-#time.sleep_ms(1000)
-#a.setSpeed(0)
+# drive sequences are macros TankDrive plays, without blocking, e.g.
+#   m3 S0 L86 S2000 L0 S1000 L-86 S1000 L86 S1000 L-86 S1000 L0 m4 m1
+# I have had failures switching direction, but not reproducing now.
+# m2 loops it
 
 # $Log: MotorDriveIBT2.py,v $
 # Revision 1.3  2022/06/09 15:43:36  aaron
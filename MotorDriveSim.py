@@ -0,0 +1,75 @@
+#
+# Motor driver with no H-bridge : keeps the duty it would have set.
+#
+# For running TankDrive with no motors wired, on a Pico or on the host,
+# e.g. to check commands, deadman and telemetry.  Select it in pins.json
+# (see Drivers.py) :
+#
+#    {"L" : {"driver" : "sim"}, "R" : {"driver" : "sim"}}
+#
+# duty is the signed PWM a real driver would be applying.  Reversals
+# wait stopDelay() ms at 0, as on the bridges.  Takes the same tuning
+# parameters as the real drivers, and no pins.
+
+import time
+
+from MotorDrive import MotorDrive
+from micropython import const
+from Diag import trace,INFO,TR_SPEED,TR_RESTART
+
+_DIAG = const(1)  # 0 strips diagnostic messages from the build
+
+class MotorDriveSim(MotorDrive) :
+    def __init__(self,
+                 id,  # ID code, usually 'L' or 'R'
+                 freq = 1000,  # not used.  same parameters as real drivers
+                 switch_us = 50,
+                 coast = MotorDrive.MAX_PWM // 100, # Below this PWM, just coast (set to 0)
+                 maxPWM = MotorDrive.MAX_PWM) :
+        super().__init__(id,coast,maxPWM)
+        self.freq = freq
+        self.switchTime = switch_us
+        self.duty = 0      # signed PWM a bridge would have now
+        self.changes = 0   # duty changes
+
+    def setDuty(self,d) : # internal
+        if d != self.duty :
+            self.duty = d
+            self.changes += 1
+
+    def stopDelay(self) :
+        dt = abs(self.duty) // 512  # 16-bit speed
+        if dt < 1 : return 1
+        return dt
+
+    def currentSpeed(self) :
+        return self.duty
+
+    def showState(self) :
+        print(time.ticks_ms(),self.ID,"sim duty",self.duty,
+              MotorDrive.mode2str(self.mode),
+              "\tcoast",self.coast,"\tchanges",self.changes)
+
+    def off(self) : # IRQ safe
+        self.setDuty(0)
+        MotorDrive.off(self)
+
+    def stop(self) :
+        self.setDuty(0)
+        MotorDrive.stop(self)
+
+    def restart_cb(self,tmr) : # internal only, for delay callback
+        held = self.rsHold
+        self.rsHold = False
+        trace.log(TR_RESTART,self.tid,self.speed)
+        self.setDuty(self.speed)
+        self.mode = MotorDrive.MODE_RUNNING
+        self.restarted(held)
+
+    def setSpeed(self,spdReq) :
+        trace.log(TR_SPEED,self.tid,self.clipPWM(spdReq))
+        MotorDrive.setSpeed(self,spdReq)  # reversals : stop, then restart_cb()
+        if self.mode != MotorDrive.MODE_STOPPING :
+            self.setDuty(self.speed)
+            self.mode = MotorDrive.MODE_RUNNING
+            if _DIAG and self.dbg.on(INFO) : self.dbg.msg("speed updated",self.speed)
@@ -0,0 +1,161 @@
+#
+# Scripted drive sequences : timed keyframes, played back without
+# blocking.
+#
+# A macro is up to MAX_KEYS keyframes (dt,vL,vR) in one array('h').  vL
+# and vR are signed PWM/2, as in drive frames.  dt is ms from the
+# keyframe before :
+#
+#    dt > 0   ramp linearly from the keyframe before to this one
+#    dt < 0   hold the keyframe before for -dt ms, then step to this one
+#    dt 0     step to this one at once
+#
+# The first keyframe ramps or steps from 0,0.  Looped, from the last.
+#
+# tick(t) is called every few ms, e.g. from a Timer.  Where the macro is
+# comes from ms since start(), not from counting ticks, so a late tick
+# is only late, and loops do not drift.  A tick a whole pass behind
+# skips it.  tick() returns True when vL,vR changed, allocating nothing.
+# Interpolation is in integers, x1024, within small int range.
+#
+# pack() and unpack() keep a macro in a RecordLog record : a version
+# byte, then the keyframes, little-endian.  MAX_KEYS of them fit one.
+
+from array import array
+from struct import pack_into,unpack_from
+import time
+
+MAX_KEYS = 40  # 6 bytes each.  A RecordLog record holds up to 255
+_REC_VERSION = 1
+
+class Playback() :
+    def __init__(self,n=MAX_KEYS) :
+        self.keys = array('h',[0] * (3 * n))  # dt,vL,vR per keyframe
+        self.max = n
+        self.n = 0         # keyframes
+        self.on = False    # playing
+        self.loop = False
+        self.passes = 0    # times through, looped
+        self.t0 = 0        # ticks_ms, this pass started
+        self.i = 0         # keyframe being approached
+        self.tk = 0        # ms into the pass, keyframe i-1
+        self.pL = 0        # keyframe i-1 speeds
+        self.pR = 0
+        self.vL = 0        # speeds now
+        self.vR = 0
+
+    def clear(self) :
+        self.on = False
+        self.n = 0
+
+    # new keyframe dt ms after the last, with the last one's speeds.
+    # False if full
+    def add(self,dt) :
+        n = self.n
+        if n >= self.max : return False
+        k = self.keys
+        j = 3 * n
+        k[j] = dt
+        if n :
+            k[j + 1] = k[j - 2]
+            k[j + 2] = k[j - 1]
+        else :
+            k[j + 1] = 0
+            k[j + 2] = 0
+        self.n = n + 1
+        return True
+
+    def set(self,side,v) : # last keyframe's speed.  side 1 : vL, 2 : vR
+        if not self.n : self.add(0)
+        self.keys[3 * self.n - 3 + side] = v
+
+    def length(self) : # ms, one pass
+        k = self.keys
+        ms = 0
+        for i in range(self.n) : ms += abs(k[3 * i])
+        return ms
+
+    # from the start, at ticks_ms t.  False if there is nothing to play
+    def start(self,t,loop=False) :
+        if not self.n : return False
+        self.loop = loop and self.length() > 0
+        self.passes = 0
+        self.t0 = t
+        self.i = 0
+        self.tk = 0
+        self.pL = 0
+        self.pR = 0
+        self.on = True
+        self.tick(t)
+        return True
+
+    def stop(self) :
+        self.on = False
+
+    def tick(self,t) : # True if vL,vR changed.  Clears on at the end
+        if not self.on : return False
+        k = self.keys
+        n = self.n
+        e = time.ticks_diff(t,self.t0)  # ms into this pass
+        i = self.i
+        while True :
+            if i >= n :  # past the last keyframe
+                if not self.loop :
+                    self.on = False
+                    return self.out(self.pL,self.pR)
+                p = e // self.tk  # whole passes done, usually 1
+                self.passes += p
+                self.t0 = time.ticks_add(self.t0,p * self.tk)
+                e -= p * self.tk
+                self.tk = 0
+                i = 0
+            dt = k[3 * i]
+            if dt < 0 : dt = -dt
+            if e < self.tk + dt : break
+            self.tk += dt
+            self.pL = k[3 * i + 1]
+            self.pR = k[3 * i + 2]
+            i += 1
+        self.i = i
+        vL = self.pL
+        vR = self.pR
+        dt = k[3 * i]
+        if dt > 0 :  # ramp.  f : 0..1023, fraction of the way there
+            f = ((e - self.tk) << 10) // dt
+            vL += ((k[3 * i + 1] - vL) * f) >> 10
+            vR += ((k[3 * i + 2] - vR) * f) >> 10
+        return self.out(vL,vR)
+
+    def out(self,vL,vR) : # internal
+        if vL == self.vL and vR == self.vR : return False
+        self.vL = vL
+        self.vR = vR
+        return True
+
+    def pack(self) :
+        rec = bytearray(1 + 6 * self.n)
+        rec[0] = _REC_VERSION
+        k = self.keys
+        for i in range(self.n) :
+            pack_into('<hhh',rec,1 + 6 * i,k[3 * i],k[3 * i + 1],k[3 * i + 2])
+        return rec
+
+    def unpack(self,rec) : # False, and nothing changed, if not a macro
+        n = (len(rec) - 1) // 6
+        if not rec or rec[0] != _REC_VERSION or len(rec) != 1 + 6 * n or n > self.max :
+            return False
+        self.on = False
+        k = self.keys
+        for i in range(n) :
+            k[3 * i],k[3 * i + 1],k[3 * i + 2] = unpack_from('<hhh',rec,1 + 6 * i)
+        self.n = n
+        return True
+
+    def show(self) :
+        print("macro keyframes",self.n,"of",self.max,"\tms",self.length(),
+              "\tplaying",self.on,"\tloop",self.loop,"\tpasses",self.passes)
+        k = self.keys
+        for i in range(self.n) :
+            dt = k[3 * i]
+            print("\t",i,"ramp" if dt > 0 else "step",abs(dt),"ms to",
+                  k[3 * i + 1],k[3 * i + 2])
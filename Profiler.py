@@ -0,0 +1,133 @@
+#
+# Per-stage timing of a periodic tick, in fixed-bucket histograms.
+#
+# A tick calls begin(), then mark(i) as each stage i ends, then end().
+# A stage's time is ticks_us since the previous mark, or since begin().
+# Stages marked more than once in a tick (e.g. once per command) add up
+# in that tick's breakdown, and each mark lands in the histogram.
+#
+#    P = Profiler("cmd",("ready","parse"),100000)
+#    P.begin()
+#    ... ; P.mark(0)
+#    ... ; P.mark(1)
+#    P.end()
+#
+# Histogram bucket k holds times in [2**k,2**(k+1)) us, bucket 0 also
+# holds 0, and the last holds everything longer.  Per stage there is
+# also a count, total and max.  The whole tick is one more row, and a
+# tick longer than budget us counts as an overrun.  The worst tick's
+# per-stage breakdown is kept, to show where its time went.
+#
+# Marks outside begin()..end() are ignored.  Nothing allocates once made.
+# Callers guard every call with their own
+#
+#    _PROF = const(0)
+#
+# so a build without the profiler has no trace of it in the bytecode.
+
+from array import array
+import time
+
+N_BUCKETS = 16   # last one : 32768 us and up
+_SUM_MAX = 0x3FFFFFFF  # totals stick here, rather than become big ints
+
+class Profiler() :
+    def __init__(self,name,stages,budget) :
+        self.name = name
+        self.stages = stages  # stage names
+        self.n = len(stages)  # row n : the whole tick
+        self.budget = budget  # us.  a longer tick is an overrun
+        rows = self.n + 1
+        self.hist = array('L',[0] * (rows * N_BUCKETS))
+        self.cnt  = array('L',[0] * rows)
+        self.sum  = array('L',[0] * rows)  # us
+        self.max  = array('L',[0] * rows)
+        self.cur   = array('L',[0] * rows)  # this tick, by stage
+        self.worst = array('L',[0] * rows)  # worst tick, by stage
+        self.on = False   # inside begin()..end()
+        self.t0 = 0       # ticks_us at begin()
+        self.tm = 0       # ticks_us at last mark
+        self.clear()
+
+    def clear(self) :
+        for a in (self.hist,self.cnt,self.sum,self.max,self.worst) :
+            for k in range(len(a)) : a[k] = 0
+        self.ticks = 0
+        self.overruns = 0
+        self.tWorst = 0   # ticks_ms of the worst tick
+
+    def begin(self) :
+        cur = self.cur
+        for k in range(self.n) : cur[k] = 0
+        t = time.ticks_us()
+        self.t0 = t
+        self.tm = t
+        self.on = True
+
+    def mark(self,i) : # stage i just ended
+        if not self.on : return
+        t = time.ticks_us()
+        dt = time.ticks_diff(t,self.tm)
+        self.tm = t
+        self.cur[i] += dt
+        self.add(i,dt)
+
+    def end(self) :
+        if not self.on : return
+        self.on = False
+        dt = time.ticks_diff(time.ticks_us(),self.t0)
+        n = self.n
+        self.add(n,dt)
+        self.ticks += 1
+        if dt > self.budget : self.overruns += 1
+        if dt >= self.max[n] :  # add() just set it : a new worst
+            cur = self.cur
+            w = self.worst
+            for k in range(n) : w[k] = cur[k]
+            w[n] = dt
+            self.tWorst = time.ticks_ms()
+
+    def add(self,i,dt) : # internal.  note dt us in row i
+        if dt < 0 : dt = 0
+        b = 0
+        v = dt
+        if v >= 256 :
+            v >>= 8
+            b = 8
+        while v > 1 :
+            v >>= 1
+            b += 1
+        if b >= N_BUCKETS : b = N_BUCKETS - 1
+        self.hist[i * N_BUCKETS + b] += 1
+        self.cnt[i] += 1
+        s = self.sum[i] + dt
+        self.sum[i] = s if s < _SUM_MAX else _SUM_MAX
+        if dt > self.max[i] : self.max[i] = dt
+
+    def row(self,i) : # name of row i
+        return self.stages[i] if i < self.n else "tick"
+
+    def show(self) :
+        n = self.n
+        print(self.name,"ticks",self.ticks,"\toverruns",self.overruns,
+              "over",self.budget,"us\tworst",self.worst[n],"us at",self.tWorst)
+        for i in range(n + 1) :
+            c = self.cnt[i]
+            print(" ",self.row(i),"\tn",c,"\tmean",self.sum[i] // c if c else 0,
+                  "\tmax",self.max[i],"\tworst tick",self.worst[i])
+            h = self.hist
+            o = i * N_BUCKETS
+            for b in range(N_BUCKETS - 1) :
+                if h[o + b] : print("\t<",2 << b,"us",h[o + b])
+            b = N_BUCKETS - 1
+            if h[o + b] : print("\t>=",1 << b,"us",h[o + b])
+
+    def folded(self) : # "name;stage us" lines, total time, for flame graphs
+        n = self.n
+        out = []
+        for i in range(n) :
+            out.append("%s;%s %d" % (self.name,self.stages[i],self.sum[i]))
+        rest = self.sum[n]  # tick time between marks
+        for i in range(n) : rest -= self.sum[i]
+        if rest > 0 : out.append("%s %d" % (self.name,rest))
+        return out
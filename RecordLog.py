@@ -0,0 +1,84 @@
+#
+# Append-only log of small binary records, in one littlefs file.
+#
+#    MARK len payload... crc8
+#
+# MARK is 0x5A, len the payload length, crc8 (poly 0x07, as WordParser)
+# covers len..payload.  read() returns the newest record whose CRC
+# checks, so a write cut short by a reset loses only that record.
+# append() adds to the end of the file.  Once the file would grow past
+# maxBytes (one 4 KiB flash block by default), it is rewritten with just
+# the new record : to a temporary file, then renamed over the log, which
+# littlefs does atomically.  Flash is erased about once per maxBytes of
+# records, rather than once per record.
+#
+#    log = RecordLog("TankDrive.dat")
+#    rec = log.read()   # None if no valid record
+#    log.append(bytes)  # up to 255 bytes
+
+import os
+from WordParser import crc8
+
+MARK = 0x5A
+
+class RecordLog() :
+    def __init__(self,fnam,maxBytes=4096) :
+        self.fnam = fnam
+        self.maxBytes = maxBytes
+        self.size = -1    # file bytes, -1 : not yet known
+        self.writes = 0   # appends since boot
+        self.rewrites = 0 # of those, whole-file rewrites
+
+    def read(self) : # newest valid record, bytes, or None
+        try :
+            with open(self.fnam,'rb') as f :
+                buf = f.read()
+        except OSError :
+            self.size = 0
+            return None
+        self.size = len(buf)
+        rec = None
+        k = 0
+        end = len(buf)
+        while k + 3 <= end :
+            n = buf[k + 1]
+            if buf[k] == MARK and k + n + 3 <= end :
+                m = memoryview(buf)[k + 1:k + n + 2]
+                if crc8(m,n + 1) == buf[k + n + 2] :
+                    rec = bytes(m[1:])
+                    k += n + 3
+                    continue
+            k += 1   # not a record.  resync
+        return rec
+
+    def append(self,payload) :
+        n = len(payload)
+        rec = bytearray(n + 3)
+        rec[0] = MARK
+        rec[1] = n
+        rec[2:n + 2] = payload
+        rec[n + 2] = crc8(memoryview(rec)[1:],n + 1)
+        if self.size < 0 :
+            try :
+                self.size = os.stat(self.fnam)[6]
+            except OSError :
+                self.size = 0
+        if self.size + len(rec) > self.maxBytes :
+            tmp = self.fnam + ".new"
+            with open(tmp,'wb') as f :
+                f.write(rec)
+            os.rename(tmp,self.fnam)
+            self.size = len(rec)
+            self.rewrites += 1
+        else :
+            with open(self.fnam,'ab') as f :
+                f.write(rec)
+            self.size += len(rec)
+        self.writes += 1
+
+    def erase(self) :
+        try :
+            os.remove(self.fnam)
+        except OSError :
+            pass
+        self.size = 0
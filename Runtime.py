@@ -0,0 +1,129 @@
+#
+# Periodic tasks on asyncio, instead of Timers and IRQs.
+#
+# Each task is fn(t), t ticks_ms, run every period ms by a coroutine of
+# its own, all on one core, one at a time.  Nothing pre-empts a task,
+# so the order things happen in is the order they are written, not an
+# accident of which Timer fired first.
+#
+# Due times step by the period, not from when a task last ran, so
+# lateness does not add up.  A task a whole period behind skips to now,
+# counted as an overrun, rather than running back to back to catch up.
+# Period 0 pauses a task, see period().  A paused task waits on an
+# Event, so a new period starts it at once, not at its next poll.
+#
+# Priority : a task that is due first lets every task of higher priority
+# that is also due run, so under load the motor tick and deadman go
+# first and the LED last.  A task can not be cut short, though : a slow
+# one delays all the others.
+#
+# Loop lag : how late each task's pass started (LoopStats, LoopTimer.py),
+# and its longest run.  show() prints them.
+#
+# Runs on MicroPython's asyncio (uasyncio in older firmware), and on
+# CPython's.  On the host, sim/simasyncio.py runs it on the virtual clock.
+
+import time
+try :
+    import asyncio
+except ImportError :
+    import uasyncio as asyncio
+from LoopTimer import LoopStats
+
+if hasattr(asyncio,'sleep_ms') :
+    sleep_ms = asyncio.sleep_ms
+else : # CPython
+    def sleep_ms(ms) :
+        return asyncio.sleep(ms / 1000)
+
+class Task() :
+    def __init__(self,name,period,fn,prio,stats) :
+        self.name = name
+        self.period = period * 1000  # us.  0 : paused
+        self.fn = fn
+        self.prio = prio
+        self.stats = stats           # lateness, LoopStats
+        self.run = 0                 # us, longest fn() call
+        self.due = 0                 # ticks_us
+        self.above = ()              # tasks of higher priority
+        self.wake = asyncio.Event()  # set : unpaused, or stopping
+
+class Runtime() :
+    def __init__(self) :
+        self.tasks = []
+        self.running = False
+
+    # fn(t) every period ms.  Higher prio goes first.  stats : LoopStats
+    # to keep its lateness in, e.g. one others read too
+    def every(self,name,period,fn,prio=0,stats=None) :
+        if stats is None : stats = LoopStats()
+        tk = Task(name,period,fn,prio,stats)
+        self.tasks.append(tk)
+        return tk
+
+    def find(self,name) :
+        for tk in self.tasks :
+            if tk.name == name : return tk
+        return None
+
+    def period(self,name,ms) : # new period for a task, 0 pauses it
+        tk = self.find(name)
+        tk.period = ms * 1000
+        tk.due = time.ticks_add(time.ticks_us(),tk.period)
+        if ms : tk.wake.set()
+
+    def higherDue(self,tk,t) : # internal
+        for u in tk.above :
+            if u.period and time.ticks_diff(t,u.due) >= 0 : return True
+        return False
+
+    async def loop(self,tk) : # internal.  one per task
+        tk.due = time.ticks_add(time.ticks_us(),tk.period)
+        while self.running :
+            if not tk.period :
+                tk.wake.clear()
+                await tk.wake.wait()
+                continue
+            dt = time.ticks_diff(tk.due,time.ticks_us())
+            if dt > 0 :
+                await sleep_ms((dt + 999) // 1000)
+                continue
+            # let due tasks of higher priority go first.  Each yield lets
+            # every ready task run once, so this many is always enough
+            for i in range(len(tk.above)) :
+                if not self.higherDue(tk,time.ticks_us()) : break
+                await sleep_ms(0)
+            if not self.running : break
+            t = time.ticks_us()
+            late = time.ticks_diff(t,tk.due)
+            tk.stats.add(late,tk.period)
+            if late >= tk.period : tk.due = t  # a period behind.  skip ahead
+            tk.due = time.ticks_add(tk.due,tk.period)
+            tk.fn(time.ticks_ms())
+            r = time.ticks_diff(time.ticks_us(),t)
+            if r > tk.run : tk.run = r
+
+    async def main(self) : # run every task until stop()
+        self.running = True
+        for tk in self.tasks :
+            tk.above = tuple(u for u in self.tasks if u.prio > tk.prio)
+        await asyncio.gather(*[self.loop(tk) for tk in
+                               sorted(self.tasks,key=lambda tk : -tk.prio)])
+
+    def run(self) : # blocks until stop()
+        asyncio.run(self.main())
+
+    def stop(self) : # tasks end at their next pass
+        self.running = False
+        for tk in self.tasks : tk.wake.set()
+
+    def show(self,clear=False) :
+        for tk in self.tasks :
+            s = tk.stats
+            n = s.n if s.n else 1
+            print(tk.name,"prio",tk.prio,"\tperiod ms",tk.period // 1000,
+                  "\tpasses",s.n,"\tlate us mean",s.sum // n,"max",s.max,
+                  "\toverruns",s.overruns,"\trun us max",tk.run)
+            if clear :
+                s.clear()
+                tk.run = 0
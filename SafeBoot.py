@@ -0,0 +1,48 @@
+#
+# First thing at boot : every H-bridge input low, so the motors coast
+# while the rest of TankDrive loads.
+#
+# main.py imports this before TankDrive.py, so it runs before TankDrive
+# and its drivers are even compiled (or loaded, from .mpy or frozen
+# bytecode).  It needs nothing but machine.Pin, and json, which is built
+# in.  Until it runs, the RP2040's GPIOs are inputs with pull-downs,
+# and hold the bridges off only as well as those weak pull-downs do.
+#
+#    BOIM     EN(PWM) 6, IN1 7, IN2 8 low : output off, coasting
+#    IBT-2    RPWM 18, LPWM 19 low, R_EN 20, L_EN 21 low : outputs off
+#
+# A side moved by the pin map (pins.json, see Drivers.py) has its
+# "pins" and "enable" from there instead.  TankDrive turns the enables
+# on once its PWMs are set up at 0.
+#
+# tSafe is ticks_us when the pins were set, about us since reset.
+# resetCause is machine.reset_cause() : WDT_RESET if the watchdog reset
+# the board (see Watchdog.py).  TankDrive then brakes, and records it.
+
+from machine import Pin,reset_cause
+import time
+
+PIN_MAP = "pins.json"
+SAFE_L = (6,7,8)          # BOIM, built-in pin map
+SAFE_R = (18,19,20,21)    # IBT-2, and its enables
+
+def bridgePins() : # per side, from pins.json or built in
+    L = SAFE_L
+    R = SAFE_R
+    try :
+        import json
+        with open(PIN_MAP) as f :
+            m = json.load(f)
+        if 'L' in m : L = tuple(m['L'].get('pins',())) + tuple(m['L'].get('enable',()))
+        if 'R' in m : R = tuple(m['R'].get('pins',())) + tuple(m['R'].get('enable',()))
+    except Exception :
+        pass  # no map, or a bad one : TankDrive will say so.  built in
+    return L + R
+
+def safe() :
+    for p in bridgePins() :
+        Pin(p,Pin.OUT,value=0)
+    return time.ticks_us()
+
+tSafe = safe()
+resetCause = reset_cause()
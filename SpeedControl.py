@@ -0,0 +1,109 @@
+#
+# Closed-loop wheel speed control.  Wraps a motor driver and an encoder.
+#
+# setTarget() takes a wheel speed setpoint, in the same units as PWM
+# commands : MAX_PWM is fullCps encoder counts/s.  tick(), from a fixed
+# rate loop every tTick ms, measures the speed from the encoder count,
+# and sets the driver through its setTarget(), so a motion profile on
+# the driver still limits the slew.
+#
+# Integer PID, gains x256 :
+#    u = kff*target + kp*err + ki*sum(err) - kd*d(speed)
+# Derivative is on the measurement, so a setpoint step does not kick.
+# Output never opposes the setpoint's sign : slowing down is by coasting,
+# not by driving backwards, which would start a reversal.  Setpoint 0
+# coasts.  Anti-windup : the sum stops growing while the output is
+# clamped in the direction it would push, and ki*sum alone is limited
+# to full scale.  tick() allocates nothing.
+
+import time
+from MotorDrive import MotorDrive
+
+MAX = MotorDrive.MAX_PWM
+
+class SpeedControl() :
+    def __init__(self,motor,enc,fullCps,tTick=10,
+                 kp=256,ki=16,kd=0,kff=256) :
+        self.motor = motor
+        self.enc = enc
+        self.ID = motor.ID
+        self.kp = kp
+        self.kd = kd
+        self.kff = kff
+        self.setRate(fullCps,tTick)
+        self.setKi(ki)
+        self.reset()
+
+    def setRate(self,fullCps,tTick) :
+        self.fullCps = fullCps
+        self.tTick = tTick   # ms between tick()s
+        full = fullCps * tTick // 1000  # counts per tick at full speed
+        if full < 1 : full = 1
+        self.spdMul = (MAX << 8) // full  # counts/tick -> PWM units, x256
+
+    def setKi(self,ki) :
+        self.ki = ki
+        self.iMax = (MAX << 8) // ki if ki > 0 else 0
+
+    def reset(self) :
+        self.on = False # off until a setpoint.  stopped motor left alone
+        self.target = 0
+        self.sum = 0    # integral
+        self.speed = 0  # measured, PWM units
+        self.out = 0
+        self.pos = self.enc.count()
+
+    def setTarget(self,v) :
+        if v >  MAX : v =  MAX
+        if v < -MAX : v = -MAX
+        self.target = v
+        self.on = True
+
+    def tick(self) :
+        p = self.enc.count()
+        sp = ((p - self.pos) * self.spdMul) >> 8
+        self.pos = p
+        dsp = sp - self.speed
+        self.speed = sp
+        if not self.on : return
+        t = self.target
+        if t == 0 :
+            self.sum = 0
+            u = 0
+        else :
+            if t > 0 :
+                lo = 0
+                hi = MAX
+            else :
+                lo = -MAX
+                hi = 0
+            err = t - sp
+            s = self.sum + err
+            if   s >  self.iMax : s =  self.iMax
+            elif s < -self.iMax : s = -self.iMax
+            u = (self.kff * t + self.kp * err + self.ki * s - self.kd * dsp) >> 8
+            if u > hi :
+                u = hi
+                if err < 0 : self.sum = s  # only unwinds
+            elif u < lo :
+                u = lo
+                if err > 0 : self.sum = s
+            else :
+                self.sum = s
+        if u != self.out :
+            self.out = u
+            self.motor.setTarget(u)
+
+    # same as the driver's, so TankDrive can use either
+    def stop(self) :
+        self.reset()
+        self.motor.stop()
+
+    def emergencyStop(self) :
+        self.reset()
+        self.motor.emergencyStop()
+
+    def show(self,n) :
+        print(time.ticks_ms(),self.ID,"target",self.target,"speed",self.speed,
+              "out",self.out,"sum",self.sum,"count",self.pos)
+        self.motor.show(n)
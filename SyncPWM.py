@@ -0,0 +1,142 @@
+#
+# Commit several PWM duty cycles together, so both treads change at once.
+#
+# Setting the left and right motors takes two driver calls.  Left and
+# right would change tens of us apart, or a whole motor loop tick apart
+# if one driver first waits out a dead-time sequence, and the vehicle
+# yaws on a straight-line start.
+#
+# Drivers write duty through StagedPWM, which passes writes straight
+# through unless its group is held.  While held, non-zero duties are
+# only staged, and the last commit() writes them all back to back.
+# Drivers read back the staged duty, so they see the state they asked
+# for.  Duty 0 (coast) is never delayed.
+#
+#   g = PWMGroup()
+#   MotL.syncPWM(g) ; MotR.syncPWM(g)
+#   g.hold() ; MotL.setSpeed(vL) ; MotR.setSpeed(vR) ; g.commit()
+#
+# Holds nest.  A driver mid dead-time sequence holds the group too, so
+# the other side waits for it, rather than starting first.  A brake
+# (full duty) waits on a hold too, but from coast, which is safe.
+#
+# The RP2040 latches a slice's new duty at its counter wrap.  align()
+# restarts the slices' counters together, through the PWM EN register,
+# so slices at the same frequency latch writes made in one PWM period at
+# the same wrap.  At different frequencies the wraps drift apart, and
+# the latches can still be a whole period apart, so align() refuses then
+# (sameFreq()).
+#
+# commit()'s writes take some us, and a wrap can fall between them, the
+# first member latching a period before the last.  Once aligned, commit()
+# reads the counter first, and within writeUs (the longest commit seen,
+# from a timed round of writes in align(), up to half a period) of the
+# wrap, spins until it has wrapped.
+
+try :
+    from machine import mem32
+    ALIGN_OK = True
+except ImportError :  # port without mem32
+    ALIGN_OK = False
+import time
+
+_PWM_BASE = 0x40050000
+_PWM_EN   = 0x400500A0
+_CH_SIZE  = 0x14  # bytes of registers per slice
+_CH_CTR   = 0x08
+_CH_TOP   = 0x10
+
+class StagedPWM() :
+    def __init__(self,pwm,group) :
+        self.pwm = pwm
+        self.group = group
+        self.d = pwm.duty_u16()  # duty, as staged
+        self.dirty = False       # d not yet written
+
+    def duty_u16(self,d=None) :
+        if d is None : return self.d
+        self.d = d
+        if d and self.group.held :
+            self.dirty = True
+            return
+        self.dirty = False
+        self.pwm.duty_u16(d)
+
+    def apply(self) : # internal.  write staged duty
+        if self.dirty :
+            self.dirty = False
+            self.pwm.duty_u16(self.d)
+
+    def freq(self,f=None) :
+        if f is None : return self.pwm.freq()
+        self.pwm.freq(f)
+
+class PWMGroup() :
+    def __init__(self) :
+        self.members = []
+        self.pins = []   # GPIO numbers, for align()
+        self.held = 0    # hold() count
+        self.ctr = 0     # aligned : a member slice's CTR register address
+        self.periodUs = 0
+        self.writeUs = 0 # longest commit writes, us
+
+    def add(self,pwm,pin) : # wrap a driver's PWM.  returns the StagedPWM
+        s = StagedPWM(pwm,self)
+        self.members.append(s)
+        self.pins.append(pin)
+        return s
+
+    def hold(self) :
+        self.held += 1
+
+    def commit(self) :
+        if self.held > 1 :
+            self.held -= 1
+            return
+        self.held = 0
+        dirty = False
+        for s in self.members :
+            if s.dirty : dirty = True
+        if not dirty : return
+        if self.ctr : self.clearWrap()
+        t = time.ticks_us()
+        for s in self.members :
+            s.apply()
+        self.timed(t)
+
+    def timed(self,t) : # internal.  writes from ticks_us() t done
+        t = time.ticks_diff(time.ticks_us(),t)
+        if t > self.periodUs >> 1 : t = self.periodUs >> 1
+        if t > self.writeUs : self.writeUs = t
+
+    def clearWrap(self) : # internal.  until writeUs or more before the wrap
+        top = mem32[self.ctr - _CH_CTR + _CH_TOP] + 1
+        guard = self.writeUs * top
+        for k in range(self.periodUs) :  # bounded, should the counter stop
+            if (top - mem32[self.ctr]) * self.periodUs >= guard : return
+
+    def sameFreq(self) : # all members at one PWM frequency
+        for s in self.members :
+            if s.freq() != self.members[0].freq() : return False
+        return True
+
+    # restart member slices' counters together.  False, and nothing
+    # done, if they can not latch together anyway
+    def align(self) :
+        if not ALIGN_OK or not self.members or not self.sameFreq() : return False
+        self.periodUs = 1000000 // self.members[0].freq()
+        mask = 0
+        for p in self.pins :
+            mask |= 1 << ((p >> 1) & 7)
+        en = mem32[_PWM_EN]
+        mem32[_PWM_EN] = en & ~mask
+        for s in range(8) :
+            if mask & (1 << s) :
+                mem32[_PWM_BASE + s * _CH_SIZE + _CH_CTR] = 0
+        mem32[_PWM_EN] = en | mask
+        self.ctr = _PWM_BASE + ((self.pins[0] >> 1) & 7) * _CH_SIZE + _CH_CTR
+        t = time.ticks_us()  # a first writeUs : rewrite the duties as they are
+        for s in self.members :
+            s.pwm.duty_u16(s.pwm.duty_u16())
+        self.timed(t)
+        return True
@@ -6,13 +6,61 @@
 #
 #      Motor drives take speed commands from -255..255,
 #              with negative numbers for reverse.
+#      or from binary frames (see WordParser.py) setting both
+#              sides at once, as signed 16-bit PWM/2 (15-bit magnitude).
 #      If commands are not updated reguarly, the
 #               motors will be commanded to stop.
+#
+# main.py imports SafeBoot.py first, so the bridges are safe before this
+# is even compiled.  Optional parts (encoders, speed control, profiler)
+# are only imported when Settings turn them on.  'b' prints boot timing.
 
+import SafeBoot  # already run from main.py.  If not, bridges safe now
 
-from machine import UART,Pin,Timer,ADC
-from WordParser import WordParser
+from machine import UART,Pin,Timer,WDT_RESET
+from micropython import const
+from WordParser import WordParser,parseInt,isFrame,int16,OP_DRIVE,OP_STOP,SIGNAL
 from FilteredADC import FilteredADC
+from ADCCapture import ADCCapture,DMA_OK
+from Diag import Diag,trace,ERR,INFO,TR_CMD,TR_FRAME,TR_DEADMAN,TR_BADCMD,TR_WDT
+from Handoff import TargetSlot,SET_L,SET_R,STOP,ESTOP
+from LoopTimer import LoopTimer,LoopStats,runDue
+from SyncPWM import PWMGroup
+from CurrentSense import CurrentSense
+from RecordLog import RecordLog
+from MotorDrive import MotorDrive
+from Drivers import loadPinMap,makeMotor
+from Deferred import Deferred
+from struct import pack,unpack,calcsize
+from Telemetry import Telemetry,F_ALL,I_CMD,I_DUTY,I_MODE,I_POT,I_DEADMAN,I_LOOP,I_QUEUE,I_CURRENT,I_SPEED
+
+_DIAG = const(1)  # 0 strips diagnostic messages from the build
+_PROF = const(0)  # 1 builds in the stage profiler, see Profiler.py
+
+# profiler stages, command side (State.prof)
+_P_READY   = const(0)  # cs.ready()
+_P_PARSE   = const(1)  # cs.next(), parseCommand()
+_P_APPLY   = const(2)  # applyCommand(), applyFrame()
+_P_SETL    = const(3)  # left setTarget()
+_P_SETR    = const(4)  # right setTarget(), PWM commit
+_P_LED     = const(5)  # heartbeat()
+_P_DEADMAN = const(6)  # checkDeadman()
+# motor loop (State.profM)
+_M_CURRENT = const(0)  # CurrentSense.update()
+_M_TIMERS  = const(1)  # runDue()
+_M_TARGETS = const(2)  # applyTargets()
+_M_SPEED   = const(3)  # speedTick()
+_M_TICKL   = const(4)  # profile steps
+_M_TICKR   = const(5)
+_M_COMMIT  = const(6)  # PWM commit
+_M_DEADMAN = const(7)
+
+_T_ANALOG = const(50)  # analog override update period (ms)
+_DEADMAN_MAX = const(3600000)  # ms.  'q' limit, well inside ticks_diff()
+
+# ticks the watchdog waits on, see startWatchdog()
+_W_CMD   = const(0)  # TankDriveUpdate(), or the commands task
+_W_MOTOR = const(1)  # motorTick(), with a motor loop
 
 # In C I had an abstract MotorDrive base class, which was passed around, and you
 # instantiated it for the specific driver
@@ -21,37 +69,203 @@ from FilteredADC import FilteredADC
 # You'll get a nice, informative run-time error if a method is missing.
 # So, for uPython, I plan to copy-and-paste with minor mods for each controller
 
-# instantiate (file) global Motor Controlers, and put in brake or coast state
-from MotorDriveBoim import MotorDriveBoim
-
-from MotorDriveIBT2 import MotorDriveIBT2
-pinEnL = Pin(21,Pin.OUT,1)  # for test, set EN pins high
-pinEnR = Pin(20,Pin.OUT,1)  
+# Motor controllers are picked by name in the pin map (Drivers.py), and
+# only their modules are imported.
 #def IBT2on(en=1) : # EN pins not in MotorDriveIBT2, assumed tied hi
 #    Pin(20,Pin.OUT,en)
 #    Pin(21,Pin.OUT,en)
 #IBT2on()
 
-class TankDriveHardware() :
+# saved settings record, see TankDriveSettings.pack().  Bump the version
+# whenever the layout changes : a record of another version is ignored
+_REC_VERSION = 1
+_REC_FMT = '<BIH4H4Hff'
+
+class TankDriveSettings() :
+    # read once at boot.  Fixed attributes : no typo makes a new one
+    __slots__ = ('DeadmanTime','tFlash','eventDispatch','tPoll','tSlow',
+                 'motorLoop','tMotor','coalesce','tAccel','tDecel','tJerk',
+                 'syncPWM','closedLoop','fullCps','tSpeed','speedPID',
+                 'currentTrip','currentLimit','tTelemetry','telemetryFields',
+                 'drvL','drvR','potGain','currentGain','tSave','log',
+                 'tasks','tCmd','wdt','tPlay')
+
     def __init__(self) :
-        self.cs  = WordParser(UART(1,115200)) # command stream
-        self.led = Pin(25, Pin.OUT) # hidden on-board LED pin
+       self.DeadmanTime = 20000  # ms without command before emergencyStop()
+       self.tFlash = 2000  # LED13 status flash period (ms)
+       self.eventDispatch = True # apply commands from UART RX IRQ, not polling
+       self.tPoll = 100    # command poll period (ms), when not event driven
+       self.tSlow = 250    # heartbeat and deadman period (ms), event driven
+       # 0 : set motors as commands arrive.  1 : fixed-rate motor loop on
+       # a Timer.  2 : motor loop on core 1, commands parsed on core 0
+       self.motorLoop = 0
+       self.tMotor = 1     # motor loop period (ms)
+       self.coalesce = True  # set each motor once per batch of commands
+       # motion profile, ms from 0 to full scale.  tAccel 0 : none.
+       # Needs a motor loop, and starts one on a Timer if motorLoop is 0
+       self.tAccel = 0
+       self.tDecel = 0     # 0 : same as tAccel
+       self.tJerk = 0      # ms to reach full acceleration.  0 : trapezoid
+       self.syncPWM = True # commit L and R duty together, see SyncPWM.py
+       # L/R commands set wheel speed, from the encoders, instead of PWM.
+       # Needs a motor loop, and starts one on a Timer if motorLoop is 0
+       self.closedLoop = False
+       self.fullCps = 2000   # encoder counts/s at full speed command
+       self.tSpeed = 10      # speed control period (ms)
+       self.speedPID = (256,16,0,256)  # kp,ki,kd,kff, x256
+       # IBT-2 current sense, mA, 0 : off.  Over currentTrip stops both
+       # motors.  Over currentLimit scales the IBT-2's PWM down.
+       # Needs a motor loop, and starts one on a Timer if motorLoop is 0
+       self.currentTrip = 0
+       self.currentLimit = 0
+       # binary telemetry frames back over the command UART, see
+       # Telemetry.py.  period ms, 0 : off.  'y' command sets it too
+       self.tTelemetry = 0
+       self.telemetryFields = F_ALL
+       # motor drivers, freq,switch_us,coast,maxPWM.  Used at boot.  Keep
+       # the two freq the same : syncPWM only latches L and R together then
+       self.drvL = (1000,50,MotorDrive.MAX_PWM // 100,MotorDrive.MAX_PWM)
+       self.drvR = (1000,50,MotorDrive.MAX_PWM // 100,MotorDrive.MAX_PWM)
+       self.potGain = 0.2      # pot filters, per 50 ms analog update
+       self.currentGain = 0.1  # IBT-2 current filter, per motor loop pass
+       # ms after the last change before saving, see settingsChanged().
+       # Only saved while the motors are stopped
+       self.tSave = 2000
+       self.log = RecordLog("TankDrive.dat")
+       # asyncio tasks instead of Timers, see startTasks().  main.py
+       # runs them.  tCmd : command poll period (ms) then
+       self.tasks = False
+       self.tCmd = 5
+       # hardware watchdog timeout (ms), 0 : off.  Fed only while the
+       # command tick and motor loop keep within their periods.  Once
+       # started it can not be stopped.  see Watchdog.py
+       self.wdt = 0
+       self.tPlay = 10   # macro playback period (ms), see Playback.py
+
+    # DeadmanTime, tFlash, drvL, drvR and the filter gains are saved.
+    # One record, _REC_FMT, appended to a RecordLog
+    def pack(self) :
+        return pack(_REC_FMT,_REC_VERSION,self.DeadmanTime,self.tFlash,
+                    *(self.drvL + self.drvR + (self.potGain,self.currentGain)))
 
-        self.MotL = MotorDriveBoim( 6, 7, 8,'L') # PWM,Fwd,Rev,ID,freq,switch_us,coast,maxPWM
-        #self.MotR = MotorDriveBoim(10,11,12,'R')
-        self.MotR = MotorDriveIBT2(18,19,'R')
+    def unpack(self,rec) : # False, and nothing changed, if not a record
+        if len(rec) != calcsize(_REC_FMT) or rec[0] != _REC_VERSION :
+            return False
+        v = unpack(_REC_FMT,rec)
+        self.DeadmanTime = min(v[1],_DEADMAN_MAX)
+        self.tFlash = v[2]
+        self.drvL = v[3:7]
+        self.drvR = v[7:11]
+        self.potGain = v[11]
+        self.currentGain = v[12]
+        return True
 
-        self.AnalogOverrideSwitch = Pin(16, Pin.IN, Pin.PULL_UP)
+    def load(self,fnam=None) : # saved settings over the defaults
+        if fnam : self.log = RecordLog(fnam)
+        rec = self.log.read()
+        if rec is None :
+            print("no saved settings in",self.log.fnam)
+            return False
+        if not self.unpack(rec) :
+            print("saved settings in",self.log.fnam,"not version",_REC_VERSION,"ignored")
+            return False
+        return True
 
-        self.PotL = FilteredADC(26,0.2)  # GPIO pin index in [26|27|28]
-        self.PotR = FilteredADC(27,0.2)
+    def save(self,fnam=None) :
+        if fnam : self.log = RecordLog(fnam)
+        self.log.append(self.pack())
+
+    def print(self) :
+        #analogDesc  = "UART"
+        #stoppedDesc = "Running"
+        #AnalogOverride = not AnalogOverrideSwitch.value() # active LOW
+        #if self.stopped   : stoppedDesc = "Stopped"
+        #if AnalogOverride :  analogDesc = "Analog"
+        #print("Mode",analogDesc,stoppedDesc,
+        #      "\tTimeout",self.DeadmanTime,
+        #      "\tFlash_Period",self.tFlash)
+        print("\tTimeout",self.DeadmanTime,
+              "\tFlash_Period",self.tFlash,
+              "\tEvent_Dispatch",self.eventDispatch,
+              "\tMotor_Loop",self.motorLoop,
+              "\tCoalesce",self.coalesce,
+              "\tAccel",self.tAccel,self.tDecel,self.tJerk,
+              "\tSync_PWM",self.syncPWM,
+              "\tClosed_Loop",self.closedLoop,self.fullCps,self.tSpeed,self.speedPID,
+              "\tCurrent_Trip,Limit",self.currentTrip,self.currentLimit,
+              "\tTelemetry",self.tTelemetry,hex(self.telemetryFields),
+              "\tTasks",self.tasks,self.tCmd,
+              "\tWatchdog",self.wdt,
+              "\tPlayback",self.tPlay,
+              "\tDrivers",self.drvL,self.drvR,
+              "\tGains_Pot,Current",self.potGain,self.currentGain)
+        
+# load previous state from file
+Settings = TankDriveSettings()
+Settings.load()
+Settings.print()
+
+class TankDriveHardware() :
+    def __init__(self,pins) : # pins : pin map, see Drivers.py
+        self.pins = pins
+        # command stream.  When its queue is full, leave bytes in the UART
+        # rather than drop words : a stop must not be lost in a burst
+        self.cs  = WordParser(UART(*pins['uart']),policy=SIGNAL)
+        self.led = Pin(pins['led'], Pin.OUT) # hidden on-board LED pin
+
+        # drivers, e.g. MotorDriveBoim(6,7,8,'L',freq,switch_us,coast,maxPWM)
+        self.MotL = makeMotor(pins['L'],'L',Settings.drvL)
+        self.MotR = makeMotor(pins['R'],'R',Settings.drvR)
+        self.pwmGroup = PWMGroup()  # see Settings.syncPWM
+
+        # wheel encoders, see encoders()
+        self.EncL = None
+        self.EncR = None
+        # what speed commands drive : the motors, or with
+        # Settings.closedLoop, SpeedControls wrapping them
+        self.DrvL = self.MotL
+        self.DrvR = self.MotR
+
+        self.AnalogOverrideSwitch = Pin(pins['override'], Pin.IN, Pin.PULL_UP)
+        potL,potR = pins['pots']
+
+        if DMA_OK :
+            # pots and IBT-2 current sense (GP28) sampled continuously by
+            # ADC+DMA, 2000/s each.  The pot filters average the ~100
+            # samples of each 50ms analog update, then filter that once,
+            # at the same gain as polled.  512 samples is 85ms of all three
+            self.adcCap = ADCCapture((potL,potR,pins['current']),rate=2000,ringLen=512)
+            self.adcCap.start()
+            self.PotL = FilteredADC(potL,Settings.potGain,capture=self.adcCap)
+            self.PotR = FilteredADC(potR,Settings.potGain,capture=self.adcCap)
+        else :
+            self.adcCap = None
+            self.PotL = FilteredADC(potL,Settings.potGain)  # GPIO pin index in [26|27|28]
+            self.PotR = FilteredADC(potR,Settings.potGain)
+        # IBT-2 R_IS and L_IS, tied together.  see Settings.currentTrip
+        self.IsR = CurrentSense(self.MotR,pins['current'],capture=self.adcCap,
+                                gain=Settings.currentGain)
         
         # use this switch only in analog override mode
-        self.DeadmanSwitch  = Pin(17, Pin.IN, Pin.PULL_UP) # active LOW
+        self.DeadmanSwitch  = Pin(pins['deadman'], Pin.IN, Pin.PULL_UP) # active LOW
+
+        self.led2 = Pin(pins['led2'],Pin.OUT)  # extra diagnostic LED
 
-        self.led2 = Pin(9,Pin.OUT)  # extra diagnostic LED
+    def encoders(self) : # made on first use.  A,B pins, PIO state machine
+        if self.EncL is None :
+            from Encoder import QuadEncoder
+            a,b,sm = self.pins['encL']
+            self.EncL = QuadEncoder(a,b,sm=sm)
+            a,b,sm = self.pins['encR']
+            self.EncR = QuadEncoder(a,b,sm=sm)
 
-HW = TankDriveHardware()
+    def enable(self) : # bridge enables, held low by SafeBoot.  PWMs are at 0 now
+        for side in ('L','R') :
+            for p in self.pins[side].get('enable',()) :
+                Pin(p,Pin.OUT,1)
+
+HW = TankDriveHardware(loadPinMap())
+HW.enable()
 HW.led.value(1)  # show HW initialized
 
 ########################### Pico board pin to GPIO index:
@@ -68,36 +282,8 @@ HW.led.value(1)  # show HW initialized
 # Pi Pico ADC on GP26, GP27, GP28, board pin 31,32,34, == ADC0,ADC1,ADC2
 
         
-class TankDriveSettings() :
-    def __init__(self) :
-       self.DeadmanTime = 20000  # ms without command before emergencyStop()
-       self.tFlash = 2000  # LED13 status flash period (ms)
-
-    def load(self,fnam="TankDrive.dat") :
-        print("load not yet implemented")
-
-    def save(self,fnam="TankDrive.dat") :
-        print("save not yet implemented")
-
-    def print(self) :
-        #analogDesc  = "UART"
-        #stoppedDesc = "Running"
-        #AnalogOverride = not AnalogOverrideSwitch.value() # active LOW
-        #if self.stopped   : stoppedDesc = "Stopped"
-        #if AnalogOverride :  analogDesc = "Analog"
-        #print("Mode",analogDesc,stoppedDesc,
-        #      "\tTimeout",self.DeadmanTime,
-        #      "\tFlash_Period",self.tFlash)
-        print("\tTimeout",self.DeadmanTime,
-              "\tFlash_Period",self.tFlash)
-        
-# load previous state from file
-Settings = TankDriveSettings()
-#State.load()
-Settings.print()
 
 import time
-#import _thread
 
 class TankDriveState() :
     def __init__(self) :
@@ -106,21 +292,37 @@ class TankDriveState() :
 
         # Diagnostics stop after a few messages so that they can remain
         # in production code, but not mess up performance in actual use
-        self.nMsg = 9   # print this many messages before shutting down
+        self.dbg = Diag("TD",9)   # print this many messages before shutting down
         self.prevCommandTime = 0  # for digital command deadman timeout
         self.deadmanClosed = True
         self.tFlash = 0 # heartbeat
-        #self.lockMotorUpdate = _thread.allocate_lock()
-        
-    def diag(self,items) : # print diagnostic message from tupple
-        if self.nMsg <= 0 :
-            return
-        self.nMsg -= 1
-        if isinstance(items, tuple) :
-            print(time.ticks_ms(),"\t".join([str(a) for a in items]))
-            return
-        print(time.ticks_ms(),items)
 
+        # motor loop, when Settings.motorLoop
+        self.slot = TargetSlot()  # targets, command side to motor loop
+        self.loopStats = LoopStats()
+        self.tLoop = 0         # ticks_us next pass is due
+        self.loopRun = False   # core 1 loop runs while set
+        self.nSpeed = 0        # motor loop passes to next speed control tick
+        self.senseI = False    # motor loop checks current
+        self.prof = None       # Profilers, with _PROF.  see makeProfilers()
+        self.profM = None
+        self.tReady = 0        # ticks_us, boot done.  see 'b'
+        self.tFirst = 0        # ticks_us, first command applied
+        self.saveDue = False   # settings changed, not yet saved
+        self.tSave = 0         # ticks_ms to save them, see settingsChanged()
+        self.tasks = None      # Runtime, with Settings.tasks
+        self.wdt = None        # Watchdog, with Settings.wdt
+        self.wdtResets = 0     # watchdog resets, see watchdogFault()
+        self.tHost = 0         # ticks_ms, last valid command
+        self.nStop = 0         # motor stops so far.  One ends playback
+        self.play = None       # Playback, made by macro()
+        self.nPlay = 0         # nStop when playback started
+        self.recording = False # T,S,L,R record keyframes
+
+        # targets received, not yet sent to the motors.  see flushTargets()
+        self.pend = 0  # SET_L | SET_R
+        self.vL = 0
+        self.vR = 0
 
 State = TankDriveState()
 
@@ -129,43 +331,144 @@ def updateAnalogFilters() :
     HW.PotR.update()
 
 # extract command code char (as int), and decode value in command word
+# w is a view into the parser's buffer, decoded in place without a str
+# val is None if not a valid number.  Such a command must be ignored,
+# since defaulting a motor command to 0 would slam the brakes mid-drive.
+# A bare command, like X, has no value to garble, and gets 0.
 def parseCommand(w) :
     iCmd = w[0]
-    bVal = w[1:]
-    sVal = bVal.decode()
-    #print("CommandWord",chr(iCmd),sVal)
-    try :
-        val = int(sVal)
-    except :
-        State.diag((bVal,"not a valid numeric parameter, defaulted to 0"))
-        val = 0
+    #print("CommandWord",chr(iCmd),bytes(w[1:]))
+    if len(w) == 1 : return iCmd,0
+    val = parseInt(w,1)
+    if val is None :
+        trace.log(TR_BADCMD,iCmd)
+        if _DIAG and State.dbg.on(ERR) :
+            State.dbg.msg(bytes(w),"not a valid numeric parameter, ignored")
     return iCmd,val
 
 def emergencyStop(msg) :
     print(time.ticks_ms(),msg)
-    HW.MotR.emergencyStop()
-    HW.MotL.emergencyStop()
+    HW.DrvR.emergencyStop()
+    HW.DrvL.emergencyStop()
     State.stopped = True
-    
+    State.nStop += 1
+
+# Motor commands from the command side.  With a motor loop running they
+# are handed to it through State.slot, and it applies them.  Otherwise
+# they are applied here and now.
+def driveL(v) :
+    if Settings.motorLoop : State.slot.post(SET_L,v)
+    else :
+        HW.DrvL.setTarget(v)
+        State.stopped = False
+        if _PROF : State.prof.mark(_P_SETL)
+
+def driveR(v) :
+    if Settings.motorLoop : State.slot.post(SET_R,0,v)
+    else :
+        HW.DrvR.setTarget(v)
+        State.stopped = False
+        if _PROF : State.prof.mark(_P_SETR)
+
+def driveLR(vL,vR) :
+    if Settings.motorLoop : State.slot.post(SET_L | SET_R,vL,vR)
+    else :
+        HW.pwmGroup.hold()  # both sides change in the same PWM period
+        HW.DrvL.setTarget(vL)
+        if _PROF : State.prof.mark(_P_SETL)
+        HW.DrvR.setTarget(vR)
+        HW.pwmGroup.commit()
+        State.stopped = False
+        if _PROF : State.prof.mark(_P_SETR)
+
+def stopMotors() :
+    State.nStop += 1
+    if Settings.motorLoop : State.slot.post(STOP)
+    else :
+        HW.DrvL.stop()
+        HW.DrvR.stop()
+        State.stopped = True
+
+def keepAlive(t) : # a valid command arrived.  reset deadman timeout
+    State.tHost = t
+    if Settings.motorLoop : State.slot.post(0)
+    else : State.prevCommandTime = t
+
+# Coalescing.  L, R and drive frames only set targets, and flushTargets()
+# sets each motor once, after processCommands() has drained every word
+# received.  A burst of commands then costs one setSpeed() per motor,
+# not one per word, each of which could start a reversal, or print.
+# Stops are never coalesced : they go straight through, in order, and
+# drop any target received before them.
+def targetL(v) :
+    State.vL = v
+    State.pend |= SET_L
+
+def targetR(v) :
+    State.vR = v
+    State.pend |= SET_R
+
+def targetLR(vL,vR) :
+    State.vL = vL
+    State.vR = vR
+    State.pend = SET_L | SET_R
+
+def stopNow() :
+    State.pend = 0
+    stopMotors()
+
+def flushTargets() :
+    p = State.pend
+    if not p : return
+    State.pend = 0
+    if State.play is not None and State.play.on : playEnd()  # host drives
+    if   p == (SET_L | SET_R) : driveLR(State.vL,State.vR)
+    elif p & SET_L            : driveL(State.vL)
+    else                      : driveR(State.vR)
+
 def updateMotorSpeedFromAnalog() :
-    HW.MotL.setSpeed(HW.PotL.read())
-    HW.MotR.setSpeed(HW.PotR.read())
-    State.stopped = False
-    
-def deadmanSwitchCB(pin) :
+    driveLR(HW.PotL.read(),HW.PotR.read())
+
+# Deadman switch.  The IRQ is hard, so the bridges go off as soon as
+# the switch opens, even with a long soft callback running.  It only
+# zeroes the PWMs, which allocates nothing.  The stop proper, printing
+# and all, is deferred to the scheduler (see Deferred.py), or to the
+# motor loop, which owns the motors while it runs.  off() also drops
+# the drivers' pending restarts and dead-time steps, and marks them
+# stopped.  Until the stop, a motor loop pass already under way could
+# set a duty again, for at most one pass.
+def deadmanSwitchCB(pin) : # hard IRQ
     if not State.analogOverride :
         return # only used in analogOverride mode
-    if not State.stopped :
-         emergencyStop("Deadman switch open")
-         State.stopped = True
+    HW.MotL.off()
+    HW.MotR.off()
+    deadmanStop.fireCB(pin)
 
-HW.DeadmanSwitch.irq(deadmanSwitchCB, Pin.IRQ_RISING)
+def deadmanSwitchStop() : # deferred from deadmanSwitchCB()
+    if State.stopped : return
+    if Settings.motorLoop : State.slot.post(ESTOP)
+    else :
+        emergencyStop("Deadman switch open")
+        State.stopped = True
+
+deadmanStop = Deferred(deadmanSwitchStop)
+HW.DeadmanSwitch.irq(handler=deadmanSwitchCB, trigger=Pin.IRQ_RISING, hard=True)
+
+# Overcurrent, from HW.IsR's trip check on its hard Timer.  As above,
+# the PWMs only.  The motor loop's next HW.IsR.update() stops the rest
+def currentTripCB() : # hard IRQ
+    HW.MotL.off()
+    HW.MotR.off()
 
 ######################################################### Main loops
 
+# analog override updates.  Timer callbacks may be hard IRQs, so the
+# Timer only fires a Deferred, and driveLR() runs from the scheduler
+analogUpdate = Deferred(updateMotorSpeedFromAnalog)
+timAnalogUpdate = Timer()
+
 def initAnalogUpdate () :
-    #global AnalogReadingUpdate
-    timAnalogUpdate.init(period=50, mode=Timer.PERIODIC, callback=updateMotorSpeedFromAnalog)
+    timAnalogUpdate.init(period=_T_ANALOG, mode=Timer.PERIODIC, callback=analogUpdate.fireCB)
 
 print("AnalogOverride",State.analogOverride,"\tstopped",State.stopped)
 #print("AnalogOverrideSwitch.value",HW.AnalogOverrideSwitch.value())
@@ -184,6 +487,7 @@ def checkAnalogOverrideSwitch() :
             # switch just turned off
             print("Analog Override OFF")
             timAnalogUpdate.deinit()
+            analogUpdate.pending = False  # drop an update not run yet
             State.analogOverride = False
     else :
         print("Analog Override Switch ENGAGED")
@@ -193,49 +497,144 @@ def checkAnalogOverrideSwitch() :
             State.analogOverride = True
         updateMotorSpeedFromAnalog()
 
-def TankDriveUpdate(myTimer) :   # poll for commands
-    #checkAnalogOverrideSwitch()
-    t = time.ticks_ms()
+# ASCII command word, already parsed
+def applyCommand(cmd,val) :
+    trace.log(TR_CMD,cmd,val)
+    if _DIAG and State.dbg.on(INFO) : State.dbg.msg(" Cmd [",chr(cmd),val,"]")
+    if cmd == ord('d') :
+        HW.DrvL.show(val)
+        HW.DrvR.show(val)
+    elif cmd == ord('t') :  # post-mortem trace dump.  t1 also clears it
+        trace.dump()
+        if val : trace.clear()
+    elif cmd == ord('w') :  # command queue stats.  w1 also clears them
+        HW.cs.show()
+        if val : HW.cs.clearStats()
+    elif cmd == ord('i') :  # motor current stats.  i1 also clears them
+        HW.IsR.show("R")
+        if val : HW.IsR.clearStats()
+    elif cmd == ord('y') :  # telemetry every val ms.  y0 stops it
+        startTelemetry(val)
+        if _DIAG and State.dbg.on(INFO) : Telem.show()
+    elif cmd == ord('p') :  # stage profile.  p1 also clears it
+        showProfile(val)
+    elif cmd == ord('b') :  # boot timing, us since reset
+        print("boot us : safe",SafeBoot.tSafe,"\tready",State.tReady,
+              "\tfirst command",State.tFirst,"\treset cause",SafeBoot.resetCause,
+              "\twatchdog resets",State.wdtResets)
+    elif cmd == ord('h') :  # watchdog, tick durations.  h1 also clears them
+        if State.wdt is None : print("no watchdog.  see Settings.wdt")
+        else :
+            State.wdt.show()
+            if val : State.wdt.clear()
+    elif cmd == ord('j') :  # motor loop timing.  j1 also clears it
+        if State.tasks is not None : State.tasks.show(val)  # every task
+        else :
+            State.loopStats.show("motor loop")
+            if val : State.loopStats.clear()
+    elif cmd == ord('q') :  # deadman timeout, 11 .. _DEADMAN_MAX ms
+        if val > 10 :
+            Settings.DeadmanTime = min(val,_DEADMAN_MAX)
+            settingsChanged()
+        print("+ deadman timeout",Settings.DeadmanTime,"ms")
+    elif cmd == ord('k') :  # settings.  k1 saves now, k2 forgets saved
+        # flash writes stall both cores, so only with the motors stopped.
+        # k1 while running saves at the stop, k2 is refused
+        if val == 1 :
+            State.tSave = time.ticks_ms()
+            State.saveDue = True
+            saveSettings(State.tSave)
+            if State.saveDue : print("+ settings saved once stopped")
+        elif val == 2 :
+            if State.stopped :
+                State.saveDue = False
+                Settings.log.erase()
+            else : print("+ stop first to forget saved settings")
+        Settings.print()
+    elif cmd == ord('m') :  # macro playback and recording, see macroCommand()
+        macroCommand(val)
+    elif cmd == ord('T') or cmd == ord('S') :  # recording : next keyframe
+        recordKey(cmd,val)
+    elif State.recording and (cmd == ord('L') or cmd == ord('R')) :
+        recordSpeed(1 if cmd == ord('L') else 2,val)
+    else:
+        if State.analogOverride :
+            if _DIAG and State.dbg.on(INFO) :
+                State.dbg.msg(cmd,val,"ignored in Analog Override Mode")
+        else :
+            # convert speed commands from 8-bit speed to 16ish for Pico PWM
+            if   cmd == ord('L') : targetL(val*257)
+            elif cmd == ord('R') : targetR(val*257)
+            elif cmd == ord('X') : stopNow()
+            else :
+                #MotL.setSpeed(0,t)
+                #MotR.setSpeed(0,t)
+                if _DIAG and State.dbg.on(ERR) :
+                    State.dbg.msg("Cmd<",chr(cmd),val,"not recognized")
+
+# binary frame word from WordParser.  Sets both motors together
+def applyFrame(w) :
+    op = w[0]
+    if op == OP_STOP :
+        stopNow()
+    elif op == OP_DRIVE :
+        if State.analogOverride :
+            if _DIAG and State.dbg.on(INFO) :
+                State.dbg.msg("frame ignored in Analog Override Mode")
+            return
+        # frame speeds are signed 16-bit, PWM/2.  No 8-bit scaling
+        vL = int16(w,1) * 2
+        vR = int16(w,3) * 2
+        trace.log(TR_FRAME,vL,vR)
+        targetLR(vL,vR)
+    else :
+        if _DIAG and State.dbg.on(ERR) : State.dbg.msg("frame op",op,"not recognized")
+
+def processCommands(t) :  # apply every complete command received
+    alive = False
     while HW.cs.ready() :
+        if _PROF : State.prof.mark(_P_READY)
         HW.led.value(1) # processing command
-        State.prevCommandTime = t  # reset deadman timeout
-        cmd,val = parseCommand(HW.cs.next())
-        State.diag((" Cmd [",chr(cmd),val,"]"))
-        if cmd == ord('d') :
-            MotL.show(val)
-            MotR.show(val)
-        elif cmd == ord('q') :
-            if val > 10 : State.DeadmanTime = val
-            print("+ deadman timeout",val,"ms")
-        else:
-            if State.analogOverride :
-                State.diag((cmd,val,"ignored in Analog Override Mode"))
-            else :
-                # convert speed commands from 8-bit speed to 16ish for Pico PWM
-                if   cmd == ord('L') :
-                    HW.MotL.setSpeed(val*257)
-                    State.stopped = False
-                elif cmd == ord('R') :
-                    HW.MotR.setSpeed(val*257)
-                    State.stopped = False
-                elif cmd == ord('X') :
-                    HW.MotL.stop()
-                    HW.MotR.stop()
-                    State.stopped = True
-                else :
-                    #MotL.setSpeed(0,t)
-                    #MotR.setSpeed(0,t)
-                    State.diag(("Cmd<",chr(cmd),val,"not recognized"))
+        w = HW.cs.next()
+        if isFrame(w) :
+            if _PROF : State.prof.mark(_P_PARSE)
+            alive = True
+            applyFrame(w)
+        else :
+            cmd,val = parseCommand(w)
+            if _PROF : State.prof.mark(_P_PARSE)
+            if val is not None :  # never act on a garbled value
+                alive = True
+                applyCommand(cmd,val)
+        if not Settings.coalesce : flushTargets()
 
         HW.led.value(0) # done processing command
         State.tFlash = t # note that LED flashed
+        if _PROF : State.prof.mark(_P_APPLY)
+    if _PROF : State.prof.mark(_P_READY)  # the ready() that said no
+    if alive : keepAlive(t)  # reset deadman timeout
+    flushTargets()
+    if alive and not State.tFirst : State.tFirst = time.ticks_us()
 
+# Settings changed by commands are saved once they stop changing for
+# Settings.tSave ms, so a burst of tuning costs one flash write.  And
+# only with the motors stopped : a flash write stalls both cores
+def settingsChanged() :
+    State.tSave = time.ticks_add(time.ticks_ms(),Settings.tSave)
+    State.saveDue = True
+
+def saveSettings(t) : # from TankDriveUpdate
+    if State.saveDue and State.stopped and time.ticks_diff(t,State.tSave) >= 0 :
+        State.saveDue = False
+        Settings.save()
+
+def heartbeat(t) :
     # if no commands coming in, show some sign that polling loop is running
     if time.ticks_diff(t,Settings.tFlash) > State.tFlash :
         State.tFlash = t
         HW.led.toggle()
 
-
+def checkDeadman(t) :
     #if State.analogOverride :        # drive from analog inputs
     #    if not State.stopped :
             
@@ -247,27 +646,467 @@ def TankDriveUpdate(myTimer) :   # poll for commands
     #else : # digital command mode, check deadman
 #        if not State.stopped :
     if not (State.stopped or State.analogOverride) :
-        #State.diag("checking deadman timeout")
-        if time.ticks_diff(t,State.prevCommandTime) > Settings.DeadmanTime :
+        #State.dbg.msg("checking deadman timeout")
+        dt = time.ticks_diff(t,State.prevCommandTime)
+        if dt > Settings.DeadmanTime :
+            trace.log(TR_DEADMAN,dt)
             emergencyStop("Deadman command timeout")
             State.stopped = True
 
+def TankDriveUpdate(myTimer) :   # poll for commands
+    #checkAnalogOverrideSwitch()
+    t0 = time.ticks_us()
+    if _PROF : State.prof.begin()
+    deadmanStop.poll()  # if the scheduler queue was full
+    t = time.ticks_ms()
+    processCommands(t)
+    heartbeat(t)
+    if _PROF : State.prof.mark(_P_LED)
+    if not Settings.motorLoop :
+        checkDeadman(t)  # else the motor loop does
+    if _PROF :
+        State.prof.mark(_P_DEADMAN)
+        State.prof.end()
+    saveSettings(t)
+    if State.wdt is not None : State.wdt.done(_W_CMD,time.ticks_diff(time.ticks_us(),t0))
+
+# Event driven dispatch.  UART calls this when the line goes idle after
+# receiving, so a command is applied as soon as its delimiter arrives,
+# instead of waiting up to a whole poll period.  It is a soft IRQ,
+# run by the scheduler, so it does not pre-empt the Timer callbacks.
+def uartRxCB(uart) :
+    if _PROF : State.prof.begin()
+    processCommands(time.ticks_ms())
+    if _PROF : State.prof.end()
+
+######################################################### Profiler
+# With _PROF, where each tick's time goes, stage by stage.  'p' shows it
+
+def makeProfilers(tUpdate) : # tUpdate : command tick period, ms
+    from Profiler import Profiler
+    State.prof = Profiler("cmd",("ready","parse","apply","setL","setR",
+                                 "led","deadman"),tUpdate * 1000)
+    State.profM = Profiler("motor",("current","timers","targets","speed",
+                                    "tickL","tickR","commit","deadman"),
+                           Settings.tMotor * 1000)
+
+def showProfile(clear) :
+    if not _PROF :
+        print("profiler not built in.  see _PROF")
+        return
+    for P in (State.prof,State.profM) :
+        P.show()
+        if clear : P.clear()
+
+######################################################### Telemetry
+# A frame of state every Settings.tTelemetry ms, on the command UART.
+# Skipped, not waited for, while the UART is still sending the last one
+
+Telem = Telemetry(HW.cs.stream,Settings.telemetryFields)
+timTelemetry = Timer()
+
+def telemetryCB(tmr) :
+    t = time.ticks_ms()
+    T = Telem
+    if not T.begin(t) : return
+    L = HW.MotL
+    R = HW.MotR
+    T.put(I_CMD,L.req >> 1,R.req >> 1)
+    T.put(I_DUTY,L.currentSpeed() >> 1,R.currentSpeed() >> 1)
+    T.put(I_MODE,L.mode,R.mode)
+    T.put(I_POT,HW.PotL.v,HW.PotR.v)
+    T.put(I_DEADMAN,Settings.DeadmanTime - time.ticks_diff(t,State.prevCommandTime),
+          State.stopped)
+    ls = State.loopStats
+    T.put(I_LOOP,ls.sum // ls.n if ls.n else 0,ls.max)
+    T.put(I_QUEUE,HW.cs.count,HW.cs.dropped)
+    T.put(I_CURRENT,HW.IsR.now(),HW.IsR.mA(HW.IsR.peak))
+    if Settings.closedLoop : T.put(I_SPEED,HW.DrvL.speed >> 1,HW.DrvR.speed >> 1)
+    else                   : T.put(I_SPEED,0,0)
+    T.send()
+
+def startTelemetry(ms) : # 0 : off
+    Settings.tTelemetry = ms
+    if State.tasks is not None : State.tasks.period("telemetry",ms)
+    elif ms > 0 :
+        timTelemetry.init(period=ms, mode=Timer.PERIODIC, callback=telemetryCB)
+    else :
+        timTelemetry.deinit()
+
+######################################################### Playback
+# Macros : timed keyframes played back as drive targets (Playback.py)
+# every Settings.tPlay ms, from a Timer, or the playback task.  The
+# board drives itself, with nothing streamed.  Commands :
+#
+#    m3  record.  Clears the macro.  Then T<ms> adds a keyframe that
+#        ramps there over ms, S<ms> one that steps there after ms, and
+#        L,R set its speeds instead of driving.  m4 ends recording
+#    m1  play once, m2 loop, m0 stop playing, and the motors
+#    m5  save to MACRO_LOG, m6 load it, m7 show
+#
+# Playback is not a command : it does not reset the deadman.  With no
+# command from the host for Settings.DeadmanTime, playback stops, and
+# the motors.  Any stop (X, a stop frame, deadman, overcurrent), the
+# analog override, or a drive command from the host ends it too.
+
+MACRO_LOG = "TankDrive.mac"
+timPlay = Timer()
+
+def macro() : # State.play, made on first use
+    if State.play is None :
+        from Playback import Playback
+        State.play = Playback()
+    return State.play
+
+def playEvery(ms) : # 0 : off
+    if State.tasks is not None : State.tasks.period("playback",ms)
+    elif ms > 0 :
+        timPlay.init(period=ms, mode=Timer.PERIODIC, callback=playCB)
+    else :
+        timPlay.deinit()
+
+def playStart(loop) :
+    P = macro()
+    State.recording = False
+    if not P.start(time.ticks_ms(),loop) :
+        print("no macro to play.  m3 records one")
+        return
+    State.nPlay = State.nStop
+    State.pend = 0  # targets from the same batch : the macro drives now
+    playEvery(Settings.tPlay)
+    driveLR(P.vL * 2,P.vR * 2)
+
+def playEnd() :
+    State.play.stop()
+    playEvery(0)
+
+def playTick(t) :
+    P = State.play
+    if not P.on : return
+    if State.nStop != State.nPlay or State.analogOverride :
+        playEnd()  # stopped since it started, or the pots drive
+        return
+    dt = time.ticks_diff(t,State.tHost)
+    if dt > Settings.DeadmanTime :
+        playEnd()
+        trace.log(TR_DEADMAN,dt)
+        if Settings.motorLoop : State.slot.post(ESTOP)
+        else : emergencyStop("Deadman command timeout")
+        return
+    if P.tick(t) : driveLR(P.vL * 2,P.vR * 2)  # PWM/2 to PWM
+    if not P.on : playEvery(0)  # past the last keyframe
+
+def playCB(tmr) :
+    playTick(time.ticks_ms())
+
+def recordKey(cmd,val) : # T<ms> ramp, S<ms> step, to a new keyframe
+    if not State.recording :
+        if _DIAG and State.dbg.on(ERR) : State.dbg.msg(chr(cmd),val,"not recording.  m3 first")
+        return
+    if val < 0 or val > 32767 :
+        if _DIAG and State.dbg.on(ERR) : State.dbg.msg(chr(cmd),val,"ms out of range, ignored")
+        return
+    if not State.play.add(val if cmd == ord('T') else -val) :
+        print("macro full,",State.play.max,"keyframes")
+
+def recordSpeed(side,val) : # L or R while recording.  side 1 : L, 2 : R
+    if   val >  255 : val =  255
+    elif val < -255 : val = -255
+    State.play.set(side,(val * 257) >> 1)  # PWM/2, as drive frames
+
+def macroCommand(val) :
+    P = macro()
+    if val == 0 :
+        if P.on : playEnd()
+        State.recording = False
+        stopNow()
+    elif val == 1 or val == 2 :
+        playStart(val == 2)
+    elif val == 3 :
+        if P.on : playEnd()
+        P.clear()
+        State.recording = True
+    elif val == 4 :
+        State.recording = False
+        P.show()
+    elif val == 5 :  # a flash write stalls both cores
+        if State.stopped : RecordLog(MACRO_LOG).append(P.pack())
+        else : print("macro not saved while the motors run")
+    elif val == 6 :
+        if P.on : playEnd()
+        rec = RecordLog(MACRO_LOG).read()
+        if rec is None or not P.unpack(rec) : print("no macro in",MACRO_LOG)
+        P.show()
+    elif val == 7 :
+        P.show()
+    elif _DIAG and State.dbg.on(ERR) :
+        State.dbg.msg("m",val,"not recognized")
+
+######################################################### Motor loop
+# Settings.motorLoop 1 or 2 : a fixed-rate loop owns the motors.  It
+# applies the targets handed over in State.slot, runs the drivers' timed
+# steps and motion profiles, and checks the deadman.  On core 1, slow parsing or printing on
+# core 0 can not delay a motor update or an emergency stop.
+
+def applyTargets(t) :
+    op = State.slot.take()
+    if not op : return
+    State.prevCommandTime = t  # any post means a command arrived
+    if op & ESTOP :
+        emergencyStop("Deadman switch open")
+    elif op & STOP :
+        HW.DrvL.stop()
+        HW.DrvR.stop()
+        State.stopped = True
+    if op & SET_L :
+        HW.DrvL.setTarget(State.slot.vL)
+        State.stopped = False
+    if op & SET_R :
+        HW.DrvR.setTarget(State.slot.vR)
+        State.stopped = False
+
+def motorTick(t) :
+    t0 = time.ticks_us()
+    if _PROF : State.profM.begin()
+    if State.senseI and HW.IsR.update() :  # first : trip as soon as possible
+        emergencyStop("Overcurrent R")
+    if _PROF : State.profM.mark(_M_CURRENT)
+    runDue(time.ticks_us())  # LoopTimer steps, on core 1
+    if _PROF : State.profM.mark(_M_TIMERS)
+    HW.pwmGroup.hold()
+    applyTargets(t)
+    if _PROF : State.profM.mark(_M_TARGETS)
+    if Settings.closedLoop : speedTick()
+    if _PROF : State.profM.mark(_M_SPEED)
+    HW.MotL.tick()  # motion profiles
+    if _PROF : State.profM.mark(_M_TICKL)
+    HW.MotR.tick()
+    if _PROF : State.profM.mark(_M_TICKR)
+    HW.pwmGroup.commit()  # L and R duty, together
+    if _PROF : State.profM.mark(_M_COMMIT)
+    checkDeadman(t)
+    if _PROF :
+        State.profM.mark(_M_DEADMAN)
+        State.profM.end()
+    if State.wdt is not None : State.wdt.done(_W_MOTOR,time.ticks_diff(time.ticks_us(),t0))
+
+def speedTick() : # every Settings.tSpeed ms
+    State.nSpeed -= 1
+    if State.nSpeed > 0 : return
+    State.nSpeed = Settings.tSpeed // Settings.tMotor
+    HW.DrvL.tick()
+    HW.DrvR.tick()
+
+def loopLate(t,period) : # note lateness of the pass starting at ticks_us t
+    late = time.ticks_diff(t,State.tLoop)
+    if (late < 0) or (late >= period) :
+        State.tLoop = t  # overran, or Timer caught up.  follow it
+        if late < 0 : late = 0
+    State.loopStats.add(late,period)
+    State.tLoop = time.ticks_add(State.tLoop,period)
+
+def motorTimerCB(tmr) :  # Settings.motorLoop == 1
+    loopLate(time.ticks_us(),Settings.tMotor * 1000)
+    motorTick(time.ticks_ms())
+
+def motorLoop() :  # Settings.motorLoop == 2.  runs on core 1
+    period = Settings.tMotor * 1000
+    State.tLoop = time.ticks_us()
+    while State.loopRun :
+        loopLate(time.ticks_us(),period)
+        motorTick(time.ticks_ms())
+        dt = time.ticks_diff(State.tLoop,time.ticks_us())
+        if dt > 0 : time.sleep_us(dt)
+
+def startMotorLoop() : # returns its Timer, or None on core 1
+    if Settings.motorLoop == 2 :
+        try :
+            import _thread
+            # core 1 owns the motors.  Their timed steps must run there
+            # too, not in Timer callbacks on core 0
+            for m in (HW.MotL,HW.MotR) :
+                m.useTimer(LoopTimer)
+                m.stop()
+            State.loopRun = True
+            _thread.start_new_thread(motorLoop,())
+            return None
+        except ImportError :
+            print("no _thread.  Motor loop on a Timer")
+            Settings.motorLoop = 1
+    State.tLoop = time.ticks_add(time.ticks_us(),Settings.tMotor * 1000)
+    return Timer(period=Settings.tMotor, mode=Timer.PERIODIC,
+                 callback=motorTimerCB)
+
+######################################################### Tasks
+# Settings.tasks : asyncio tasks (Runtime.py) instead of the Timers and
+# UART IRQ, one per concern.  Highest priority first :
+#
+#    motor      Settings.tMotor   motorTick(), drivers' timed steps too
+#    deadman    Settings.tSlow    command timeout, and a deadman stop
+#                                 the scheduler could not take
+#    commands   Settings.tCmd     processCommands()
+#    playback   Settings.tPlay    while a macro plays, else paused
+#    analog     _T_ANALOG         analog override switch, pots while on
+#    telemetry  Settings.tTelemetry, paused at 0
+#    led        Settings.tSlow    heartbeat, saving settings
+#
+# The motor task is the motor loop, so the drivers' restart and
+# dead-time steps are LoopTimers it runs.  With motorLoop 2 the loop
+# stays on core 1 instead.  The deadman switch keeps its hard IRQ : an
+# open switch must not wait for a task.  main.py runs the tasks, see
+# runTasks().  'j' shows each one's lag.
+
+def deadmanTask(t) :
+    deadmanStop.poll()
+    checkDeadman(t)
+
+def commandTask(t) :
+    t0 = time.ticks_us()
+    if _PROF : State.prof.begin()
+    processCommands(t)
+    if _PROF : State.prof.end()
+    if State.wdt is not None : State.wdt.done(_W_CMD,time.ticks_diff(time.ticks_us(),t0))
+
+def analogTask(t) : # override switch, active LOW.  pots while it is closed
+    if HW.AnalogOverrideSwitch.value() :
+        if State.analogOverride :
+            print("Analog Override OFF")
+            State.analogOverride = False
+        return
+    if not State.analogOverride :
+        print("Analog Override Enabled")
+        State.analogOverride = True
+    updateMotorSpeedFromAnalog()
+
+def ledTask(t) :
+    heartbeat(t)
+    saveSettings(t)
+
+def startTasks() : # Settings.tasks.  makes State.tasks
+    from Runtime import Runtime
+    if not Settings.motorLoop : Settings.motorLoop = 1
+    if Settings.motorLoop == 2 :
+        tm = startMotorLoop()  # on core 1.  With no _thread, a Timer,
+        if tm is not None : tm.deinit()  # and motorLoop 1 : the task then
+    rt = Runtime()
+    if Settings.motorLoop == 1 :
+        for m in (HW.MotL,HW.MotR) :
+            m.useTimer(LoopTimer)
+            m.stop()
+        rt.every("motor",Settings.tMotor,motorTick,5,State.loopStats)
+    rt.every("deadman",Settings.tSlow,deadmanTask,4)
+    rt.every("commands",Settings.tCmd,commandTask,3)
+    rt.every("analog",_T_ANALOG,analogTask,2)
+    rt.every("playback",0,playTick,3)  # runs while a macro plays
+    rt.every("telemetry",Settings.tTelemetry,telemetryCB,1)
+    rt.every("led",Settings.tSlow,ledTask,0)
+    State.tasks = rt
+
+def runTasks() : # from main.py.  returns once State.tasks.stop()
+    State.tasks.run()
+
+######################################################### Watchdog
+# Settings.wdt : machine.WDT, fed by Watchdog.py once the command tick,
+# and the motor loop if there is one, have each ended within their
+# periods.  A hang, a tick that stopped running, or one always over
+# its period, and the board resets.  'h' shows tick durations.
+
+FAULT_LOG = "TankDrive.flt"  # watchdog resets so far, kept across resets
+
+def startWatchdog() :
+    from Watchdog import Watchdog
+    if Settings.tasks : tCmd = Settings.tCmd
+    elif eventDriven  : tCmd = Settings.tSlow
+    else              : tCmd = Settings.tPoll
+    names = ["command"]
+    budgets = [tCmd * 1000]  # us, a tick within its period
+    if Settings.motorLoop :
+        names.append("motor")
+        budgets.append(Settings.tMotor * 1000)
+    timeout = Settings.wdt
+    if timeout < 3 * tCmd :  # a late tick, then one over budget
+        timeout = 3 * tCmd
+        print("watchdog timeout",Settings.wdt,"too short for",tCmd,"ms command tick.  Using",timeout)
+    State.wdt = Watchdog(timeout,names,budgets)
+
+# Reset by the watchdog.  SafeBoot.py has the bridges off already.
+# Brake, stay stopped until a command, and count it in FAULT_LOG
+def watchdogFault() :
+    log = RecordLog(FAULT_LOG,256)
+    rec = log.read()
+    n = unpack('<H',rec)[0] + 1 if rec is not None and len(rec) == 2 else 1
+    log.append(pack('<H',n))
+    State.wdtResets = n
+    HW.MotL.stop()
+    HW.MotR.stop()
+    State.stopped = True
+    trace.log(TR_WDT,n)
+    print("watchdog reset, motors braked.",n,"watchdog resets so far")
+
 ###################################################### Launch main loop(s):
-#timMotorUpdate = Timer(period=31, mode=Timer.PERIODIC,callback=updateMotors)
 State.prevCommandTime = time.ticks_ms()
-timTankDrive   = Timer(period=50*2, mode=Timer.PERIODIC,callback=TankDriveUpdate)
+State.tHost = State.prevCommandTime
+if SafeBoot.resetCause == WDT_RESET :
+    watchdogFault()
+if Settings.syncPWM :
+    HW.MotL.syncPWM(HW.pwmGroup)
+    HW.MotR.syncPWM(HW.pwmGroup)
+    if not HW.pwmGroup.sameFreq() :
+        print("syncPWM : L and R PWM freq differ, so duties can still latch",
+              "a PWM period apart.  Set drvL, drvR freq the same")
+    HW.pwmGroup.align()
+if Settings.tAccel > 0 :
+    for m in (HW.MotL,HW.MotR) :
+        m.setProfile(Settings.tMotor,Settings.tAccel,Settings.tDecel,Settings.tJerk)
+    if not Settings.motorLoop : Settings.motorLoop = 1
+if Settings.currentTrip or Settings.currentLimit :
+    HW.IsR.setTrip(Settings.currentTrip)
+    HW.IsR.setLimit(Settings.currentLimit)
+    if Settings.currentTrip and HW.adcCap is not None :
+        HW.IsR.startTrip(currentTripCB)  # within a PWM period
+    State.senseI = True
+    if not Settings.motorLoop : Settings.motorLoop = 1
+if Settings.closedLoop :
+    from SpeedControl import SpeedControl
+    HW.encoders()
+    kp,ki,kd,kff = Settings.speedPID
+    HW.DrvL = SpeedControl(HW.MotL,HW.EncL,Settings.fullCps,Settings.tSpeed,kp,ki,kd,kff)
+    HW.DrvR = SpeedControl(HW.MotR,HW.EncR,Settings.fullCps,Settings.tSpeed,kp,ki,kd,kff)
+    if not Settings.motorLoop : Settings.motorLoop = 1
+eventDriven = Settings.eventDispatch and hasattr(UART,'IRQ_RXIDLE') and not Settings.tasks
+if _PROF :
+    if Settings.tasks : makeProfilers(Settings.tCmd)
+    else : makeProfilers(Settings.tSlow if eventDriven else Settings.tPoll)
+if Settings.tasks :
+    startTasks()  # no Timers.  main.py runs the tasks
+else :
+    if Settings.motorLoop :
+        timMotor = startMotorLoop()
+    if Settings.tTelemetry > 0 :
+        startTelemetry(Settings.tTelemetry)
+    if eventDriven :
+        HW.cs.stream.irq(handler=uartRxCB, trigger=UART.IRQ_RXIDLE)
+        # slow tick still drains the parser, in case an RX IRQ was missed,
+        # but is mostly for heartbeat and deadman
+        timTankDrive = Timer(period=Settings.tSlow, mode=Timer.PERIODIC,
+                             callback=TankDriveUpdate)
+    else :  # UART RX IRQ not available in older firmware
+        timTankDrive = Timer(period=Settings.tPoll, mode=Timer.PERIODIC,
+                             callback=TankDriveUpdate)
+if Settings.wdt > 0 :
+    startWatchdog()
+State.tReady = time.ticks_us()
+print("boot us : safe",SafeBoot.tSafe,"\tready",State.tReady)
 ###########################################################################
 
 # debug :
 def G(vL,vR) : # set motor speeds from console
     #t = time.ticks_ms()
     print('G',vL,vR)
-    HW.MotR.setSpeed(vR)
-    HW.MotL.setSpeed(vL)
+    driveLR(vL,vR)
 def X() : # stop
     State.prevCommandTime -= Settings.DeadmanTime # trigger deadman too
-    HW.MotR.stop()
-    HW.MotL.stop()
+    stopMotors()
 
 #HW.led.toggle()
 #TankDriveUpdate()
@@ -276,11 +1115,9 @@ def X() : # stop
 #checkMotors()
 
 #HW.MotL.show(999)
-#State.nMsg = 999
-#time.sleep_ms(3000)
-#G(65500,0)
-#time.sleep_ms(2000)
-#G(-44000,0)
+#State.dbg.n = 999
+# drive sequences are macros, played without blocking.  e.g. over UART :
+#   m3 S0 L255 S2000 L-171 S2000 L0 m4 m1
 
 # $Log: TankDrive.py,v $
 # Revision 1.3  2022/06/09 15:43:36  aaron
@@ -0,0 +1,128 @@
+#
+# Binary telemetry frames, streamed back over the command UART.
+#
+#    SYNC seq mask_lo mask_hi  t0 t1 t2 t3  field... crc8
+#
+# SYNC is 0xA5, as in command frames (see WordParser.py).  seq counts
+# frames sent, mod 256, so the host sees gaps.  mask says which fields
+# follow, in bit order.  t is ticks_ms.  Every field is two 16-bit
+# values, little-endian, signed or not by field (FIELDS).  crc8 (poly
+# 0x07) covers seq..the last field.  For a given mask the frame size is
+# fixed, 9 + 4 * fields bytes.
+#
+# The frame is packed with struct.pack_into() into a buffer made once,
+# by setFields(), so sending allocates nothing.  begin() returns False,
+# and the frame is skipped, if the UART has not finished sending the
+# last one : a slow or stalled link loses frames, and never blocks the
+# caller.
+#
+#   T = Telemetry(uart,F_CMD | F_DUTY)
+#   if T.begin(time.ticks_ms()) :
+#       T.put(I_CMD,vL,vR) ...
+#       T.send()
+#
+# tools/DecodeTelemetry.py turns a captured stream into CSV.
+
+from struct import pack_into
+from WordParser import SYNC,crc8
+
+# field index, put() first argument.  Mask bit is 1 << index
+I_CMD     = 0  # duty asked for, L,R.  PWM/2
+I_DUTY    = 1  # duty applied, L,R.  PWM/2
+I_MODE    = 2  # MotorDrive mode, L,R
+I_POT     = 3  # filtered pot ADC, L,R
+I_DEADMAN = 4  # ms before deadman timeout, stopped flag
+I_LOOP    = 5  # motor loop late us, mean,max
+I_QUEUE   = 6  # command words queued, dropped
+I_CURRENT = 7  # IBT-2 current mA, filtered,peak
+I_SPEED   = 8  # closed loop wheel speed L,R.  PWM/2
+
+# name pair, signed
+FIELDS = ((("cmdL","cmdR"),True),
+          (("dutyL","dutyR"),True),
+          (("modeL","modeR"),False),
+          (("potL","potR"),False),
+          (("deadman","stopped"),True),
+          (("lateMean","lateMax"),False),
+          (("queued","dropped"),False),
+          (("current","peak"),False),
+          (("speedL","speedR"),True))
+N_FIELDS = len(FIELDS)
+
+F_CMD     = 1 << I_CMD
+F_DUTY    = 1 << I_DUTY
+F_MODE    = 1 << I_MODE
+F_POT     = 1 << I_POT
+F_DEADMAN = 1 << I_DEADMAN
+F_LOOP    = 1 << I_LOOP
+F_QUEUE   = 1 << I_QUEUE
+F_CURRENT = 1 << I_CURRENT
+F_SPEED   = 1 << I_SPEED
+F_ALL     = (1 << N_FIELDS) - 1
+
+HEAD_FMT = '<BBHI'
+HEAD_LEN = 8
+
+def frameLen(mask) :
+    n = 0
+    for i in range(N_FIELDS) :
+        if mask & (1 << i) : n += 1
+    return HEAD_LEN + 4 * n + 1
+
+class Telemetry() :
+    def __init__(self,stream,fields=F_ALL) :
+        self.stream = stream
+        self.seq = 0
+        self.sent = 0
+        self.skipped = 0   # link still busy with the last frame
+        self.busy = getattr(stream,'txdone',None)
+        self.off = [-1] * N_FIELDS  # field offsets in buf, -1 : not sent
+        self.fmt = ['<hh' if FIELDS[i][1] else '<HH' for i in range(N_FIELDS)]
+        self.setFields(fields)
+
+    def setFields(self,mask) :
+        mask &= F_ALL
+        self.mask = mask
+        o = HEAD_LEN
+        for i in range(N_FIELDS) :
+            if mask & (1 << i) :
+                self.off[i] = o
+                o += 4
+            else :
+                self.off[i] = -1
+        self.n = o + 1
+        self.buf = bytearray(self.n)
+        self.body = memoryview(self.buf)[1:]  # crc covers from seq
+
+    def begin(self,t) : # start a frame at ticks_ms t.  False : skip it
+        if (self.busy is not None) and not self.busy() :
+            self.skipped += 1
+            return False
+        pack_into(HEAD_FMT,self.buf,0,SYNC,self.seq,self.mask,t & 0x3FFFFFFF)
+        return True
+
+    def put(self,i,a,b) : # field i values.  clamped to 16 bits
+        o = self.off[i]
+        if o < 0 : return
+        if FIELDS[i][1] :
+            if a >  32767 : a =  32767
+            elif a < -32768 : a = -32768
+            if b >  32767 : b =  32767
+            elif b < -32768 : b = -32768
+        else :
+            if a > 65535 : a = 65535
+            elif a < 0   : a = 0
+            if b > 65535 : b = 65535
+            elif b < 0   : b = 0
+        pack_into(self.fmt[i],self.buf,o,a,b)
+
+    def send(self) :
+        n = self.n
+        self.buf[n - 1] = crc8(self.body,n - 2)
+        self.stream.write(self.buf)
+        self.seq = (self.seq + 1) & 0xFF
+        self.sent += 1
+
+    def show(self) :
+        print("telemetry frames sent",self.sent,"\tskipped",self.skipped,
+              "\tbytes",self.n,"\tfields",hex(self.mask))
@@ -0,0 +1,71 @@
+#
+# Hardware watchdog, fed only while the control ticks keep up.
+#
+# Each tick that must stay alive, e.g. the command tick and the motor
+# loop, calls done(i,us) at its end, with how long it took.  Within its
+# budget, it checks in.  Once every tick has checked in, the WDT is fed
+# and they start over.  A tick over budget does not check in : it is
+# counted, and traced (TR_SLOW).  So the WDT is fed only as often as the
+# slowest tick keeps within budget.  A tick that hangs, or that stops
+# running, e.g. its callback raised, or that is slow every time, lets
+# the WDT reset the board.  Its GPIOs go back to inputs with pull-downs,
+# bridges off, and SafeBoot.py drives them low.
+#
+# Each tick writes only its own check-in.  The one that completes the
+# set clears them all, so with ticks on both cores a check-in landing
+# just as they are cleared can at worst be counted toward the next feed.
+# done() allocates nothing.
+
+from machine import WDT
+from array import array
+import time
+from Diag import trace,TR_SLOW
+
+WDT_MAX = 8388  # ms, longest RP2040 timeout
+
+class Watchdog() :
+    def __init__(self,timeout,names,budgets) : # ms.  per tick : name, us
+        if timeout > WDT_MAX : timeout = WDT_MAX
+        self.timeout = timeout
+        self.names = names
+        n = len(names)
+        self.budget = array('i',budgets)  # us
+        self.ok = array('b',[0] * n)      # checked in since the last feed
+        self.worst = array('i',[0] * n)   # us, longest tick
+        self.slow = array('i',[0] * n)    # ticks over budget
+        self.feeds = 0
+        self.gap = 0                      # ms, longest between feeds
+        self.tFeed = time.ticks_ms()
+        self.wdt = WDT(timeout=timeout)   # can not be stopped once started
+
+    def done(self,i,us) : # tick i ended, after us
+        if us > self.worst[i] : self.worst[i] = us
+        if us > self.budget[i] :
+            self.slow[i] += 1
+            trace.log(TR_SLOW,i,us)
+            return
+        ok = self.ok
+        ok[i] = 1
+        for k in range(len(ok)) :
+            if not ok[k] : return
+        self.wdt.feed()
+        for k in range(len(ok)) : ok[k] = 0
+        self.feeds += 1
+        t = time.ticks_ms()
+        dt = time.ticks_diff(t,self.tFeed)
+        if dt > self.gap : self.gap = dt
+        self.tFeed = t
+
+    def clear(self) :
+        for i in range(len(self.names)) :
+            self.worst[i] = 0
+            self.slow[i] = 0
+        self.feeds = 0
+        self.gap = 0
+
+    def show(self) :
+        print("watchdog timeout ms",self.timeout,"\tfeeds",self.feeds,
+              "\tlongest ms between",self.gap)
+        for i in range(len(self.names)) :
+            print("\t",self.names[i],"budget us",self.budget[i],
+                  "\tworst",self.worst[i],"\tover budget",self.slow[i])
@@ -1,6 +1,36 @@
+#
 # Parse whitespace delimited ASCII commands coming in on an input stream.
 #
 # Constructed with the stream to parse
+#
+# New bytes are pulled from the stream with readinto() into a preallocated
+# receive buffer, and scanned for delimiters in place.  Completed words are
+# kept in a fixed-capacity ring of word slots, so that once constructed,
+# parsing does not allocate from the heap.  This keeps GC pauses out of the
+# control loop Timer callbacks.
+#
+# next() returns a memoryview of the word.  It is only valid until the
+# following call to next(), so copy it (bytes(w)) if it must be kept.
+#
+# Compact binary frames may be mixed into the same stream :
+#
+#    SYNC  op  L_lo L_hi  R_lo R_hi  seq  crc8
+#
+# SYNC (0xA5) is not printable, so it is never part of an ASCII word.
+# L and R are signed 16-bit, little-endian.  crc8 (poly 0x07) covers op..seq.
+# A good frame is queued as a 6 byte word op,L_lo,L_hi,R_lo,R_hi,seq.
+# op is below ' ', so isFrame() tells frames and ASCII words apart.
+# seq is only counted : gaps as lostFrames, repeats as dupFrames.  A
+# repeated frame is still queued, e.g. a host re-sending a STOP, since
+# applying a drive frame twice does no harm and dropping one does.
+#
+# When the ring is full, policy says what happens to the next word :
+#    DROP_NEWEST  discard it (default)
+#    DROP_OLDEST  discard the oldest queued word to make room
+#    SIGNAL       discard nothing.  Stop reading the stream, leaving its
+#                 bytes in the UART buffer, until next() frees a slot.
+#                 stalls counts the times this happened
+# enqueued, dropped and highWater tell when the link outruns the reader.
 
 #from machine import Pin,UART
 #from machine import UART
@@ -15,6 +45,59 @@ def asc2int(a) :
 # A few convenient constants
 iSPC = asc2int(b' ')
 iTLD = asc2int(b'~')
+iZRO = asc2int(b'0')
+iNIN = asc2int(b'9')
+iMIN = asc2int(b'-')
+iPLS = asc2int(b'+')
+
+# binary frame constants
+SYNC = 0xA5
+OP_DRIVE = 1   # set both motors, L and R in frame
+OP_STOP  = 2   # stop both motors
+FRAME_LEN  = 8 # SYNC through crc
+FRAME_BODY = 7 # bytes after SYNC
+FRAME_WORD = 6 # queued word, op through seq
+
+# overflow policy
+DROP_NEWEST = 0
+DROP_OLDEST = 1
+SIGNAL      = 2
+
+def _crc8Table() :  # CRC-8, poly 0x07, one table lookup per byte
+    t = bytearray(256)
+    for i in range(256) :
+        c = i
+        for j in range(8) :
+            if c & 0x80 : c = ((c << 1) ^ 0x07) & 0xFF
+            else        : c = (c << 1) & 0xFF
+        t[i] = c
+    return bytes(t)
+CRC8 = _crc8Table()
+
+def crc8(buf,n,crc=0) :
+    for k in range(n) :
+        crc = CRC8[crc ^ buf[k]]
+    return crc
+
+def isFrame(w) :  # True if word came from a binary frame
+    return w[0] < iSPC
+
+def int16(w,k) :  # signed little-endian 16-bit value at w[k]
+    v = w[k] | (w[k+1] << 8)
+    if v & 0x8000 : return v - 0x10000
+    return v
+
+# fill buf[0:FRAME_LEN] with a frame.  Mostly for host-side tools
+def packFrame(buf,op,vL,vR,seq) :
+    buf[0] = SYNC
+    buf[1] = op
+    buf[2] = vL & 0xFF
+    buf[3] = (vL >> 8) & 0xFF
+    buf[4] = vR & 0xFF
+    buf[5] = (vR >> 8) & 0xFF
+    buf[6] = seq & 0xFF
+    buf[7] = crc8(memoryview(buf)[1:],6)
+    return buf
 
 # consider anything not a printable character as whitespace
 def isWhitespace(b) : # works for whitespace in byte
@@ -23,82 +106,193 @@ def isWhitespace(b) : # works for whitespace in byte
         return True
     return False
 
-
-def cleanWhitespace(buf) :
-    #print('cleaning:',type(buf),buf,'<')
-    x = bytearray(buf)
-    #print('copied',type(x),x,'<')
-    n = len(x)
-    for k in range(0,n) :
-        if isWhitespace(x[k]) : # x[k] seems to be int, not bytes
-            x[k] = iSPC
-    print('cleaned input stream',x)
-    return x
-
-def trimLeadingSpace(buf) :
-    k = 0
-    nb = len(buf)
-    while (nb > k) and (buf[k] == iSPC) :
-        k=k+1
-    #print("Spaces til",k)
-    if k==0:
-        return buf
-    if k >= nb:
-        return str("")
-    return bytearray(buf[k:])
-
-def firstSpace(b) :
-    for k in range (0,len(b)) :
-        if b[k] == iSPC :
-            return k
-    return -1 # no whitespace in string
+# decode signed decimal integer from w[k0:], without making a str.
+# returns None if not a valid integer
+def parseInt(w,k0=0) :
+    n = len(w)
+    if k0 >= n :
+        return None
+    neg = False
+    c = w[k0]
+    if c == iMIN :
+        neg = True
+        k0 += 1
+    elif c == iPLS :
+        k0 += 1
+    if k0 >= n :
+        return None  # sign, but no digits
+    val = 0
+    for k in range(k0,n) :
+        c = w[k]
+        if (c < iZRO) or (c > iNIN) :
+            return None
+        val = val * 10 + (c - iZRO)
+    if neg : return -val
+    return val
 
 
 class WordParser() :
-    def __init__(self,s) :   # provide stream to parse
+    def __init__(self,s,      # provide stream to parse
+                 depth = 16,  # max completed words held until next()
+                 wordLen = 16,# longest word accepted.  longer words dropped
+                 rxLen = 64,  # bytes read from stream per readinto()
+                 policy = DROP_NEWEST) : # when ring is full.  see above
         self.stream = s
-        self.buf = bytearray()  # to accumulate bytes
-        self.cmd = []           # list of completed commands received
-
-    def parse(self) : # check for next command in buffer (internal use only)
-        buf = trimLeadingSpace(self.buf)
-        #print('parsing',type(buf),buf,'<')
-        k = firstSpace(buf)
-        #print('first space at',k)
-        if k <= 0 :
-            return
-        nextCmd=buf[:k]
-        #print('next cmd:',nextCmd,'<')
-        if len(self.cmd) > 0 :
-            self.cmd.append(nextCmd)
-        else:
-            self.cmd = [nextCmd]
-        #print(len(self.cmd),'commands in queue')
-        #print(self.cmd)
-        self.buf = buf[k+1:]
-        #print('unparsed buffer remaining',type(self.buf),self.buf,'<')
+        if wordLen < FRAME_WORD : wordLen = FRAME_WORD
+        self.rx = bytearray(rxLen)  # receive buffer, scanned in place
+        self.rxk = 0  # next byte of rx to scan
+        self.rxn = 0  # bytes in rx
+        self.policy = policy
+
+        # ring of word slots.  slot i is words[i*wordLen:(i+1)*wordLen]
+        self.depth = depth
+        self.wordLen = wordLen
+        self.words = bytearray(depth * wordLen)
+        self.wlen  = bytearray(depth) # length of word in each slot
+        self.head  = 0  # slot of oldest completed word
+        self.count = 0  # number of completed words in ring
+
+        self.n = 0          # bytes of word currently being accumulated
+        self.skip = False   # discarding rest of an over-long or unqueued word
+        self.clearStats()
+
+        self.frame = bytearray(FRAME_BODY) # binary frame being received
+        self.nf = -1        # bytes of frame received, -1 when not in a frame
+        self.seq = -1       # sequence number of last good frame
+        self.badFrames = 0  # CRC failures
+        self.lostFrames = 0 # gaps in sequence numbers
+        self.dupFrames = 0  # repeated sequence numbers, still queued
+
+        # word returned by next() is copied here, and a view of the
+        # right length handed back.  Views made once, here, so that
+        # next() does not allocate.
+        self.tok = bytearray(wordLen)
+        mv = memoryview(self.tok)
+        self.tokView = [mv[:k] for k in range(wordLen+1)]
+
+    def clearStats(self) :
+        self.enqueued = 0   # words queued
+        self.dropped = 0    # words lost to overflow, or too long
+        self.highWater = 0  # most words ever queued at once
+        self.stalls = 0     # SIGNAL policy : times reading paused, full
+
+    def show(self) :
+        print("words queued",self.enqueued,"\tdropped",self.dropped,
+              "\thigh water",self.highWater,"of",self.depth,
+              "\tstalls",self.stalls,"\tframes bad",self.badFrames,
+              "lost",self.lostFrames,"dup",self.dupFrames)
+
+    def push(self,o,n) : # queue the n byte word in tail slot o (internal)
+        self.wlen[o // self.wordLen] = n
+        c = self.count + 1
+        self.count = c
+        self.enqueued += 1
+        if c > self.highWater : self.highWater = c
+
+    def dropOldest(self) : # make room, DROP_OLDEST policy (internal)
+        self.head = (self.head + 1) % self.depth
+        self.count -= 1
+        self.dropped += 1
 
     def update(self) : # check for new bytes on command line (internal use only)
-        if (self.stream.any() <= 0) :
-            return
-        while self.stream.any():  # load any new bytes
-            newBytes = self.stream.read()
-            self.buf += str(cleanWhitespace(newBytes),'UTF-8')
-            #print('updated buf',type(self.buf),self.buf,'<')
-
-        while True:  # parse any new commands received
-            nq = len(self.cmd)
-            #print(nq,'commands in queue')
-            self.parse()
-            if nq==len(self.cmd) :
-                return
-            #else :
-                #print('remaining buf:',self.buf,'<')
-                            
+        stream = self.stream
+        rx = self.rx
+        words = self.words
+        wordLen = self.wordLen
+        depth = self.depth
+        policy = self.policy
+        while True :
+            k = self.rxk
+            nr = self.rxn
+            if k >= nr :  # all scanned.  load any new bytes
+                if stream.any() <= 0 :
+                    return
+                nr = stream.readinto(rx)
+                if not nr :
+                    return
+                self.rxn = nr
+                k = 0
+            n = self.n
+            skip = self.skip
+            nf = self.nf
+            frame = self.frame
+            o = ((self.head + self.count) % depth) * wordLen # tail slot
+            while k < nr :
+                b = rx[k]
+                k += 1
+                if nf >= 0 :  # inside binary frame
+                    frame[nf] = b
+                    nf += 1
+                    if nf == FRAME_BODY :
+                        nf = -1
+                        if self.checkFrame() :
+                            for j in range(FRAME_WORD) :
+                                words[o + j] = frame[j]
+                            self.push(o,FRAME_WORD)
+                            o = ((self.head + self.count) % depth) * wordLen
+                    continue
+                if (b <= iSPC) or (b > iTLD) : # whitespace.  end of any word
+                    if n > 0 :
+                        if skip :
+                            self.dropped += 1
+                        else :
+                            self.push(o,n)
+                            o = ((self.head + self.count) % depth) * wordLen
+                    n = 0
+                    skip = False
+                    if b == SYNC :
+                        if (self.count >= depth) and (policy == SIGNAL) :
+                            k -= 1  # no slot for frame.  rescan SYNC later
+                            self.stalls += 1
+                            break
+                        nf = 0
+                    continue
+                if n == 0 :  # start of new word.  make sure there is a slot
+                    skip = False
+                    if self.count >= depth :
+                        if policy == SIGNAL :
+                            k -= 1  # rescan this byte once a slot is free
+                            self.stalls += 1
+                            break
+                        if policy == DROP_OLDEST : self.dropOldest()
+                        else                     : skip = True
+                if n >= wordLen :
+                    skip = True
+                elif not skip :
+                    words[o + n] = b
+                n += 1
+            self.rxk = k
+            self.n = n
+            self.skip = skip
+            self.nf = nf
+            if k < nr :
+                return  # stalled, full
+
+    def checkFrame(self) : # True if complete frame should be queued (internal)
+        frame = self.frame
+        if crc8(frame,FRAME_WORD) != frame[FRAME_WORD] :
+            self.badFrames += 1
+            return False
+        seq = frame[FRAME_WORD-1]
+        if self.seq >= 0 :
+            d = (seq - self.seq) & 0xFF
+            if d == 0 :
+                self.dupFrames += 1
+            else :
+                self.lostFrames += d - 1
+        self.seq = seq
+        if self.count >= self.depth :  # never for SIGNAL, checked at SYNC
+            if self.policy == DROP_OLDEST :
+                self.dropOldest()
+                return True
+            self.dropped += 1
+            return False
+        return True
+
     def ready(self) : # returns True if a complete command is ready to be retrieved
         self.update()
-        return len(self.cmd) > 0  # True if a complete command was received
-        
+        return self.count > 0  # True if a complete command was received
+
     def next(self) : # get next command.  will block.  use ready() to avoid blocking
         #n=0
         while not self.ready() :
@@ -106,7 +300,13 @@ class WordParser() :
             #n=n+1
             time.sleep_ms(100)
 
-        cmd = self.cmd[0]
-        if len(self.cmd) > 1 :  self.cmd = self.cmd[1:]
-        else                 :  self.cmd = []
-        return cmd
+        i = self.head
+        n = self.wlen[i]
+        o = i * self.wordLen
+        tok = self.tok
+        words = self.words
+        for k in range(n) :
+            tok[k] = words[o + k]
+        self.head = (i + 1) % self.depth
+        self.count -= 1
+        return self.tokView[n]
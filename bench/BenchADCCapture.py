@@ -0,0 +1,78 @@
+# Polled vs. captured pot filtering
+#
+# On the simulated board, a noisy pot is stepped from 20% to 80% of
+# travel.  The control loop reads it every 50 ms, as the analog override
+# does.  Compares the polled FilteredADC (one read_u16() per update)
+# with one fed by ADCCapture at 200 samples/s (soft capture, which has
+# the same interface as the DMA one), averaging each update's samples
+# first.  Gain 0.2 per update, both.  Reports output noise before the
+# step, time for the output to settle within 2% of the new position,
+# samples averaged and step() calls per update.  The capture runs again
+# with its sample numbers started short of their wrap (ADCCapture.WRAP),
+# and must give the same.
+#
+#   python bench/BenchADCCapture.py [noise_counts]
+
+import sys,random,math
+import simenv
+from simenv import board,clock
+from FilteredADC import FilteredADC
+from ADCCapture import ADCCapture,WRAP
+
+T_STEP = 2.0   # s
+T_END  = 4.0
+PERIOD = 50    # ms between control loop reads
+
+def run(noise,captured,seed=1,wrap=False) :
+    board.reset()
+    rng = random.Random(seed)
+    def pot(t) :
+        return (52000 if t >= T_STEP else 13000) + rng.gauss(0,noise)
+    cap = None
+    if captured :
+        cap = ADCCapture((26,27),rate=200,useDMA=False)
+        f = FilteredADC(26,0.2,capture=cap)
+        cap.start()
+        if wrap :  # crosses it some 3 s in
+            cap.total = WRAP - 3 * cap.rate * cap.nch - 1
+            for i in range(cap.nch) : cap.rd[i] = cap.total + i
+    else :
+        f = FilteredADC(26,0.2)
+    board.adc[26].setWaveform(pot)
+    f.v = 13000
+    steps = [0]
+    step = f.step
+    def counted(v) :
+        steps[0] += 1
+        step(v)
+    f.step = counted
+    t = []
+    y = []
+    while clock.us < T_END * 1e6 :
+        clock.advance_ms(PERIOD)
+        t.append(clock.us * 1e-6)
+        y.append(f.read())
+    if cap : cap.stop()
+    before = [v for tt,v in zip(t,y) if 1.0 <= tt < T_STEP]
+    mean = sum(before) / len(before)
+    sd = math.sqrt(sum((v - mean) ** 2 for v in before) / len(before))
+    final = f.peek()
+    settle = None
+    for tt,v in zip(t,y) :
+        if tt < T_STEP : continue
+        if abs(v - final) > 10 : settle = None   # 2% of 510 output counts
+        elif settle is None : settle = tt - T_STEP
+    perUpdate = cap.rate * PERIOD / 1000 if cap else 1
+    return sd,settle,perUpdate,steps[0] / len(y),(cap.overruns if cap else 0)
+
+if __name__ == '__main__' :
+    noise = float(sys.argv[1]) if len(sys.argv) > 1 else 800.0
+    print("pot noise sd %.0f counts, read every %d ms" % (noise,PERIOD))
+    out = {}
+    for name,captured,wrap in (("polled",False,False),("captured",True,False),
+                               ("wrapping",True,True)) :
+        out[name] = sd,settle,per,steps,over = run(noise,captured,wrap=wrap)
+        print("%-9s output sd %5.2f   settle %s   samples/update %3.0f   step()/update %4.2f   overruns %d" %
+              (name,sd,"%.0f ms" % (settle * 1000) if settle is not None else "never",
+               per,steps,over))
+    assert out["wrapping"] == out["captured"],"sample number wrap changed the readings"
@@ -0,0 +1,82 @@
+# Boot : time to a safe bridge state, to ready, and to the first command
+#
+# Boots TankDrive on the simulated board from reset (t = 0), with host
+# CPU time charged to the virtual clock times CPU_SCALE, as in
+# BenchCoreSplit.py, so importing and compiling take virtual time.
+#
+#  * no SafeBoot : TankDrive.py imported as it was, the bridge pins left
+#    to their pull-downs until the drivers are made
+#  * main.py : SafeBoot.py first, then TankDrive
+#  * main.py, precompiled : as above, loading cached bytecode instead of
+#    compiling source, standing in for .mpy files or frozen firmware
+#    (tools/BuildMpy.py, manifest.py)
+#
+# safe : every bridge input (GP 6,7,8,18,19) driven low.  ready : the end
+# of TankDrive's launch.  first command : "L100 R100 " sent at ready,
+# to the first PWM change.  All us since reset, median of several boots.
+#
+#   python bench/BenchBoot.py [boots]
+
+import os,sys,types,tempfile,importlib
+import simenv
+from simenv import board,clock,quiet
+
+CPU_SCALE = 50
+BRIDGE = (6,7,8,18,19)
+ROOT = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)),'..'))
+MODULES = [f[:-3] for f in os.listdir(ROOT) if f.endswith('.py')]
+
+def boot(entry,noSafe,cache) :
+    board.reset()
+    for m in MODULES : sys.modules.pop(m,None)
+    if noSafe :
+        stub = types.ModuleType('SafeBoot')  # names only, pins left be
+        stub.tSafe = 0
+        stub.PIN_MAP = "pins.json"
+        stub.SAFE_L = (6,7,8)
+        stub.SAFE_R = (18,19,20,21)
+        stub.resetCause = 1  # PWRON_RESET
+        sys.modules['SafeBoot'] = stub
+    sys.pycache_prefix = cache
+    sys.dont_write_bytecode = False
+    importlib.invalidate_caches()
+    clock.at(0,lambda : importlib.import_module(entry))
+    clock.cpuScale = CPU_SCALE
+    with quiet() :
+        clock.run(0)
+        tReady = clock.us
+        tSafe = max(board.driven[p][0] if p in board.driven and not board.driven[p][1]
+                    else float('inf') for p in BRIDGE)
+        board.uart[1].feed(b'L100 R100 ',at_us=tReady)
+        clock.run(tReady + 50000)
+    clock.cpuScale = 0
+    tCmd = board.pwmStart([6,18,19],tReady)
+    return tSafe,tReady,tCmd
+
+def median(xs) :
+    xs = sorted(xs)
+    return xs[len(xs) // 2]
+
+def run(entry,noSafe,precompiled,boots) :
+    out = []
+    for k in range(boots) :
+        # a new, empty bytecode cache each boot : compile from source.
+        # Or one cache, warmed up first : load bytecode
+        if precompiled :
+            if k == 0 :
+                cache = tempfile.mkdtemp()
+                boot(entry,noSafe,cache)
+        else :
+            cache = tempfile.mkdtemp()
+        out.append(boot(entry,noSafe,cache))
+    return [median([r[i] for r in out]) for i in range(3)]
+
+if __name__ == '__main__' :
+    boots = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    print("boot, us since reset, host CPU x%d, median of %d" % (CPU_SCALE,boots))
+    for name,entry,noSafe,pre in (("no SafeBoot, source","TankDrive",True,False),
+                                  ("main.py, source","main",False,False),
+                                  ("main.py, precompiled","main",False,True)) :
+        tSafe,tReady,tCmd = run(entry,noSafe,pre,boots)
+        print("%-22s safe %8d   ready %8d   first command %8d" %
+              (name,tSafe,tReady,tCmd if tCmd is not None else -1))
@@ -0,0 +1,77 @@
+# Command coalescing under a 1 kHz command flood
+#
+# Runs TankDrive.py on the simulated board, with Settings.coalesce off
+# then on, event driven and polled every 10 ms.  Joystick-like bursts of
+# five "Lnnn Rnnn" pairs arrive every 10 ms, 1000 words a second,
+# crossing zero now and then, with an X stop every 50th burst.  Counts
+# setSpeed() calls, reversals started and stops applied, and times each
+# processCommands() call that had words to process, on the host.
+#
+#   python bench/BenchCoalesce.py [seconds]
+
+import sys,random,time
+import simenv
+from simenv import board,clock,fresh,quiet,percentile
+
+def count(obj,name,counts) :
+    f = getattr(obj,name)
+    def counted(*a) :
+        counts[name] = counts.get(name,0) + 1
+        return f(*a)
+    setattr(obj,name,counted)
+
+def run(coalesce,eventDriven,seconds,seed=1) :
+    TD = fresh('TankDrive',uartIdleIRQ=eventDriven)
+    TD.Settings.coalesce = coalesce
+    counts = {}
+    for m in (TD.HW.MotL,TD.HW.MotR) :
+        m.dbg.n = 0
+        for name in ('setSpeed','scheduleRestart') :
+            count(m,name,counts)
+    count(TD,'stopMotors',counts)
+    ticks = []
+    pc = TD.processCommands
+    def timed(t) :
+        t0 = time.perf_counter_ns()
+        pc(t)
+        ticks.append(time.perf_counter_ns() - t0)
+    TD.processCommands = timed
+
+    if not eventDriven :
+        TD.timTankDrive.init(period=10, mode=TD.Timer.PERIODIC,
+                             callback=TD.TankDriveUpdate)
+    uart = board.uart[1]
+    rng = random.Random(seed)
+    t = clock.us + 10000
+    v = 0
+    nStop = 0
+    for k in range(int(seconds * 100)) :
+        t += 10000
+        if k % 50 == 49 :
+            uart.feed(b'X ',at_us=t)
+            nStop += 1
+            continue
+        burst = b''
+        for j in range(5) :
+            v += rng.randint(-12,12)   # joystick wander, through zero
+            v = max(-255,min(255,v))
+            burst += b'L%d R%d ' % (v,-v)
+        uart.feed(burst,at_us=t)
+    with quiet() :
+        clock.run(t + 500000)
+    counts['dropped'] = TD.HW.cs.dropped
+    return counts,ticks,nStop
+
+if __name__ == '__main__' :
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 5.0
+    print("%g s of 1 kHz commands, in bursts of 10" % seconds)
+    for eventDriven in (False,True) :
+        for coalesce in (False,True) :
+            counts,ticks,nStop = run(coalesce,eventDriven,seconds)
+            busy = [d / 1000.0 for d in ticks if d > 5000]  # had words
+            print("%-5s coalesce %-3s  setSpeed %5d  reversals %3d  stops %3d/%d"
+                  "  dropped %d   processCommands us  p50 %5.0f  max %5.0f" %
+                  ("event" if eventDriven else "poll","on" if coalesce else "off",
+                   counts.get('setSpeed',0),counts.get('scheduleRestart',0),
+                   counts.get('stopMotors',0),nStop,counts['dropped'],
+                   percentile(busy,50),max(busy)))
@@ -0,0 +1,76 @@
+# Motor loop jitter, one core vs. split across two
+#
+# Runs TankDrive.py on the simulated board with the 1 ms motor loop on a
+# Timer (Settings.motorLoop = 1), then on core 1 (motorLoop = 2).  Core 0
+# is kept busy the whole time : a stream of L/R commands with command
+# diagnostic messages on, and a trace dump ('t' command, 64 lines printed) every
+# half second.  Host CPU time is charged to the virtual clock, times
+# CPU_SCALE, as a rough stand-in for the Pico being that much slower.
+#
+# Reports how late each motor loop pass started, and the delay from a
+# stop command's delimiter to both PWMs going to brake.
+#
+#   python bench/BenchCoreSplit.py [seconds]
+
+import sys,random
+import simenv
+from simenv import board,clock,fresh,quiet,percentile
+
+CPU_SCALE = 50
+
+def run(mode,seconds,seed=1) :
+    TD = fresh('TankDrive')
+    TD.Settings.motorLoop = mode
+    TD.State.dbg.n = 1 << 30        # command diag messages on, forever
+    late = []
+    add = TD.State.loopStats.add
+    def noteLate(l,period) :
+        late.append(l)
+        add(l,period)
+    TD.State.loopStats.add = noteLate
+    TD.timMotor = TD.startMotorLoop()
+
+    uart = board.uart[1]
+    rng = random.Random(seed)
+    stops = []
+    t = clock.us + 10000
+    end = t + int(seconds * 1e6)
+    k = 0
+    while t < end :
+        t += rng.randint(2000,20000)   # 50..500 commands/s
+        k += 1
+        if k % 100 == 0 :
+            stops.append(uart.feed(b'X ',at_us=t))
+        elif k % 37 == 0 :
+            uart.feed(b't ',at_us=t)
+        else :
+            v = rng.randint(20,250)
+            uart.feed(b'L%d R%d ' % (v,v),at_us=t)
+    clock.cpuScale = CPU_SCALE
+    with quiet() :
+        clock.run(end + 100000)
+    clock.cpuScale = 0
+    TD.State.loopRun = False
+
+    # stop command to brake (MAX_PWM, after dead time) on both motors
+    stopLat = []
+    for ts in stops :
+        tb = []
+        for pin in (6,18) :
+            h = board.pwm[pin].history
+            tb.append(next((tt for tt,d in h if tt >= ts and d in (0,65535)),None))
+        if None not in tb : stopLat.append((max(tb) - ts) / 1000.0)
+    return late,stopLat,TD.State.loopStats
+
+def report(name,late,stopLat,stats) :
+    print("%-8s loop late us  p50 %5d  p99 %6d  max %6d  overruns %4d/%d" %
+          (name,percentile(late,50),percentile(late,99),max(late),
+           stats.overruns,stats.n))
+    print("%-8s stop to PWM ms  p50 %6.2f  max %6.2f" %
+          ("",percentile(stopLat,50),max(stopLat)))
+
+if __name__ == '__main__' :
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 5.0
+    print("core 0 load : commands + diag prints, host CPU x%d" % CPU_SCALE)
+    report("1 core",*run(1,seconds))
+    report("2 cores",*run(2,seconds))
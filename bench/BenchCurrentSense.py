@@ -0,0 +1,178 @@
+# IBT-2 current sense : trip latency, current limit, stats
+#
+# Runs TankDrive.py on the simulated board, with a MotorPlant (sim/plant.py)
+# on the IBT-2 side driving the current sense pin, GP28.  Reading one
+# sample per motor loop pass (as without rp2.DMA) and a batched capture
+# at 2000/s (soft ADCCapture here, DMA on the Pico) are compared.  The
+# batched trip is checked as samples arrive (CurrentSense.startTrip()),
+# and, for comparison, by the motor loop pass only.
+#
+#  * trip : a short, 40 A, comes on at a random time while driving.
+#    Time from the fault to both IBT-2 PWMs at 0.  Fails if any is over
+#    the PWM period, 1 ms.
+#  * limit : the tread stalls while driving at 80%.  Current with and
+#    without Settings.currentLimit.
+#  * stats : peak and RMS from 'i', against the plant's own.
+#  * CurrentSense.update() cost on the host, and allocation by it and
+#    by the trip IRQ, the IRQ run across the sample number wrap.
+#
+#   python bench/BenchCurrentSense.py [faults]
+
+import sys,random,time,tracemalloc
+import simenv
+from simenv import board,clock,fresh,quiet,percentile
+from plant import MotorPlant,ibt2Drive
+from ADCCapture import ADCCapture,WRAP
+from CurrentSense import CurrentSense
+
+MA_FULL = 28000
+PWM_MS = 1.0
+
+def setup(batched,trip=0,limit=0,tripIRQ=True) :
+    TD = fresh('TankDrive')
+    if batched :
+        cap = ADCCapture((26,27,28),rate=2000,ringLen=512,useDMA=False)
+        cap.start()
+        TD.HW.IsR = CurrentSense(TD.HW.MotR,28,capture=cap)
+    TD.HW.IsR.setTrip(trip)
+    TD.HW.IsR.setLimit(limit)
+    if batched and trip and tripIRQ :  # as TankDrive does
+        TD.HW.IsR.startTrip(TD.currentTripCB)
+    TD.State.senseI = True
+    TD.Settings.motorLoop = 1
+    TD.timMotor = TD.startMotorLoop()
+    TD.HW.MotR.dbg.n = 0
+    p = MotorPlant(ibt2Drive(18,19),14,15)
+    p.start()
+    fault = [None]  # amps, when shorted and driven
+    wave = p.isWave(MA_FULL)
+    def isWave(t) :
+        if fault[0] is not None and (board.pwm[18].d or board.pwm[19].d) :
+            return fault[0] * 1000.0 * 65535 / MA_FULL
+        return wave(t)
+    board.adc[28].setWaveform(isWave)
+    return TD,p,fault
+
+def keepDriving(uart,cmd,t0,t1) :
+    t = t0
+    while t < t1 :
+        uart.feed(cmd,at_us=t)
+        t += 300000
+
+def dutyAt(pin,t) :
+    d = 0
+    for tt,x in board.pwm[pin].history :
+        if tt > t : break
+        d = x
+    return d
+
+def tripLatency(batched,faults,tripIRQ=True,seed=1) :
+    rng = random.Random(seed)
+    lat = []
+    for k in range(faults) :
+        TD,p,fault = setup(batched,trip=25000,tripIRQ=tripIRQ)
+        uart = board.uart[1]
+        t0 = clock.us + 10000
+        keepDriving(uart,b'L0 R120 ',t0,t0 + 1000000)
+        tf = t0 + 500000 + rng.randint(0,99999)
+        clock.at(tf,lambda : fault.__setitem__(0,40.0),charge=False)
+        with quiet() :
+            clock.run(t0 + 1000000)
+        tz = [tf if dutyAt(pin,tf) == 0 else
+              next((t for t,d in board.pwm[pin].history if t >= tf and d == 0),None)
+              for pin in (18,19)]
+        if None not in tz :
+            lat.append((max(tz) - tf) / 1000.0)
+    return lat
+
+def stall(batched,limit) :
+    TD,p,fault = setup(batched,limit=limit)
+    uart = board.uart[1]
+    t0 = clock.us + 10000
+    keepDriving(uart,b'L0 R200 ',t0,t0 + 2500000)
+    amps = []
+    def note() :
+        if clock.us >= t0 : amps.append((clock.us,abs(p.amps)))
+        clock.at(clock.us + 250,note,charge=False)
+    note()
+    clock.at(t0 + 1500000,lambda : setattr(p,'drag',1e6),charge=False)
+    with quiet() :
+        clock.run(t0 + 2500000)
+    start = max(a for t,a in amps if t < t0 + 1000000)
+    held = [a for t,a in amps if t >= t0 + 2000000]
+    truePeak = max(a for t,a in amps)
+    trueRms = (sum(a * a for t,a in amps[-256:]) / 256) ** 0.5
+    I = TD.HW.IsR
+    rms = (I.msq << 12) ** 0.5
+    return (start,sum(held) / len(held),truePeak,I.mA(I.peak) / 1000.0,
+            trueRms,I.mA(int(rms)) / 1000.0)
+
+def updateCost(n=2000) : # per pass, with 2 new samples, as at 2000/s
+    TD,p,fault = setup(True,trip=25000,limit=10000)
+    I = TD.HW.IsR
+    cap = I.capture
+    cap.stop()
+    vals = [(k * 7919) & 0x7FFF for k in range(256)]  # under trip
+    def loop() :
+        for k in range(n) :
+            for j in range(2) : cap.sample_cb(None)
+            I.update()
+    def base() :
+        for k in range(n) :
+            for j in range(2) : cap.sample_cb(None)
+            cap.rd[I.capIdx] = cap.skipTo(cap.rd[I.capIdx],cap.total)  # as if read
+    board.adc[28].setWaveform(vals)
+    t0 = time.perf_counter_ns()
+    loop()
+    dt = time.perf_counter_ns() - t0
+    t0 = time.perf_counter_ns()
+    base()
+    dt -= time.perf_counter_ns() - t0
+    tracemalloc.start()
+    loop()
+    cur,peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    # the IRQ across the sample number wrap, 3 pins, so not a multiple.
+    # Pots over the trip level : reading one of them would trip
+    wrapAt(cap,3 * n // 2)
+    trips = I.trips
+    for pin in (26,27) : board.adc[pin].setWaveform(65535)
+    I.startTrip(lambda : None)
+    I.tim.deinit()  # called here instead
+    for j in range(2) : cap.sample_cb(None)
+    tracemalloc.start()
+    for k in range(n) :
+        cap.sample_cb(None)
+        I.trip_cb(None)
+    cur,peakIRQ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert cap.total < 3 * n and I.trips == trips,"trip_cb() lost its pin at the wrap"
+    return dt / n,peak / n,peakIRQ / n
+
+def wrapAt(cap,k) : # soft capture's sample numbers k short of the wrap
+    t = WRAP - k
+    for i in range(cap.nch) : cap.rd[i] = cap.skipTo(cap.rd[i],cap.total) - cap.total + t
+    cap.total = t
+
+if __name__ == '__main__' :
+    faults = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    ok = True
+    for name,batched,tripIRQ in (("polled ",False,False),
+                                 ("batched, pass only",True,False),
+                                 ("batched",True,True)) :
+        lat = tripLatency(batched,faults,tripIRQ)
+        good = len(lat) == faults and max(lat) <= PWM_MS
+        if tripIRQ or not batched : ok = ok and good  # what TankDrive runs
+        print("%s trip at 25 A, 40 A short : stopped %d/%d  ms to PWM 0  p50 %.2f  max %.2f  %s" %
+              (name,len(lat),faults,percentile(lat,50),max(lat),
+               "OK" if good else "over the %.0f ms PWM period" % PWM_MS))
+    print("ADC full scale is %d A" % (MA_FULL // 1000))
+    for limit in (0,10000) :
+        s = stall(True,limit)
+        print("limit %5s : start peak %5.1f A  stalled %5.1f A   peak true %5.1f A, 'i' %5.1f A"
+              "   rms true %5.1f A, 'i' %5.1f A" %
+              (("off" if not limit else "%d A" % (limit // 1000),) + s))
+    ns,b,bIRQ = updateCost()
+    print("CurrentSense.update(), 2 samples : %.0f ns, %.2f heap bytes per call (host).  trip_cb() %.2f" %
+          (ns,b,bIRQ))
+    assert ok,"trip slower than a PWM period"
@@ -0,0 +1,172 @@
+# Deadman switch : latency from the switch opening to the bridges off
+#
+# Runs TankDrive.py on the simulated board in analog override mode, both
+# motors running, and opens the deadman switch (GP17 rising) at random
+# times, with core 0 kept busy by a stream of commands, command diag
+# messages on, and host CPU time charged to the virtual clock times
+# CPU_SCALE, as in BenchCoreSplit.py.  Handlers :
+#
+#  * soft IRQ : TankDrive's handler as it was.  A soft IRQ, calling
+#    emergencyStop() (or posting ESTOP to the motor loop) right there
+#  * hard IRQ : as now.  PWMs to 0 in the IRQ, the stop deferred
+#    (Deferred.py)
+#  * hard IRQ, queue full : as above, with the scheduler queue already
+#    full at the edge, so the stop waits for the next command tick
+#
+# each with the motor loop off, and on a Timer.  The simulator runs one
+# callback at a time, so an edge waits for any callback running when
+# it comes, hard IRQ or not.  On the Pico a hard IRQ pre-empts it, and
+# only a soft IRQ waits.  So reports, in us :
+#
+#    waited   from the edge to its IRQ handler running, in the simulator.
+#             What a soft IRQ adds on the Pico, and a hard one does not
+#    PWM 0    from the handler running to every bridge PWM (GP 6,18,19)
+#             at 0
+#    stopped  from the handler running to State.stopped, the stop done
+#
+# Then the switch opens while both motors reverse, in the stop delay
+# before the restart, with the queue full so the stop proper waits.
+# Counts bridge outputs driven again (BOIM EN on with one IN high, IBT-2
+# PWM on) from the edge until the switch closes.  Any is a failure.
+#
+#   python bench/BenchDeadman.py [edges]
+
+import sys,random
+import simenv
+from simenv import board,clock,fresh,quiet,percentile
+import micropython
+
+CPU_SCALE = 50
+BRIDGE = (6,18,19)
+SWITCH = 17
+
+def softHandler(TD) : # deadmanSwitchCB, before Deferred.py
+    def cb(pin) :
+        if not TD.State.analogOverride : return
+        if not TD.State.stopped :
+            if TD.Settings.motorLoop : TD.State.slot.post(TD.ESTOP)
+            else :
+                TD.emergencyStop("Deadman switch open")
+                TD.State.stopped = True
+    board.pin[SWITCH].irq(handler=cb,trigger=board.pin[SWITCH].IRQ_RISING)
+
+def dutyAt(h,t) : # duty on PWM history h, at time t
+    d = 0
+    for tt,dd in h :
+        if tt > t : break
+        d = dd
+    return d
+
+def zeroAt(t0) : # every bridge PWM at 0, at or after t0
+    ts = []
+    for p in BRIDGE :
+        h = board.pwm[p].history
+        if dutyAt(h,t0) == 0 : continue
+        ts.append(next((t for t,d in h if t >= t0 and d == 0),None))
+    if None in ts : return None
+    return max(ts) if ts else t0
+
+def driven(t) : # a bridge driving at time t
+    at = lambda p : dutyAt(board.pwm[p].history,t)
+    pin = lambda p : dutyAt(board.pin[p].history,t)
+    return (at(6) and pin(7) != pin(8)) or at(18) or at(19)
+
+def drivenAfter(t0,t1) : # times bridge outputs were driven again, t0..t1
+    ts = sorted(t for p in BRIDGE for t,d in board.pwm[p].history if t0 < t <= t1)
+    ts += sorted(t for p in (7,8) for t,v in board.pin[p].history if t0 < t <= t1)
+    return sum(1 for t in set(ts) if driven(t))
+
+def reversal(motorLoop,edges,seed=1) :
+    TD = fresh('TankDrive')
+    TD.Settings.motorLoop = motorLoop
+    if motorLoop : TD.timMotor = TD.startMotorLoop()
+    TD.State.analogOverride = True
+    sw = board.pin[SWITCH]
+    sw.drive(0)
+    rng = random.Random(seed)
+    def edge() :
+        while clock.sched < micropython.SCHED_DEPTH :
+            micropython.schedule(lambda a : None,0)
+        sw.drive(1)
+    t = clock.us + 10000
+    spans = []
+    for k in range(edges) :
+        clock.at(t,lambda : TD.driveLR(30000,-30000))
+        tr = t + 200000
+        clock.at(tr,lambda : TD.driveLR(-30000,30000))  # ~58 ms stop delay
+        te = tr + rng.randint(5000,40000)
+        clock.at(te,edge)
+        clock.at(te + 300000,lambda : sw.drive(0))
+        spans.append((te,te + 300000))
+        t = te + 320000
+    clock.cpuScale = CPU_SCALE
+    with quiet() :
+        clock.run(t + 100000)
+    clock.cpuScale = 0
+    TD.State.loopRun = False
+    bad = [drivenAfter(t0,t1) for t0,t1 in spans]
+    print("switch open mid reversal, %-13s : driven again after the edge %d times, in %d/%d edges  %s" %
+          ("loop on Timer" if motorLoop else "no motor loop",sum(bad),
+           sum(1 for b in bad if b),edges,"FAIL" if any(bad) else "OK"))
+    return not any(bad)
+
+def run(handler,motorLoop,edges,fill=False,seed=1) :
+    TD = fresh('TankDrive')
+    TD.Settings.motorLoop = motorLoop
+    if motorLoop : TD.timMotor = TD.startMotorLoop()
+    if handler == 'soft' : softHandler(TD)
+    TD.State.analogOverride = True
+    TD.State.dbg.n = 1 << 30  # command diag messages on, forever
+    sw = board.pin[SWITCH]
+    sw.drive(0)  # switch held closed
+    uart = board.uart[1]
+    rng = random.Random(seed)
+    handled = []  # edge handled at
+    stopped = []  # State.stopped seen at
+    def watch() :
+        if TD.State.stopped : stopped.append(clock.now())
+        else : clock.after(50,watch)
+    def edge() :
+        if fill :  # scheduler queue full
+            while clock.sched < micropython.SCHED_DEPTH :
+                micropython.schedule(lambda a : None,0)
+        handled.append(clock.now())
+        sw.drive(1)
+        watch()
+    t = clock.us + 10000
+    edgeAt = []
+    for k in range(edges) :
+        clock.at(t,lambda : TD.driveLR(30000,-30000))
+        te = t + rng.randint(100000,200000)
+        for tc in range(t + 5000,te + 20000,rng.randint(10000,30000)) :
+            uart.feed(b't ',at_us=tc)  # trace dump : busy core 0, no motor change
+        clock.at(te,edge)
+        edgeAt.append(te)
+        clock.at(te + 300000,lambda : sw.drive(0))
+        t = te + 320000
+    clock.cpuScale = CPU_SCALE
+    with quiet() :
+        clock.run(t + 100000)
+    clock.cpuScale = 0
+    TD.State.loopRun = False
+    waited = [th - te for te,th in zip(edgeAt,handled)]
+    zero = [zeroAt(th) - th for th in handled]
+    done = [ts - th for th,ts in zip(handled,stopped)]
+    return waited,zero,done,TD.deadmanStop.full
+
+def report(name,waited,zero,done,full) :
+    print("%-32s waited p50 %6d max %6d   PWM 0 p50 %5d max %5d   stopped p50 %6d max %6d%s" %
+          (name,percentile(waited,50),max(waited),percentile(zero,50),max(zero),
+           percentile(done,50),max(done),"   queue full %d" % full if full else ""))
+
+if __name__ == '__main__' :
+    edges = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    print("deadman switch open to bridges off, us, %d edges, host CPU x%d" % (edges,CPU_SCALE))
+    for ml in (0,1) :
+        loop = "loop on Timer" if ml else "no motor loop"
+        report("soft IRQ, " + loop,*run('soft',ml,edges))
+        report("hard IRQ, " + loop,*run('hard',ml,edges))
+        report("hard, queue full, " + loop,*run('hard',ml,edges,fill=True))
+    ok = True
+    for ml in (0,1) : ok = reversal(ml,edges) and ok
+    assert ok,"bridge driven again after the deadman switch opened"
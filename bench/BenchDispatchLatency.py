@@ -0,0 +1,50 @@
+# Command-to-PWM latency, polled vs. event-driven UART dispatch
+#
+# Runs the unmodified TankDrive.py on the simulated board.  Left motor
+# commands arrive at random intervals, and latency is measured from
+# the delimiter's arrival on the UART to the matching PWM duty change.
+#
+#   python bench/BenchDispatchLatency.py [nCommands]
+
+import sys,random
+import simenv
+from simenv import board,clock,fresh,quiet,percentile
+
+WINDOW = 1000000  # us.  Values repeat every 200 commands, several s apart
+
+def run(eventDriven,n,seed=1) :
+    fresh('TankDrive',uartIdleIRQ=eventDriven)
+    uart = board.uart[1]
+    pwm = board.pwm[6]   # MotL PWM pin
+    rng = random.Random(seed)
+    sent = []
+    t = clock.us + 10000
+    for k in range(n) :
+        t += rng.randint(20000,300000)   # joystick update gaps, us
+        v = 10 + k % 200                 # always changes, never reverses
+        sent.append((uart.feed(b'L%d ' % v,at_us=t),v * 257))
+    with quiet() :
+        clock.run(t + 1000000)
+
+    lat = []
+    h = pwm.history
+    j = 0
+    for tCmd,duty in sent :
+        # a command overtaken by the next one before reaching the PWM
+        # never shows up.  Skip it, without losing our place
+        i = j
+        while i < len(h) and (h[i][0] < tCmd or h[i][1] != duty) :
+            i += 1
+        if i >= len(h) or h[i][0] > tCmd + WINDOW : continue
+        j = i
+        lat.append((h[j][0] - tCmd) / 1000.0)
+    return lat
+
+def report(name,lat,n) :
+    print("%-6s p50 %7.2f ms   p99 %7.2f ms   max %7.2f ms   (%d/%d applied)" %
+          (name,percentile(lat,50),percentile(lat,99),max(lat),len(lat),n))
+
+if __name__ == '__main__' :
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    report("poll",run(False,n),n)
+    report("event",run(True,n),n)
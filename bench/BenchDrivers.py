@@ -0,0 +1,66 @@
+# Driver registry and pin map : what each pins.json loads, and costs
+#
+# Boots TankDrive on the simulated board from a scratch directory
+# holding a pins.json, for :
+#
+#  * built in : no pins.json.  BOIM left, IBT-2 right
+#  * ibt2 x2 : an IBT-2 on each side
+#  * boim x2 : the original BOIM on the right, GP 10,11,12
+#  * sim : MotorDriveSim both sides, no bridge pins touched
+#
+# Reports the driver classes made, which driver modules were imported,
+# their .mpy bytes (tools/BuildMpy.py output in build/mpy, if there)
+# or source bytes, the pins SafeBoot drove low, and the duty each side
+# has after "L100 R-100".
+#
+#   python bench/BenchDrivers.py
+
+import os,sys,json,tempfile
+import simenv
+from simenv import board,clock,fresh,quiet
+
+ROOT = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)),'..'))
+DRIVER_MODULES = ('MotorDriveBoim','MotorDriveIBT2','MotorDriveSim')
+
+MAPS = (("built in",None),
+        ("ibt2 x2",{"L" : {"driver" : "ibt2","pins" : [6,7],"enable" : [10,11]}}),
+        ("boim x2",{"R" : {"driver" : "boim","pins" : [10,11,12]}}),
+        ("sim",{"L" : {"driver" : "sim"},"R" : {"driver" : "sim"}}))
+
+def moduleBytes(m) :
+    mpy = os.path.join(ROOT,'build','mpy',m + '.mpy')
+    if os.path.exists(mpy) : return os.path.getsize(mpy),'mpy'
+    return os.path.getsize(os.path.join(ROOT,m + '.py')),'py'
+
+def boot(pinMap) :
+    d = tempfile.mkdtemp()
+    if pinMap is not None :
+        with open(os.path.join(d,'pins.json'),'w') as f :
+            json.dump(pinMap,f)
+    cwd = os.getcwd()
+    os.chdir(d)
+    try :
+        for m in DRIVER_MODULES + ('SafeBoot','Drivers') : sys.modules.pop(m,None)
+        TD = fresh('TankDrive')
+        safe = sorted(sys.modules['SafeBoot'].bridgePins())
+    finally :
+        os.chdir(cwd)
+    safe = [p for p in safe if board.driven[p][1] == 0]  # first driven low
+    uart = board.uart[1]
+    uart.feed(b'L100 R-100 ',at_us=clock.us + 1000)
+    with quiet() :
+        clock.run(clock.us + 200000)
+    return TD,safe
+
+if __name__ == '__main__' :
+    for name,pinMap in MAPS :
+        TD,safe = boot(pinMap)
+        L = TD.HW.MotL
+        R = TD.HW.MotR
+        loaded = [m for m in DRIVER_MODULES if m in sys.modules]
+        nb = [moduleBytes(m) for m in loaded]
+        print("%-9s L %-15s R %-15s imported %-30s %5d bytes %s" %
+              (name,type(L).__name__,type(R).__name__,",".join(loaded),
+               sum(b for b,k in nb),nb[0][1]))
+        print("          safe at boot %-30s duty L %6d R %6d" %
+              (safe,L.currentSpeed(),R.currentSpeed()))
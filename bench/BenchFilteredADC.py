@@ -0,0 +1,95 @@
+# Integer FilteredADC vs. the float filter it replaced
+#
+# Replays a pot trace through both filters on the simulated ADC, and
+# reports ns per update and the largest difference in read() output.
+# The float reference is the original float code, with its update
+# corrected to v + gain*(val - v) and abs() in the step test, which is
+# what the integer version implements.
+#
+#   python bench/BenchFilteredADC.py [trace.csv]
+#
+# trace.csv is one read_u16() value per line, e.g. logged from a Pico
+# with  print(adc.read_u16())  in a loop.  Without one, a synthetic
+# trace of slow sweeps, noise, steps and single-sample spikes is used.
+
+import sys,time,random
+import simenv
+from simenv import board
+from FilteredADC import FilteredADC
+
+class FloatFilteredADC(FilteredADC) :
+    def setGain(self,gain) :
+        self.gain = gain
+        self.gain1 = 1.0 - gain
+    def setRange(self,in0,in1,out0,out1) :
+        self.in0 = in0
+        self.out0 = out0
+        self.out1 = out1
+        self.scale = float(out1 - out0) / float(in1 - in0)
+        self.largeStep = round(0.2 * float(in1 - in0))
+    def update(self) :
+        val = self.adc.read_u16()
+        if val == self.v : return  # no change
+        dv = float(val - self.v)
+        v = round(float(self.v) * self.gain1 + float(val) * self.gain)
+        if abs(dv) < self.largeStep :
+            self.outlierCount = 0
+            if self.v == v :
+                if   dv > 0 : self.v = v+1
+                else        : self.v = v-1
+            else            : self.v = v
+        else :
+            if dv > 0 : self.outlierCount += 1
+            else      : self.outlierCount -= 1
+            if abs(self.outlierCount) > 2 :
+                self.v = val
+                self.outlierCount = 0
+    def peek(self) :
+        y = round(self.out0 + self.scale * float(self.v - self.in0))
+        if y < self.out0 : return self.out0
+        if y > self.out1 : return self.out1
+        return y
+
+def syntheticTrace(n=20000,seed=1) :
+    rng = random.Random(seed)
+    out = []
+    level = 32768
+    target = 32768
+    for k in range(n) :
+        if k % 2000 == 0 : target = rng.randint(0,65535)       # new position
+        if k % 5000 == 2500 : level = target = rng.randint(0,65535)  # step
+        level += (target - level) * 0.01                        # slow sweep
+        v = level + rng.gauss(0,150)                            # noise
+        if rng.random() < 0.003 : v = rng.choice((0,65535))     # spike
+        out.append(min(65535,max(0,int(v))))
+    return out
+
+def loadTrace(fnam) :
+    with open(fnam) as f :
+        return [int(line.split(',')[0]) for line in f if line.strip()]
+
+def replay(cls,trace,**kw) :
+    board.reset()
+    f = cls(26,0.2,**kw)
+    nos = kw.get('oversample',1)
+    # each update consumes nos samples
+    board.adc[26].setWaveform([v for v in trace for j in range(nos)])
+    out = []
+    t0 = time.perf_counter_ns()
+    for k in range(len(trace)) :
+        out.append(f.read())
+    dt = time.perf_counter_ns() - t0
+    return out,dt / len(trace)
+
+if __name__ == '__main__' :
+    trace = loadTrace(sys.argv[1]) if len(sys.argv) > 1 else syntheticTrace()
+    yf,tf = replay(FloatFilteredADC,trace)
+    yi,ti = replay(FilteredADC,trace)
+    diff = [abs(a - b) for a,b in zip(yf,yi)]
+    print("%d samples" % len(trace))
+    print("float   %7.0f ns/update" % tf)
+    print("integer %7.0f ns/update   max |diff| %d   mean |diff| %.3f   differ %.2f%%" %
+          (ti,max(diff),sum(diff) / len(diff),100.0 * sum(1 for d in diff if d) / len(diff)))
+    for nos in (4,16) :
+        y,t = replay(FilteredADC,trace,oversample=nos)
+        print("x%-2d oversampled %7.0f ns/update" % (nos,t))
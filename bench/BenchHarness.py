@@ -0,0 +1,116 @@
+# Micro-benchmark harness, for both host (simulated hardware) and Pico.
+#
+# measure() calls fn(k) n times and reports :
+#    ns_per_call        mean time per call
+#    alloc_bytes_per_call   heap bytes allocated per call
+#    gc_per_1000        garbage collections per 1000 calls
+#
+# On the host, time is from perf_counter_ns, allocation from tracemalloc
+# (peak growth during each call, in a separate pass), and collections
+# from gc.callbacks.  On MicroPython, time is from ticks_us, allocation
+# from gc.mem_alloc() deltas with the GC disabled, and collections are
+# counted as drops in gc.mem_alloc() with the GC enabled.
+#
+# Results are dicts, written out by report() as JSON, so runs from two
+# revisions can be diffed.
+
+import sys,gc,time
+import json
+
+MICROPYTHON = sys.implementation.name == 'micropython'
+
+def _hostTime(fn,n) :
+    collections = [0]
+    def cb(phase,info) :
+        if phase == 'start' : collections[0] += 1
+    gc.callbacks.append(cb)
+    try :
+        t0 = time.perf_counter_ns()
+        for k in range(n) :
+            fn(k)
+        dt = time.perf_counter_ns() - t0
+    finally :
+        gc.callbacks.remove(cb)
+    return dt,collections[0]
+
+def _hostAlloc(fn,n) :
+    import tracemalloc
+    total = 0
+    tracemalloc.start()
+    try :
+        for k in range(n) :
+            cur,peak = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            fn(k)
+            cur1,peak = tracemalloc.get_traced_memory()
+            total += peak - cur
+    finally :
+        tracemalloc.stop()
+    return total
+
+def _targetTime(fn,n) :
+    gc.collect()
+    t0 = time.ticks_us()
+    for k in range(n) :
+        fn(k)
+    dt = time.ticks_diff(time.ticks_us(),t0)
+
+    # separate pass, so mem_alloc() calls are not in the timing
+    gc.collect()
+    collections = 0
+    a = gc.mem_alloc()
+    for k in range(n) :
+        fn(k)
+        a1 = gc.mem_alloc()
+        if a1 < a : collections += 1
+        a = a1
+    return dt * 1000,collections
+
+def _targetAlloc(fn,n) :
+    gc.collect()
+    gc.disable()
+    try :
+        a0 = gc.mem_alloc()
+        for k in range(n) :
+            fn(k)
+        return gc.mem_alloc() - a0
+    finally :
+        gc.enable()
+
+def measure(name,fn,n=1000) :
+    fn(0)  # warm up, and let any one-time allocation happen
+    if MICROPYTHON :
+        dt,nc = _targetTime(fn,n)
+        alloc = _targetAlloc(fn,n)
+    else :
+        dt,nc = _hostTime(fn,n)
+        alloc = _hostAlloc(fn,n)
+    return {"name": name,
+            "calls": n,
+            "ns_per_call": round(dt / n,1),
+            "alloc_bytes_per_call": round(alloc / n,2),
+            "gc_per_1000": round(1000.0 * nc / n,3)}
+
+def revision() :
+    if MICROPYTHON :
+        return None
+    import subprocess,os
+    try :
+        return subprocess.check_output(["git","describe","--always","--dirty"],
+                    cwd=os.path.dirname(os.path.abspath(__file__)),
+                    stderr=subprocess.DEVNULL).decode().strip()
+    except Exception :
+        return None
+
+def report(results,fnam=None) :
+    doc = {"platform": sys.platform,
+           "implementation": sys.implementation.name,
+           "simulated": not MICROPYTHON,
+           "revision": revision(),
+           "results": results}
+    if MICROPYTHON : s = json.dumps(doc)
+    else           : s = json.dumps(doc,indent=1)
+    if fnam :
+        with open(fnam,"w") as f :
+            f.write(s)
+    return s
@@ -0,0 +1,70 @@
+# Per-call cost of the control loop hot paths :
+#    TankDrive.parseCommand, FilteredADC.update/read,
+#    MotorDriveBoim.setSpeed, MotorDriveIBT2.setSpeed
+#
+# Host, on the simulated board :
+#    python bench/BenchHotPaths.py [-n calls] [-o results.json]
+# Pico, with TankDrive and this directory's BenchHarness.py and
+# BenchHotPaths.py copied to the board :
+#    import BenchHotPaths ; BenchHotPaths.main()
+#
+# Prints JSON, see BenchHarness.py
+
+import sys,time
+from BenchHarness import MICROPYTHON,measure,report
+if not MICROPYTHON :
+    import simenv
+
+WORDS = [b'L255',b'R-255',b'L17',b'R0',b'L-128',b'R99',b'X0',b'q20000']
+SPEEDS = [20000,30000,40000,25000,50000,35000,45000,60000]
+
+def benchmarks(n) :
+    if MICROPYTHON :
+        import TankDrive as TD
+    else :
+        TD = simenv.fresh('TankDrive')
+        # pot noise around mid-scale, with an occasional large step
+        simenv.board.adc[26].setWaveform(
+            lambda t : 30000 + int(t * 1e6) % 997 + (20000 if int(t * 1e3) % 50 == 0 else 0))
+        simenv.board.adc[27].setWaveform(lambda t : 40000 + int(t * 1e6) % 613)
+    TD.timTankDrive.deinit()  # nothing else running while measuring
+    HW = TD.HW
+    HW.MotL.dbg.n = 0         # diagnostics quiet, as in long-running use
+    HW.MotR.dbg.n = 0
+    TD.State.dbg.n = 0
+    nW = len(WORDS)
+    nS = len(SPEEDS)
+
+    def parse(k) :
+        TD.parseCommand(WORDS[k % nW])
+    def adcUpdate(k) :
+        HW.PotL.update()
+    def adcRead(k) :
+        HW.PotR.read()
+    def boim(k) :
+        HW.MotL.setSpeed(SPEEDS[k % nS])
+    def ibt2(k) :
+        HW.MotR.setSpeed(-SPEEDS[k % nS])
+
+    HW.MotL.setSpeed(1000)   # settle direction first, so runs are
+    HW.MotR.setSpeed(-1000)  # same-direction speed changes
+    time.sleep_ms(1000)       # virtual time on host
+
+    return [measure("parseCommand",parse,n),
+            measure("FilteredADC.update",adcUpdate,n),
+            measure("FilteredADC.read",adcRead,n),
+            measure("MotorDriveBoim.setSpeed",boim,n),
+            measure("MotorDriveIBT2.setSpeed",ibt2,n)]
+
+def main(n=1000,fnam=None) :
+    print(report(benchmarks(n),fnam))
+
+if __name__ == '__main__' :
+    n = 2000
+    fnam = None
+    args = sys.argv[1:]
+    while args :
+        a = args.pop(0)
+        if   a == '-n' : n = int(args.pop(0))
+        elif a == '-o' : fnam = args.pop(0)
+    main(n,fnam)
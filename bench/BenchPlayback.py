@@ -0,0 +1,195 @@
+# Macro playback (Playback.py) : keyframe timing, ramps, loops, deadman
+#
+# Runs TankDrive.py on the simulated board.  A macro is recorded over
+# the UART (m3 .. m4), then looped (m2), with a keep-alive command every
+# 500 ms and host CPU time charged to the virtual clock times
+# CPU_SCALE, as in BenchCoreSplit.py.  Motors set as commands arrive
+# (motorLoop 0), by the motor loop on a Timer (1), and as asyncio tasks.
+#
+# Reports how late the left PWM stepped after each step keyframe was
+# due, over every pass, and whether the last pass was later than the
+# first (drift).  Then a ramp : largest gap between the PWM and the
+# straight line it should follow.  Then the same macro with no
+# keep-alive : ms from the deadman timeout to the emergency stop, and
+# whether the bridges were left braked (BOIM IN1,IN2 low, IBT-2 PWMs 0).
+# After an X, whether any PWM was driven again.  Last, saved, loaded back
+# after a reboot, and compared.
+#
+#   python bench/BenchPlayback.py
+
+import os,tempfile
+import simenv
+from simenv import board,clock,fresh,quiet,percentile
+import simasyncio
+
+CPU_SCALE = 50
+STEP_MS = 250
+SPEEDS = (40,120,200,80,160,60,240,20)  # L, all forward
+PASSES = 10
+DEADMAN_MS = 1000
+BRIDGE = (6,18,19)  # BOIM EN, IBT-2 RPWM,LPWM
+
+def stepMacro() :
+    s = b'm3'
+    for v in SPEEDS :
+        s += b' S%d L%d R%d' % (STEP_MS,v,v)
+    return s + b' m4 '
+
+def boot(mode) :
+    TD = fresh('TankDrive')
+    if mode == 'tasks' :
+        TD.timTankDrive.deinit()  # booted with Timers.  tasks instead
+        TD.HW.cs.stream.irq(handler=None)
+        TD.Settings.motorLoop = 1
+        TD.Settings.tasks = True
+        TD.startTasks()
+    elif mode :
+        TD.Settings.motorLoop = mode
+        TD.timMotor = TD.startMotorLoop()
+    return TD
+
+def run(TD,mode,end) :
+    clock.cpuScale = CPU_SCALE
+    with quiet() :
+        if mode == 'tasks' :
+            clock.at(end,TD.State.tasks.stop)
+            simasyncio.install()
+            try :
+                TD.runTasks()
+            finally :
+                simasyncio.uninstall()
+        else :
+            clock.run(end)
+    clock.cpuScale = 0
+
+def keepAlive(t,end) :
+    uart = board.uart[1]
+    while t < end :
+        uart.feed(b'q0 ',at_us=t)
+        t += 500000
+
+def name(mode) :
+    return mode if mode == 'tasks' else "motorLoop %d" % mode
+
+def duty(v) : # left PWM duty for an L command
+    return ((v * 257) >> 1) * 2
+
+def steps(mode) :
+    TD = boot(mode)
+    uart = board.uart[1]
+    t = clock.us + 10000
+    uart.feed(stepMacro(),at_us=t)
+    uart.feed(b'm2 ',at_us=t + 200000)
+    n = len(SPEEDS)
+    passMs = n * STEP_MS
+    end = t + 300000 + PASSES * passMs * 1000
+    keepAlive(t + 300000,end)
+    run(TD,mode,end)
+    P = TD.State.play
+    start = (P.t0 - P.passes * passMs) * 1000  # us, m2 applied
+    h = board.pwm[6].history
+    late = []
+    first = []
+    last = []
+    j = 0
+    for p in range(PASSES) :
+        for k in range(n) :
+            due = start + (p * n + k + 1) * STEP_MS * 1000
+            if due >= end : break
+            d = duty(SPEEDS[k])
+            while j < len(h) and (h[j][0] < due or h[j][1] != d) : j += 1
+            if j >= len(h) : break
+            l = (h[j][0] - due) / 1000.0
+            late.append(l)
+            if p == 0 : first.append(l)
+            if p == PASSES - 1 : last.append(l)
+    drift = (sum(last) / len(last) - sum(first) / len(first)) if last and first else float('nan')
+    print("%-11s %3d steps  late ms  min %5.2f  p50 %5.2f  max %5.2f   last pass - first %+5.2f ms   passes %d" %
+          (name(mode),len(late),min(late),percentile(late,50),max(late),drift,P.passes))
+
+def ramp(mode) :
+    TD = boot(mode)
+    uart = board.uart[1]
+    t = clock.us + 10000
+    uart.feed(b'm3 S0 L10 R10 T2000 L250 R250 S500 L0 R0 m4 ',at_us=t)
+    uart.feed(b'm1 ',at_us=t + 200000)
+    end = t + 3000000
+    keepAlive(t + 300000,end)
+    run(TD,mode,end)
+    P = TD.State.play
+    t0 = P.t0 * 1000
+    lo,hi = duty(10),duty(250)
+    # from 50 ms in : BOIM goes from brake to coast to forward first
+    h = [(tt,d) for tt,d in board.pwm[6].history if t0 + 50000 <= tt <= t0 + 2000000]
+    worst = 0
+    for tt,d in h :
+        ideal = lo + (hi - lo) * (tt - t0) / 2e6
+        worst = max(worst,abs(d - ideal))
+    print("%-11s ramp : %3d PWM changes, largest gap from the line %5.0f  (%.2f%% of full scale)" %
+          (name(mode),len(h),worst,100.0 * worst / 65535))
+
+def deadman(mode) :
+    TD = boot(mode)
+    TD.Settings.DeadmanTime = DEADMAN_MS
+    uart = board.uart[1]
+    t = clock.us + 10000
+    uart.feed(stepMacro(),at_us=t)
+    uart.feed(b'm2 ',at_us=t + 200000)
+    end = t + 200000 + 3 * DEADMAN_MS * 1000
+    stops = []
+    eStop = TD.emergencyStop
+    def noteStop(msg) :
+        stops.append(clock.now())
+        eStop(msg)
+    TD.emergencyStop = noteStop
+    run(TD,mode,end)
+    due = (TD.State.tHost + DEADMAN_MS) * 1000
+    braked = (board.pin[7].v,board.pin[8].v,board.pwm[18].d,board.pwm[19].d) == (0,0,0,0)
+    if stops :
+        got = "emergency stop %.2f ms after the deadman timeout, %s" % (
+            (stops[0] - due) / 1000.0,"braked" if braked else "BRIDGES STILL DRIVEN")
+    else :
+        got = "NO EMERGENCY STOP"
+    print("%-11s no keep-alive : %s, macro playing %s" % (name(mode),got,TD.State.play.on))
+
+def stop(mode) :
+    TD = boot(mode)
+    uart = board.uart[1]
+    t = clock.us + 10000
+    uart.feed(stepMacro(),at_us=t)
+    uart.feed(b'm2 ',at_us=t + 200000)
+    tX = t + 1000000
+    uart.feed(b'X ',at_us=tX)
+    end = tX + 2000000
+    keepAlive(t + 300000,end)
+    run(TD,mode,end)
+    after = [(p,tt,d) for p in BRIDGE for tt,d in board.pwm[p].history
+             if tt > tX + 50000 and d != 0]
+    print("%-11s X at 1 s : macro playing %s, bridge PWMs driven again after it %d times" %
+          (name(mode),TD.State.play.on,len(after)))
+
+def saveLoad() :
+    TD = boot(0)
+    uart = board.uart[1]
+    t = clock.us + 10000
+    uart.feed(stepMacro() + b'm5 ',at_us=t)
+    run(TD,0,t + 200000)
+    saved = TD.State.play.keys[:3 * TD.State.play.n]
+    TD = boot(0)
+    uart = board.uart[1]
+    uart.feed(b'm6 ',at_us=clock.us + 10000)
+    run(TD,0,clock.us + 100000)
+    P = TD.State.play
+    print("saved %d keyframes, %d bytes.  Loaded after reboot : %s" %
+          (len(saved) // 3,os.path.getsize(TD.MACRO_LOG),
+           "identical" if P.keys[:3 * P.n] == saved else "DIFFERENT"))
+
+if __name__ == '__main__' :
+    os.chdir(tempfile.mkdtemp())  # macro and settings written here
+    print("step every %d ms, %d passes, host CPU x%d, playback every %d ms" %
+          (STEP_MS,PASSES,CPU_SCALE,fresh('TankDrive').Settings.tPlay))
+    for mode in (0,1,'tasks') : steps(mode)
+    for mode in (0,1,'tasks') : ramp(mode)
+    for mode in (0,1,'tasks') : deadman(mode)
+    for mode in (0,1,'tasks') : stop(mode)
+    saveLoad()
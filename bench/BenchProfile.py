@@ -0,0 +1,103 @@
+# Motion profile vs. step commands, on a full-speed reversal
+#
+# Runs TankDrive.py on the simulated board with the 1 ms motor loop on a
+# Timer.  Both motors are sent full forward, then full reverse.  Without
+# a profile the drivers brake, wait stopDelay() on the restart Timer,
+# then step to full reverse.  With one, each tick moves one table step,
+# through zero.
+#
+# Reports the largest change in signed drive (duty, with direction) in
+# any 1 ms, a proxy for the current spike, the time to reach full
+# reverse, and restart Timer waits.  Then tick() cost and heap bytes per
+# call on the host.
+#
+#   python bench/BenchProfile.py [tAccel tDecel tJerk]   (ms, default 500 250 100)
+
+import sys,time,tracemalloc
+import simenv
+from simenv import board,clock,fresh,quiet
+from MotorDrive import MotorDrive
+from MotorDriveIBT2 import MotorDriveIBT2
+
+FULL = 255
+
+def lastAt(hist,t,default=0) :
+    v = default
+    for tt,x in hist :
+        if tt > t : break
+        v = x
+    return v
+
+def run(profile) :
+    TD = fresh('TankDrive')
+    if profile :
+        for m in (TD.HW.MotL,TD.HW.MotR) :
+            m.setProfile(TD.Settings.tMotor,*profile)
+    TD.Settings.motorLoop = 1
+    TD.timMotor = TD.startMotorLoop()
+    waits = [0]
+    for m in (TD.HW.MotL,TD.HW.MotR) :
+        m.dbg.n = 0
+        sr = m.scheduleRestart
+        def counted(sd,sr=sr) :
+            waits[0] += 1
+            sr(sd)
+        m.scheduleRestart = counted
+    uart = board.uart[1]
+    uart.feed(b'L%d R%d ' % (FULL,FULL),at_us=10000)
+    tRev = uart.feed(b'L%d R%d ' % (-FULL,-FULL),at_us=2000000)
+    with quiet() :
+        clock.run(4000000)
+
+    # Boim MotL : PWM 6, Fwd 7, Rev 8.  IBT2 MotR : L 18, R 19
+    fwd = board.pin[7].history
+    rev = board.pin[8].history
+    def boimDir(t) :
+        f = lastAt(fwd,t)
+        r = lastAt(rev,t)
+        return 1 if f and not r else (-1 if r and not f else 0)
+    out = {}
+    L = [(t,d * boimDir(t)) for t,d in board.pwm[6].history]
+    hL = board.pwm[18].history
+    hR = board.pwm[19].history
+    times = sorted(set(t for t,d in hL + hR))
+    R = [(t,lastAt(hL,t) - lastAt(hR,t)) for t in times]
+    for name,h in (("Boim",L),("IBT2",R)) :
+        worst = 0
+        for i in range(len(h)) :  # largest change within any 1 ms window
+            j = i
+            while j + 1 < len(h) and h[j+1][0] - h[i][0] <= 1000 : j += 1
+            for k in range(i,j + 1) :
+                worst = max(worst,abs(h[k][1] - (h[i-1][1] if i else 0)))
+        tFull = next((t for t,d in h if t >= tRev and d <= -FULL * 257 + 8),None)
+        out[name] = (worst,None if tFull is None else (tFull - tRev) / 1000.0)
+    return out,waits[0]
+
+def tickCost(profile,n=20000) :
+    board.reset()
+    m = MotorDriveIBT2(18,19,'T')
+    m.setSpeed = lambda v : None   # just the profile
+    m.setProfile(1,*profile)
+    targets = [MotorDrive.MAX_PWM,-MotorDrive.MAX_PWM]
+    def loop() :
+        for k in range(n) :
+            if k % 1000 == 0 : m.setTarget(targets[(k // 1000) & 1])
+            m.tick()
+    t0 = time.perf_counter_ns()
+    loop()
+    dt = time.perf_counter_ns() - t0
+    tracemalloc.start()
+    loop()
+    cur,peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return dt / n,peak / n
+
+if __name__ == '__main__' :
+    prof = tuple(int(a) for a in sys.argv[1:4]) if len(sys.argv) > 3 else (500,250,100)
+    for name,p in (("step",None),("profile",prof)) :
+        out,waits = run(p)
+        for drv,(worst,tFull) in out.items() :
+            print("%-7s %-4s  max |d drive|/ms %5d   to full reverse %s   restart waits %d" %
+                  (name,drv,worst,"%7.1f ms" % tFull if tFull is not None else "  never",waits))
+    ns,b = tickCost(prof)
+    print("tick() %.0f ns, %.2f heap bytes per call (host)" % (ns,b))
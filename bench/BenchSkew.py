@@ -0,0 +1,89 @@
+# Left/right PWM skew, with and without Settings.syncPWM
+#
+# Runs TankDrive.py on the simulated board in each motor loop mode.
+# Sends straight-line commands, both sides the same : starts from a
+# stop, speed changes, and reversals, and measures how far apart the
+# left (Boim, GP6) and right (IBT2, GP18/19) changes to the commanded
+# duty land.  A reversal lands after each side's brake and restart.
+# Host CPU time is charged to the virtual clock, times CPU_SCALE, so the
+# time spent between the two drivers' writes shows too.
+#
+# A duty written reaches the output when the slice's counter next wraps
+# (sim PWM.wrapAfter()), so skew is measured there, the latch, the one
+# the treads see.  Without syncPWM nothing aligns the counters, so each
+# slice starts at a random phase, as slices set up at different times
+# do.  With it, PWMGroup.align() restarts them together.  Last, syncPWM
+# with the left PWM at 500 Hz, the right at 1 kHz : align() refuses, and
+# the latches can be a period apart.  Register accesses and duty writes
+# are simulated hardware, so not charged (simtime.uncharged()).  An odd
+# 1000 with syncPWM is still the host : the OS stopping the simulator
+# between two writes, for some 20 us, charged x50.
+#
+#   python bench/BenchSkew.py [rounds]
+
+import sys,gc,random
+import simenv
+from simenv import board,clock,fresh,quiet,percentile
+
+CPU_SCALE = 50
+
+LEFT  = [6]
+RIGHT = [18,19]
+
+def run(loop,sync,rounds,freqL=None,seed=1) :
+    TD = fresh('TankDrive')
+    if not sync :  # undo launch-time grouping
+        TD.Settings.syncPWM = False
+        for m in (TD.HW.MotL,TD.HW.MotR) : m.group = None
+        TD.HW.MotL.PWM  = TD.HW.MotL.PWM.pwm
+        TD.HW.MotR.Lpwm = TD.HW.MotR.Lpwm.pwm
+        TD.HW.MotR.Rpwm = TD.HW.MotR.Rpwm.pwm
+        rng = random.Random(seed)
+        for s in range(8) :  # unaligned : counters started whenever
+            t0 = clock.us - rng.randint(0,1000000)
+            for p in board.pwm.values() :
+                if (p.id >> 1) & 7 == s : p.t0 = t0
+    if freqL is not None :
+        TD.HW.MotL.PWM.freq(freqL)
+        TD.HW.pwmGroup.align()  # as at boot.  refuses
+    TD.Settings.motorLoop = loop
+    if loop : TD.timMotor = TD.startMotorLoop()
+    for m in (TD.HW.MotL,TD.HW.MotR) : m.dbg.n = 0
+    uart = board.uart[1]
+    t = clock.us + 10000
+    sent = {"start" : [],"change" : [],"reverse" : []}
+    for k in range(rounds) :
+        v = 100 + (k * 37) % 150
+        for kind,s in (("start",v),("change",v + 50),("reverse",-v),(None,0)) :
+            cmd = b'L%d R%d ' % (s,s) if kind else b'X '
+            tc = uart.feed(cmd,at_us=t)
+            if kind : sent[kind].append((tc,abs(TD.HW.MotL.clipPWM(s * 257))))
+            t += 400000
+    gc.collect()
+    gc.disable()  # the host's collections are not the board's
+    clock.cpuScale = CPU_SCALE
+    with quiet() :
+        clock.run(t + 100000)
+    clock.cpuScale = 0
+    gc.enable()
+    TD.State.loopRun = False
+    clock.run(clock.us + 10000)  # core 1 loop exits
+    out = {}
+    for kind,ts in sent.items() :
+        out[kind] = [s for s in (board.pwmSkew(LEFT,RIGHT,tc,d,latched=True) for tc,d in ts)
+                     if s is not None]
+    return out
+
+def report(name,out) :
+    print("%-24s" % name +
+          "".join("  %-7s p50 %5d max %5d" % (kind,percentile(s,50),max(s) if s else -1)
+                  for kind,s in out.items()))
+
+if __name__ == '__main__' :
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    print("L/R skew at the PWM latch, us, over %d rounds, host CPU x%d" % (rounds,CPU_SCALE))
+    for loop in (0,1,2) :
+        for sync in (False,True) :
+            report("motorLoop %d  sync %s" % (loop,"on" if sync else "off"),
+                   run(loop,sync,rounds))
+    report("motorLoop 1  sync on, L 500 Hz",run(1,True,rounds,freqL=500))
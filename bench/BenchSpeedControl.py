@@ -0,0 +1,132 @@
+# Closed-loop wheel speed control against a simulated motor and tread
+#
+# Runs TankDrive.py on the simulated board, with a MotorPlant (sim/plant.py)
+# on each side turning the encoder pins.  The right tread drags more
+# than the left, as on uneven ground.  Both sides get the same
+# straight-line commands : a start, a speed change, a stop.
+#
+# Reports, open loop and then closed loop at several control rates, each
+# side's settled speed error, the L/R speed mismatch (what makes the
+# vehicle yaw), 10-90% rise time and overshoot.  Then a stall : the
+# right tread is held for a second, and let go, showing the overshoot
+# anti-windup keeps small.  Then SpeedControl.tick() cost on the host.
+#
+#   python bench/BenchSpeedControl.py
+
+import time,tracemalloc
+import simenv
+from simenv import board,clock,fresh,quiet
+from plant import MotorPlant,boimDrive,ibt2Drive
+from SpeedControl import SpeedControl
+
+FULL_CPS = 2000
+DRAG = (0.0,1500.0)   # counts/s/s, L and R
+
+def setup(closed,tSpeed=10,pid=None) :
+    TD = fresh('TankDrive')
+    S = TD.Settings
+    S.motorLoop = 1
+    if closed :
+        S.closedLoop = True
+        S.tSpeed = tSpeed
+        kp,ki,kd,kff = pid if pid else S.speedPID
+        TD.HW.encoders()
+        TD.HW.DrvL = SpeedControl(TD.HW.MotL,TD.HW.EncL,FULL_CPS,tSpeed,kp,ki,kd,kff)
+        TD.HW.DrvR = SpeedControl(TD.HW.MotR,TD.HW.EncR,FULL_CPS,tSpeed,kp,ki,kd,kff)
+    TD.timMotor = TD.startMotorLoop()
+    for m in (TD.HW.MotL,TD.HW.MotR) : m.dbg.n = 0
+    pL = MotorPlant(boimDrive(6,7,8),2,3,fullCps=FULL_CPS,drag=DRAG[0])
+    pR = MotorPlant(ibt2Drive(18,19),14,15,fullCps=FULL_CPS,drag=DRAG[1])
+    pL.start()
+    pR.start()
+    return TD,pL,pR
+
+def stepStats(p,t0,t1,goal) : # rise time ms, overshoot %, settled error %
+    h = [(t,w) for t,w in p.history if t0 <= t < t1]
+    w0 = h[0][1]
+    span = goal - w0
+    def when(f) :
+        return next((t for t,w in h if (w - w0) * span >= f * span * span),None)
+    t10 = when(0.1)
+    t90 = when(0.9)
+    rise = (t90 - t10) / 1000.0 if t10 and t90 else float('nan')
+    peak = max(((w - goal) * (1 if span > 0 else -1) for t,w in h),default=0)
+    tail = [w for t,w in h if t >= t1 - 200000]
+    settled = sum(tail) / len(tail)
+    return rise,100.0 * max(0.0,peak) / FULL_CPS,100.0 * (settled - goal) / FULL_CPS,settled
+
+def steps(closed,tSpeed=10) :
+    TD,pL,pR = setup(closed,tSpeed)
+    uart = board.uart[1]
+    t = clock.us + 10000
+    plan = ((150,1500000),(220,1500000),(-150,2000000))
+    marks = []
+    for v,dur in plan :
+        tc = uart.feed(b'L%d R%d ' % (v,v),at_us=t)
+        marks.append((tc,tc + dur,v * FULL_CPS / 255.0))
+        t = tc + dur
+        for k in range(1,dur // 500000 + 1) :  # keep the deadman happy
+            uart.feed(b'L%d R%d ' % (v,v),at_us=tc + k * 500000 - 100000)
+    with quiet() :
+        clock.run(t)
+    TD.State.loopRun = False
+    out = []
+    for t0,t1,goal in marks :
+        sL = stepStats(pL,t0,t1,goal)
+        sR = stepStats(pR,t0,t1,goal)
+        out.append((goal,sL,sR))
+    return out
+
+def stall(tSpeed=10) :
+    TD,pL,pR = setup(True,tSpeed)
+    uart = board.uart[1]
+    t = clock.us + 10000
+    for k in range(8) :
+        uart.feed(b'L150 R150 ',at_us=t + k * 400000)
+    drag = pR.drag
+    clock.at(t + 1000000,lambda : setattr(pR,'drag',1e6),charge=False)  # held
+    clock.at(t + 2000000,lambda : setattr(pR,'drag',drag),charge=False) # let go
+    with quiet() :
+        clock.run(t + 3200000)
+    goal = 150 * FULL_CPS / 255.0
+    peak = max(w for tt,w in pR.history if tt >= t + 2000000)
+    return 100.0 * (peak - goal) / FULL_CPS,TD.HW.DrvR.sum
+
+def tickCost(n=20000) :
+    board.reset()
+    from MotorDriveIBT2 import MotorDriveIBT2
+    from Encoder import QuadEncoder
+    m = MotorDriveIBT2(18,19,'T')
+    m.setTarget = lambda v : None
+    enc = QuadEncoder(14,15)
+    c = SpeedControl(m,enc,FULL_CPS,10)
+    c.setTarget(30000)
+    def loop() :
+        for k in range(n) :
+            enc.n += 3 + (k & 7)
+            c.tick()
+    t0 = time.perf_counter_ns()
+    loop()
+    dt = time.perf_counter_ns() - t0
+    tracemalloc.start()
+    loop()
+    cur,peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return dt / n,peak / n
+
+def report(name,out) :
+    for goal,sL,sR in out :
+        print("%-13s goal %6.0f cps   L rise %6.1f ms over %5.1f%% err %6.1f%%"
+              "   R rise %6.1f ms over %5.1f%% err %6.1f%%   L-R %6.1f%%" %
+              (name,goal,sL[0],sL[1],sL[2],sR[0],sR[1],sR[2],
+               100.0 * (sL[3] - sR[3]) / FULL_CPS))
+
+if __name__ == '__main__' :
+    print("full speed %d counts/s.  drag L %g R %g counts/s/s" % ((FULL_CPS,) + DRAG))
+    report("open loop",steps(False))
+    for ts in (2,5,10,20) :
+        report("closed %2d ms" % ts,steps(True,ts))
+    over,sum_ = stall()
+    print("stall 1 s, then let go : R overshoot %.1f%% of full speed" % over)
+    ns,b = tickCost()
+    print("SpeedControl.tick() %.0f ns, %.2f heap bytes per call (host)" % (ns,b))
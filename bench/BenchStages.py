@@ -0,0 +1,114 @@
+# Where a tick's time goes : stage profiler (Profiler.py) in the simulator
+#
+# Runs TankDrive.py on the simulated board with _PROF on, under a stream
+# of L/R commands, queries and binary frames, first setting motors as
+# commands arrive (motorLoop 0), then with the motor loop on a Timer
+# (motorLoop 1) and a motion profile.  Host CPU time is charged to the
+# virtual clock times CPU_SCALE, as in BenchCoreSplit.py, so ticks_us()
+# in the profiler's marks sees it.
+#
+# Prints the 'p' report, then a flame-style chart of each tick : total
+# time per stage, widths in proportion.  -o writes the same as folded
+# stacks ("cmd;parse 1234" lines) for flamegraph.pl or speedscope.
+# Last, what one mark() costs on the host, and heap bytes per call.  The
+# charged times above include the marks themselves.
+#
+#   python bench/BenchStages.py [-o stages.folded]
+
+import sys,random,time,tracemalloc
+import simenv
+from simenv import board,clock,fresh,quiet
+from WordParser import OP_DRIVE,FRAME_LEN,packFrame
+from Profiler import Profiler
+
+CPU_SCALE = 50
+WIDTH = 72
+
+def frame(vL,vR,seq) :
+    buf = bytearray(FRAME_LEN)
+    packFrame(buf,OP_DRIVE,vL,vR,seq)
+    return bytes(buf)
+
+def run(motorLoop,seconds=3,seed=1) :
+    TD = fresh('TankDrive')
+    S = TD.Settings
+    if motorLoop :
+        S.motorLoop = motorLoop
+        S.tAccel = 500
+        for m in (TD.HW.MotL,TD.HW.MotR) :
+            m.setProfile(S.tMotor,S.tAccel,S.tDecel,S.tJerk)
+        TD.timMotor = TD.startMotorLoop()
+    TD._PROF = 1  # const() is a plain global here
+    TD.makeProfilers(S.tSlow)
+    for m in (TD.HW.MotL,TD.HW.MotR) : m.dbg.n = 0
+    rng = random.Random(seed)
+    uart = board.uart[1]
+    t0 = clock.us + 10000
+    t = t0
+    seq = 0
+    while t < t0 + seconds * 1000000 :
+        k = rng.randint(0,9)
+        if   k < 6 : uart.feed(b'L%d R%d ' % (rng.randint(-250,250),rng.randint(-250,250)),at_us=t)
+        elif k < 9 :
+            seq = (seq + 1) & 0xFF
+            uart.feed(frame(rng.randint(-30000,30000),rng.randint(-30000,30000),seq),at_us=t)
+        else       : uart.feed(b'w ',at_us=t)
+        t += rng.randint(2000,40000)
+    clock.cpuScale = CPU_SCALE
+    with quiet() :
+        clock.run(t0 + seconds * 1000000)
+    clock.cpuScale = 0
+    TD.State.loopRun = False
+    return TD
+
+def flame(P) : # text flame chart of Profiler P
+    n = P.n
+    total = P.sum[n]
+    if not total : return
+    print("%-*s %8d us" % (WIDTH,("[" + P.name + " x%d]" % P.ticks).center(WIDTH,'='),total))
+    line = ""
+    for i in range(n) :
+        w = int(round(WIDTH * P.sum[i] / total))
+        if w < 1 : continue
+        label = P.stages[i][:max(0,w - 1)]
+        line += ("|" + label).ljust(w,'-')
+    print(line.ljust(WIDTH,' ') + "|")
+    for i in range(n) :
+        print("   %-8s %5.1f%%  mean %6.1f us  max %6d us" %
+              (P.stages[i],100.0 * P.sum[i] / total,
+               P.sum[i] / P.cnt[i] if P.cnt[i] else 0.0,P.max[i]))
+
+def markCost(n=20000) :
+    P = Profiler("x",("a","b"),1000)
+    def loop() :
+        for k in range(n // 2) :
+            P.begin()
+            P.mark(0)
+            P.mark(1)
+            P.end()
+    t0 = time.perf_counter_ns()
+    loop()
+    dt = time.perf_counter_ns() - t0
+    tracemalloc.start()
+    loop()
+    cur,peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return dt / n,peak / n
+
+if __name__ == '__main__' :
+    out = None
+    if len(sys.argv) > 2 and sys.argv[1] == '-o' : out = open(sys.argv[2],'w')
+    for motorLoop in (0,1) :
+        TD = run(motorLoop)
+        print("---- motorLoop %d, host CPU x%d" % (motorLoop,CPU_SCALE))
+        for P in (TD.State.prof,TD.State.profM) :
+            if P.ticks :
+                P.show()
+                print()
+                flame(P)
+                print()
+                if out :
+                    for line in P.folded() : out.write("loop%d;%s\n" % (motorLoop,line))
+    if out : out.close()
+    ns,b = markCost()
+    print("mark(), with begin()/end() shared : %.0f ns, %.2f heap bytes per call (host)" % (ns,b))
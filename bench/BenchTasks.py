@@ -0,0 +1,113 @@
+# Asyncio tasks (Settings.tasks, Runtime.py) vs. Timers
+#
+# Runs TankDrive.py on the simulated board, its Timers and UART IRQ as
+# usual, with the motor loop on a Timer (Settings.motorLoop = 1), then as
+# asyncio tasks on CPython's asyncio, run on the virtual clock by
+# sim/simasyncio.py, with the motor loop a task, and on core 1
+# (motorLoop = 2).  Left motor commands arrive at random, with a
+# trace dump ('t', 64 lines printed) every so often and command diag
+# messages on, and host CPU time charged to the virtual clock times
+# CPU_SCALE, as in BenchCoreSplit.py.
+#
+# Reports how late motor loop passes started, and the delay from a
+# command's delimiter arriving to the PWM change.  Then each task's lag
+# ('j'), and whether two runs with no CPU charge gave the very same PWM
+# history, and how many times faster than real time they ran.
+#
+#   python bench/BenchTasks.py [seconds]
+
+import sys,random,time
+import simenv
+from simenv import board,clock,fresh,quiet,percentile
+import simasyncio
+
+CPU_SCALE = 50
+WINDOW = 200000  # us, command to PWM, at most
+
+def boot(tasks,motorLoop) :
+    TD = fresh('TankDrive')
+    TD.Settings.motorLoop = motorLoop
+    if tasks :
+        TD.timTankDrive.deinit()      # booted with Timers.  tasks instead
+        TD.HW.cs.stream.irq(handler=None)
+        TD.Settings.tasks = True
+        TD.startTasks()
+    else :
+        TD.timMotor = TD.startMotorLoop()
+    TD.State.dbg.n = 1 << 30  # command diag messages on, forever
+    return TD
+
+def feed(seconds,seed) :
+    uart = board.uart[1]
+    rng = random.Random(seed)
+    sent = []
+    t = clock.us + 10000
+    end = t + int(seconds * 1e6)
+    k = 0
+    while t < end :
+        t += rng.randint(5000,40000)
+        k += 1
+        if k % 29 == 0 :
+            uart.feed(b't ',at_us=t)
+        else :
+            v = 10 + k % 200  # always changes, never reverses
+            sent.append((uart.feed(b'L%d ' % v,at_us=t),v * 257))
+    return sent,end + 100000
+
+def run(tasks,seconds,cpuScale,motorLoop=1,seed=1) :
+    TD = boot(tasks,motorLoop)
+    late = []
+    stats = TD.State.loopStats
+    add = stats.add
+    def noteLate(l,period) :
+        late.append(l)
+        add(l,period)
+    stats.add = noteLate
+    sent,end = feed(seconds,seed)
+    clock.cpuScale = cpuScale
+    t0 = time.perf_counter()
+    with quiet() :
+        if tasks :
+            clock.at(end,TD.State.tasks.stop)
+            simasyncio.install()
+            try :
+                TD.runTasks()
+            finally :
+                simasyncio.uninstall()
+        else :
+            clock.run(end)
+    host = time.perf_counter() - t0
+    clock.cpuScale = 0
+    TD.State.loopRun = False
+    h = board.pwm[6].history
+    lat = []
+    j = 0
+    for tCmd,duty in sent :
+        i = j
+        while i < len(h) and (h[i][0] < tCmd or h[i][1] != duty) :
+            i += 1
+        if i >= len(h) or h[i][0] > tCmd + WINDOW : continue
+        j = i
+        lat.append((h[j][0] - tCmd) / 1000.0)
+    return TD,late,lat,list(h),end / 1e6 / host
+
+def report(name,late,lat) :
+    print("%-14s loop late us  p50 %5d  p99 %6d  max %6d   command to PWM ms  p50 %6.2f  p99 %6.2f  max %6.2f" %
+          (name,percentile(late,50),percentile(late,99),max(late),
+           percentile(lat,50),percentile(lat,99),max(lat)))
+
+if __name__ == '__main__' :
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 5.0
+    print("core 0 load : commands + diag prints, host CPU x%d" % CPU_SCALE)
+    TD,late,lat,h,x = run(False,seconds,CPU_SCALE)
+    report("Timers",late,lat)
+    TD,late,lat,h,x = run(True,seconds,CPU_SCALE)
+    report("tasks",late,lat)
+    print("'j', tasks :")
+    TD.State.tasks.show()
+    TD,late,lat,h,x = run(True,seconds,CPU_SCALE,motorLoop=2)
+    report("tasks, core 1",late,lat)
+    _,_,_,h1,x1 = run(True,seconds,0)
+    _,_,_,h2,x2 = run(True,seconds,0)
+    print("tasks, no CPU charge : two runs %s, %d PWM changes, %.0fx real time" %
+          ("identical" if h1 == h2 else "DIFFER",len(h1),min(x1,x2)))
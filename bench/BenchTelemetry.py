@@ -0,0 +1,79 @@
+# Binary telemetry : frames decoded, frames skipped on a slow link,
+# cost to the motor loop
+#
+# Runs TankDrive.py on the simulated board, driving for 2 s with
+# telemetry every 20 ms, at 115200 and 9600 baud.  Everything the board
+# wrote to UART(1) goes through tools/DecodeTelemetry.py.  At 9600 a
+# 45 byte frame takes 47 ms to send, so about every other frame should
+# be skipped, never waited for.
+#
+# Reports frames sent, skipped, decoded, bad and lost, link use, motor
+# loop lateness with and without telemetry (host CPU time charged to the
+# virtual clock times CPU_SCALE, as in BenchCoreSplit.py), and one
+# frame's cost on the host (telemetryCB(), and heap bytes allocated).
+#
+#   python bench/BenchTelemetry.py
+
+import os,sys,time,tracemalloc
+import simenv
+from simenv import board,clock,fresh,quiet
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),'..','tools'))
+from DecodeTelemetry import decode
+
+RUN_US = 2000000
+CPU_SCALE = 50
+
+def run(baud,tTelemetry) :
+    TD = fresh('TankDrive')
+    uart = board.uart[1]
+    uart.init(baudrate=baud)
+    TD.Settings.motorLoop = 1
+    TD.timMotor = TD.startMotorLoop()
+    for m in (TD.HW.MotL,TD.HW.MotR) : m.dbg.n = 0
+    TD.startTelemetry(tTelemetry)
+    t0 = clock.us + 10000
+    t = t0
+    v = 60
+    while t < t0 + RUN_US :
+        uart.feed(b'L%d R%d ' % (v,-v),at_us=t)
+        v = -v if v > 150 else v + 30
+        t += 200000
+    clock.cpuScale = CPU_SCALE
+    with quiet() :
+        clock.run(t0 + RUN_US)
+    clock.cpuScale = 0
+    TD.startTelemetry(0)
+    return TD,uart
+
+def frameCost(n=2000) :
+    TD,uart = run(115200,0)
+    cb = TD.telemetryCB
+    T = TD.Telem
+    T.busy = None  # every frame sent
+    def loop() :
+        for k in range(n) : cb(None)
+    t0 = time.perf_counter_ns()
+    loop()
+    dt = time.perf_counter_ns() - t0
+    tracemalloc.start()
+    loop()
+    cur,peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return dt / n,peak / n
+
+if __name__ == '__main__' :
+    TD,uart = run(115200,0)
+    ls = TD.State.loopStats
+    print("telemetry off          motor loop late us mean %4d max %4d" %
+          (ls.sum // ls.n,ls.max))
+    for baud in (115200,9600) :
+        TD,uart = run(baud,20)
+        T = TD.Telem
+        rows,d = decode(bytes(uart.tx))
+        ls = TD.State.loopStats
+        use = 100.0 * len(uart.tx) * uart.charTime / RUN_US
+        print("%6d baud, 20 ms    motor loop late us mean %4d max %4d   "
+              "sent %3d skipped %3d  decoded %3d bad %d lost %d   link %3.0f%% busy" %
+              (baud,ls.sum // ls.n,ls.max,T.sent,T.skipped,len(rows),d.bad,d.lost,use))
+    ns,b = frameCost()
+    print("one %d byte frame : %.0f ns, %.2f heap bytes (host)" % (TD.Telem.n,ns,b))
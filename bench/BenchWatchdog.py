@@ -0,0 +1,112 @@
+# Watchdog : control loop faults, to the bridges off
+#
+# Runs TankDrive.py on the simulated board, motor loop on a Timer
+# (Settings.motorLoop = 1), both motors driven, with a stream of
+# commands and host CPU time charged to the virtual clock times
+# CPU_SCALE, as in BenchCoreSplit.py.  One second in, a fault :
+#
+#  * none
+#  * motor loop stops : its Timer callback gone, e.g. it raised
+#  * core 0 hangs : a callback stuck for HANG_MS
+#  * command tick slow : every TankDriveUpdate() over its period
+#
+# each with no watchdog, and with Settings.wdt = TIMEOUT_MS.  Reports
+# ms from the fault to every bridge PWM at 0, or how long they were
+# still driven when the run ended, and the watchdog's feeds, longest gap
+# between them, and ticks over budget ('h').
+#
+# Then boots again after a watchdog reset : the motors should be braked,
+# BOIM EN high with IN1,IN2 low and IBT-2 PWMs 0, and the reset counted.
+#
+#   python bench/BenchWatchdog.py
+
+import os,sys,time,tempfile
+import simenv
+from simenv import board,clock,fresh,quiet
+import machine
+
+CPU_SCALE = 50
+TIMEOUT_MS = 1000
+HANG_MS = 3000
+RUN_US = 4000000
+T_FAULT = 1000000
+BRIDGE = (6,18,19)
+
+def dutyAt(h,t) :
+    d = 0
+    for tt,dd in h :
+        if tt > t : break
+        d = dd
+    return d
+
+def boot(wdt,cause=machine.PWRON_RESET) :
+    machine._resetCause = cause
+    sys.modules.pop('SafeBoot',None)  # reads reset_cause()
+    TD = fresh('TankDrive')
+    TD.Settings.motorLoop = 1
+    TD.timMotor = TD.startMotorLoop()
+    if wdt :
+        TD.Settings.wdt = wdt
+        TD.startWatchdog()
+    return TD
+
+def slowTick(TD) : # every command tick now takes longer than its period
+    heartbeat = TD.heartbeat
+    def slow(t) :
+        heartbeat(t)
+        time.sleep_ms(TD.Settings.tSlow + 20)
+    TD.heartbeat = slow
+
+def run(fault,wdt) :
+    TD = boot(wdt)
+    uart = board.uart[1]
+    t0 = clock.us
+    for k in range(RUN_US // 50000) :
+        v = 100 + k % 50
+        uart.feed(b'L%d R%d ' % (v,v),at_us=t0 + 10000 + k * 50000)
+    tFault = t0 + T_FAULT
+    if fault == 'motor loop stops' :
+        clock.at(tFault,TD.timMotor.deinit)
+    elif fault == 'core 0 hangs' :
+        clock.at(tFault,lambda : time.sleep_ms(HANG_MS))
+    elif fault == 'command tick slow' :
+        clock.at(tFault,lambda : slowTick(TD))
+    clock.cpuScale = CPU_SCALE
+    with quiet() :
+        clock.run(t0 + RUN_US)
+    clock.cpuScale = 0
+    end = clock.us
+    ts = []
+    for p in BRIDGE :
+        h = board.pwm[p].history
+        if dutyAt(h,tFault) == 0 : continue
+        ts.append(next((t for t,d in h if t >= tFault and d == 0),None))
+    if None in ts : off = "still driven %5d ms on" % ((end - tFault) // 1000)
+    elif ts       : off = "off after %10d ms" % ((max(ts) - tFault) // 1000)
+    else          : off = "off before the fault"
+    w = TD.State.wdt
+    if w is None : return off,""
+    reset = "reset" if board.tReset is not None else "no reset"
+    return off,"%-8s feeds %5d  longest gap ms %4d  over budget : command %d, motor %d" % (
+        reset,w.feeds,w.gap,w.slow[0],w.slow[1])
+
+def reboot() :
+    TD = boot(0,machine.WDT_RESET)
+    with quiet() :
+        clock.run(clock.us + 100000)
+    boim = (board.pwm[6].d,board.pin[7].v,board.pin[8].v)
+    ibt2 = (board.pwm[18].d,board.pwm[19].d)
+    return boim,ibt2,TD.State.wdtResets
+
+if __name__ == '__main__' :
+    os.chdir(tempfile.mkdtemp())  # settings and fault log written here
+    print("fault at 1 s, host CPU x%d, watchdog timeout %d ms" % (CPU_SCALE,TIMEOUT_MS))
+    for fault in ('none','motor loop stops','core 0 hangs','command tick slow') :
+        for wdt in (0,TIMEOUT_MS) :
+            off,stats = run(fault,wdt)
+            print("%-18s %-12s %-28s %s" % (fault,"watchdog" if wdt else "no watchdog",off,stats))
+    for k in range(2) :
+        boim,ibt2,n = reboot()
+        print("boot after watchdog reset : BOIM EN,IN1,IN2 %s  IBT-2 RPWM,LPWM %s  watchdog resets %d" %
+              (boim,ibt2,n))
+    machine._resetCause = machine.PWRON_RESET
@@ -0,0 +1,137 @@
+# Host-side benchmark: ring-buffer WordParser vs. the original parser
+#
+# Streams "Lnnn Rnnn" commands through each parser in UART-FIFO sized
+# chunks and reports parse rate, and heap bytes allocated per command
+# as seen by tracemalloc.  Words are decoded to values as TankDrive.py
+# would.  The same drive updates are then sent as binary frames.
+# bytes/motor is link bytes per motor update, which sets the command
+# rate the 115200 baud link can carry.
+#
+# Then a 200 word backlog, ending in a stop, is read at once through a
+# depth 16 queue under each overflow policy.
+#
+#   python bench/BenchWordParser.py [nCommands]
+
+import os,sys,io,time,tracemalloc,contextlib
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),'..'))
+
+from WordParser import WordParser,parseInt,isFrame,int16,packFrame,OP_DRIVE,FRAME_LEN
+from WordParser import DROP_NEWEST,DROP_OLDEST,SIGNAL
+from WordParserLegacy import WordParser as LegacyWordParser
+
+CHUNK = 32  # RP2040 UART FIFO depth
+
+class ChunkStream() :  # just enough of machine.UART for WordParser
+    def __init__(self) :
+        self.data = b''
+        self.pos = 0
+    def feed(self,data) :
+        self.data = data
+        self.pos = 0
+    def any(self) :
+        return len(self.data) - self.pos
+    def read(self) :
+        b = self.data[self.pos:]
+        self.pos = len(self.data)
+        return b
+    def readinto(self,buf) :
+        n = min(len(buf),len(self.data) - self.pos)
+        buf[:n] = self.data[self.pos:self.pos+n]
+        self.pos += n
+        return n
+
+def commandStream(n) :
+    words = []
+    for k in range(n) :
+        v = (k * 37) % 511 - 255
+        words.append(('L%d ' if k & 1 else 'R%d ') % v)
+    s = ''.join(words).encode()
+    return [s[k:k+CHUNK] for k in range(0,len(s),CHUNK)]
+
+def frameStream(n) :  # same values as commandStream, two per frame
+    s = bytearray(FRAME_LEN * (n // 2))
+    f = bytearray(FRAME_LEN)
+    for k in range(n // 2) :
+        vL = (((2*k+1) * 37) % 511 - 255) * 128
+        vR = (((2*k) * 37) % 511 - 255) * 128
+        s[k*FRAME_LEN:(k+1)*FRAME_LEN] = packFrame(f,OP_DRIVE,vL,vR,k)
+    s = bytes(s)
+    return [s[k:k+CHUNK] for k in range(0,len(s),CHUNK)]
+
+def legacyDecode(w) :  # as original TankDrive.parseCommand
+    return int(w[1:].decode())
+
+def decode(w) :  # motor updates carried by word
+    if isFrame(w) :
+        int16(w,1)
+        int16(w,3)
+        return 2
+    parseInt(w,1)
+    return 1
+
+def drain(p) :
+    n = 0
+    legacy = isinstance(p,LegacyWordParser)
+    while p.ready() :
+        w = p.next()
+        if legacy :
+            legacyDecode(w)
+            n += 1
+        else :
+            n += decode(w)
+    return n
+
+def rate(parser,chunks) :
+    s = parser.stream
+    nb = 0
+    nc = 0
+    t0 = time.perf_counter()
+    for c in chunks :
+        s.feed(c)
+        nb += len(c)
+        nc += drain(parser)
+    dt = time.perf_counter() - t0
+    return nb / dt, nc / dt, nc
+
+def allocs(parser,chunks) :
+    s = parser.stream
+    total = 0
+    nc = 0
+    tracemalloc.start()
+    for c in chunks :
+        s.feed(c)
+        cur,_ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        nc += drain(parser)
+        _,peak = tracemalloc.get_traced_memory()
+        total += peak - cur
+    tracemalloc.stop()
+    return total / max(nc,1)
+
+def bench(name,cls,chunks) :
+    with contextlib.redirect_stdout(io.StringIO()) : # legacy parser prints
+        parser = cls(ChunkStream())
+        drain(parser)
+        bps,cps,nc = rate(parser,chunks)
+        parser = cls(ChunkStream())
+        apc = allocs(parser,chunks)
+    nb = sum(len(c) for c in chunks)
+    print("%-8s %10.0f bytes/s %10.0f cmd/s %7.1f alloc bytes/cmd %5.1f bytes/motor  (%d cmds)" %
+          (name,bps,cps,apc,nb/nc,nc))
+
+if __name__ == '__main__' :
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    chunks = commandStream(n)
+    bench("legacy",LegacyWordParser,chunks)
+    bench("ring",WordParser,chunks)
+    bench("frames",WordParser,frameStream(n))
+    backlog = b''.join(b'L%d ' % k for k in range(199)) + b'X '
+    for name,policy in (("newest",DROP_NEWEST),("oldest",DROP_OLDEST),("signal",SIGNAL)) :
+        p = WordParser(ChunkStream(),policy=policy)
+        p.stream.feed(backlog)
+        got = []
+        while p.ready() :
+            got.append(bytes(p.next()))
+        print("drop %-6s delivered %3d  dropped %3d  high water %2d  stalls %3d  stop %s" %
+              (name,len(got),p.dropped,p.highWater,p.stalls,
+               "kept" if b'X' in got else "LOST"))
@@ -0,0 +1,54 @@
+# Check MotorDriveBoim shoot-through protection on the simulated board.
+#
+# Hammers one motor with random speed commands and stops, then checks from
+# the recorded pin/PWM histories that the PWM was off from switchTime
+# before every Fwd/Rev pin change until switchTime after it.  Also
+# reports the longest time setSpeed()/stop() spent in virtual time, which
+# should be zero now that the dead time is sequenced by a Timer.
+#
+#   python bench/CheckDeadTime.py [nCommands]
+
+import sys,random
+import simenv
+from simenv import board,clock,quiet
+from MotorDriveBoim import MotorDriveBoim
+
+def run(n,seed=1) :
+    board.reset()
+    m = MotorDriveBoim(6,7,8,'A')
+    rng = random.Random(seed)
+    worst = 0
+    with quiet() :
+        for k in range(n) :
+            t0 = clock.us
+            if rng.random() < 0.05 : m.stop()
+            else : m.setSpeed(rng.randint(-65535,65535))
+            worst = max(worst,clock.us - t0)
+            clock.advance(rng.choice((10,40,120,800,3000,40000)))
+        clock.advance(200000)
+    return m,worst
+
+def violations(m) :
+    pwm = board.pwm[m.iPWM].history
+    edges = sorted(board.pin[m.iFwd].history + board.pin[m.iRev].history)
+    bad = 0
+    for tp,v in edges :
+        lo = tp - m.switchTime
+        hi = tp + m.switchTime
+        # duty in effect at lo, and any change before hi
+        duty = 0
+        for t,d in pwm :
+            if t <= lo : duty = d
+            elif t < hi :
+                if d : bad += 1
+            else : break
+        if duty : bad += 1
+    return bad,len(edges)
+
+if __name__ == '__main__' :
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    m,worst = run(n)
+    bad,ne = violations(m)
+    print("%d commands, %d direction pin changes, %d dead-time violations, "
+          "longest call %d us" % (n,ne,bad,worst))
+    sys.exit(1 if bad else 0)
@@ -0,0 +1,196 @@
+# QuadEncoder's PIO program : a count read mid-step is never garbage
+#
+# count() runs instructions (in_, push) between the state machine's
+# own, so it can land anywhere in the program, e.g. between the two
+# mov(x,invert(x)) of an increment.  There the old program held ~x, and
+# count() saw a jump of about twice the count, either way, a speed spike
+# SpeedControl would answer with full PWM for a tick.
+#
+# The host has no PIO, so this runs the program on a small interpreter
+# of the few instructions it uses, installed as rp2 here only.  Random
+# forward and reverse quadrature edges are fed to pins A,B on the
+# simulated board.  After every single instruction the state machine
+# runs, count() is called, and must be within one edge of the last read.
+# At the end it must equal the edges fed, forward less reverse.  Run
+# with the old program, then the new.
+#
+#   python bench/CheckEncoderPIO.py [edges]
+
+import sys,types,random
+import simenv
+from simenv import board
+
+M32 = 0xFFFFFFFF
+
+class _SM() :
+    def __init__(self,id,prog,freq=0,in_base=None,jmp_pin=None) :
+        self.prog,self.labels,self.wrapTo = prog
+        self.inBase = in_base
+        self.jmpPin = jmp_pin
+        self.pc = 0
+        self.x = 0
+        self.y = 0
+        self.isr = 0
+        self.fifo = []
+        self.on = False
+        self.steps = 0
+
+    def active(self,v) : self.on = bool(v)
+
+    def get(self) :
+        return self.fifo.pop(0)
+
+    def exec(self,ins) :
+        self.run(ins,True)
+
+    def step(self) : # one program instruction.  False if stalled on a wait
+        pc = self.pc
+        self.run(self.prog[pc],False)
+        self.steps += 1
+        return self.pc != pc or self.prog[pc][0] != 'wait'
+
+    def run(self,ins,forced) :
+        op = ins[0]
+        nxt = self.pc + 1
+        if op == 'wait' :
+            if self.inBase.value() != ins[1] : return  # stall
+        elif op == 'jmp' :
+            cond,lab = ins[1],ins[2]
+            go = True
+            if   cond == 'pin'   : go = self.jmpPin.value() == 1
+            elif cond == 'x_dec' :
+                go = self.x != 0
+                self.x = (self.x - 1) & M32
+            elif cond == 'y_dec' :
+                go = self.y != 0
+                self.y = (self.y - 1) & M32
+            if go : nxt = self.labels[lab]
+        elif op == 'mov' :
+            setattr(self,ins[1],~getattr(self,ins[2]) & M32)
+        elif op == 'in' :
+            n = ins[2]
+            self.isr = ((self.isr << n) | (getattr(self,ins[1]) & ((1 << n) - 1))) & M32
+        elif op == 'push' :
+            self.fifo.append(self.isr)
+            self.isr = 0
+        elif op == 'set' :
+            setattr(self,ins[1],ins[2])
+        if forced : return
+        if nxt >= len(self.prog) : nxt = self.wrapTo
+        self.pc = nxt
+
+def _names(prog,labels,wrap) :
+    def add(*ins) : prog.append(ins)
+    def label(name) : labels[name] = len(prog)
+    def wrap_target() : wrap[0] = len(prog)
+    def jmp(cond,lab=None) :
+        if lab is None : cond,lab = None,cond
+        add('jmp',cond,lab)
+    return dict(wrap_target=wrap_target,wrap=lambda : None,label=label,
+                wait=lambda pol,src,idx : add('wait',pol),jmp=jmp,
+                mov=lambda d,s : add('mov',d,s[1]),invert=lambda r : ('invert',r),
+                in_=lambda r,n : add('in',r,n),push=lambda *a : add('push'),
+                set=lambda r,v : add('set',r,v),
+                pin='pin',x='x',y='y',x_dec='x_dec',y_dec='y_dec',noblock=0)
+
+def asm_pio(**kw) :
+    def assemble(fn) :
+        prog,labels,wrap = [],{},[0]
+        g = fn.__globals__
+        names = _names(prog,labels,wrap)
+        saved = {k : g[k] for k in names if k in g}
+        g.update(names)
+        try :
+            fn()
+        finally :
+            for k in names : g.pop(k,None)
+            g.update(saved)
+        return prog,labels,wrap[0]
+    return assemble
+
+def asm_pio_encode(src,sideset) :
+    prog = []
+    eval(src,_names(prog,{},[0]))
+    return prog[0]
+
+rp2 = types.ModuleType('rp2')
+rp2.asm_pio = asm_pio
+rp2.asm_pio_encode = asm_pio_encode
+rp2.StateMachine = _SM
+sys.modules['rp2'] = rp2
+import Encoder
+
+def oldQuadPIO() : # before : x += 1 as invert, decrement, invert
+    wrap_target()
+    label("top")
+    wait(1,pin,0)
+    jmp(pin,"rdn")
+    mov(x,invert(x))
+    jmp(x_dec,"r1")
+    label("r1")
+    mov(x,invert(x))
+    jmp("fall")
+    label("rdn")
+    jmp(x_dec,"fall")
+    label("fall")
+    wait(0,pin,0)
+    jmp(pin,"fup")
+    jmp(x_dec,"top")
+    label("fup")
+    mov(x,invert(x))
+    jmp(x_dec,"f1")
+    label("f1")
+    mov(x,invert(x))
+    wrap()
+
+def oldCount(enc) : # before : push the low 16 bits of X, the count
+    sm = enc.sm
+    sm.exec(asm_pio_encode("in_(x,16)",0))
+    sm.exec(asm_pio_encode("push(noblock)",0))
+    v = sm.get()
+    d = (v - enc.last) & 0xFFFF
+    if d & 0x8000 : d -= 0x10000
+    enc.last = v
+    enc.n += d
+    return enc.n
+
+def check(prog,count,edges,seed=1) :
+    board.reset()
+    Encoder._quadPIO = prog
+    enc = Encoder.QuadEncoder(2,3,usePIO=True)
+    if count is not None : enc.count = lambda : count(enc)
+    a,b = board.pin[2],board.pin[3]
+    a.drive(0)
+    b.drive(0)
+    sm = enc.sm
+    rng = random.Random(seed)
+    phase = 0      # quadrature state 0..3 : A,B = 00,10,11,01
+    truth = 0
+    reads = 0
+    bad = 0
+    worst = 0
+    last = enc.count()
+    for k in range(edges) :
+        fwd = rng.random() < 0.6
+        was = (0,1,1,0)[phase]
+        phase = (phase + (1 if fwd else 3)) % 4
+        a.drive((0,1,1,0)[phase])
+        b.drive((0,0,1,1)[phase])
+        if (0,1,1,0)[phase] != was : truth += 1 if fwd else -1  # A changed
+        while sm.step() :  # until it waits for the next edge
+            n = enc.count()
+            reads += 1
+            if abs(n - last) > 1 :
+                bad += 1
+                worst = max(worst,abs(n - last))
+            last = n
+    n = enc.count()
+    return reads,bad,worst,n,truth,sm.steps
+
+if __name__ == '__main__' :
+    edges = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    for name,prog,count in (("old",asm_pio()(oldQuadPIO),oldCount),
+                            ("new",Encoder._quadPIO,None)) :
+        reads,bad,worst,n,truth,steps = check(prog,count,edges)
+        print("%-4s %6d instructions, a read after each : %5d reads off by more than 1 edge, worst %6d.  count %6d, fed %6d  %s" %
+              (name,steps,bad,worst,n,truth,"OK" if not bad and n == truth else "FAIL"))
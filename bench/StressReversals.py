@@ -0,0 +1,62 @@
+# Stress the one-shot restart timer with rapid direction reversals.
+#
+# For each driver, on the simulated board : 10k reversals at random
+# intervals, many of them landing while the motor is still STOPPING.
+# Checks that at most one restart Timer is ever pending per motor,
+# that exactly one is pending after a final reversal, and that the
+# driver modules' heap use did not grow (tracemalloc, filtered to
+# MotorDrive*.py).
+#
+#   python bench/StressReversals.py [nReversals]
+
+import sys,random,tracemalloc
+import simenv
+from simenv import board,clock
+from MotorDriveBoim import MotorDriveBoim
+from MotorDriveIBT2 import MotorDriveIBT2
+
+DRIVER_FILES = [tracemalloc.Filter(True,"*MotorDrive*.py")]
+
+def restartsPending(m) :  # Timers pending, other than Boim dead-time steps
+    return len([t for t in board.timers if t is not getattr(m,'deadTimer',None)])
+
+def heapUse() :
+    snap = tracemalloc.take_snapshot().filter_traces(DRIVER_FILES)
+    return sum(st.size for st in snap.statistics('filename'))
+
+def stress(make,n,seed=1) :
+    board.reset()
+    board.record = False   # keep the simulator's own history out of it
+    m = make()
+    m.dbg.n = 0
+    rng = random.Random(seed)
+    worst = 0
+    sgn = 1
+    m.setSpeed(30000)
+    clock.advance(300000)
+    tracemalloc.start()
+    heap0 = heapUse()
+    for k in range(n) :
+        sgn = -sgn
+        m.setSpeed(sgn * rng.randint(10000,65535))
+        worst = max(worst,restartsPending(m))
+        clock.advance(rng.choice((30,200,1000,5000,20000,150000)))
+    clock.advance(300000)   # let everything finish, then one last reversal
+    m.setSpeed(-sgn * 40000)
+    final = restartsPending(m)
+    growth = heapUse() - heap0
+    tracemalloc.stop()
+    return worst,final,growth
+
+if __name__ == '__main__' :
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    ok = True
+    for name,make in (("Boim",lambda : MotorDriveBoim(6,7,8,'L')),
+                      ("IBT2",lambda : MotorDriveIBT2(18,19,'R'))) :
+        worst,final,growth = stress(make,n)
+        good = worst <= 1 and final == 1 and growth <= 0
+        ok = ok and good
+        print("%s : %d reversals, max pending restarts %d, pending at end %d, "
+              "driver heap growth %d bytes  %s" %
+              (name,n,worst,final,growth,"OK" if good else "FAIL"))
+    sys.exit(0 if ok else 1)
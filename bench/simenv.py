@@ -0,0 +1,39 @@
+# Import first in host-side benchmarks that need the simulated hardware.
+# Puts sim/ (machine, micropython, virtual time) ahead of the repository
+# on sys.path.
+#
+# fresh('TankDrive') resets the simulated board, and imports a module
+# again from scratch, so each run starts from power-on.
+
+import os,sys,io,contextlib
+_here = os.path.dirname(os.path.abspath(__file__))
+for _p in (os.path.join(_here,'..'),os.path.join(_here,'..','sim')) :
+    _p = os.path.normpath(_p)
+    if _p in sys.path : sys.path.remove(_p)
+    sys.path.insert(0,_p)
+
+import simtime
+import machine
+from machine import board
+from simtime import clock
+
+def fresh(name,quiet=True,**kw) :
+    board.reset()
+    for k,v in kw.items() :  # board options, e.g. uartIdleIRQ=False
+        getattr(board,k)(v)
+    sys.modules.pop(name,None)
+    if not quiet :
+        return __import__(name)
+    with contextlib.redirect_stdout(io.StringIO()) :
+        return __import__(name)
+
+@contextlib.contextmanager
+def quiet() :  # hide diag() prints while benchmarking
+    with contextlib.redirect_stdout(io.StringIO()) :
+        yield
+
+def percentile(xs,p) :
+    if not xs : return float('nan')
+    xs = sorted(xs)
+    k = min(len(xs) - 1,int(round(p / 100.0 * (len(xs) - 1))))
+    return xs[k]
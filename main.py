@@ -0,0 +1,5 @@
+# Pico boot : bridges safe first, then the drive
+import SafeBoot
+import TankDrive
+if TankDrive.Settings.tasks :
+    TankDrive.runTasks()  # asyncio tasks, see TankDrive.startTasks()
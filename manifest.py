@@ -0,0 +1,20 @@
+# MicroPython freeze manifest : TankDrive as frozen bytecode in firmware.
+# Frozen modules run from flash : nothing to compile or load into RAM
+# at boot.  Build the firmware with
+#
+#    cd micropython/ports/rp2
+#    make BOARD=RPI_PICO FROZEN_MANIFEST=/path/to/TankDrivePy/manifest.py
+#
+# then copy only main.py to the board.  tools/BuildMpy.py reads the
+# module list here too, to cross-compile .mpy files instead.
+
+include("$(PORT_DIR)/boards/manifest.py")
+
+# SafeBoot first : main.py imports it before anything else
+for m in ("SafeBoot",
+          "Diag","WordParser","FilteredADC","ADCCapture","LoopTimer",
+          "Handoff","Deferred","SyncPWM","MotorDrive","MotorDriveBoim","MotorDriveIBT2",
+          "MotorDriveSim","Drivers",
+          "RecordLog","Runtime","Watchdog","Playback","Encoder","SpeedControl","CurrentSense","Telemetry","Profiler",
+          "TankDrive") :
+    module(m + ".py")
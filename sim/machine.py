@@ -0,0 +1,451 @@
+# Simulated MicroPython machine module, so TankDrive runs under CPython.
+#
+# Put this directory ahead of the repository on sys.path, then import
+# TankDrive.py and friends as usual.  Everything runs on the virtual
+# clock in simtime.py, so a minute of driving takes milliseconds.
+#
+# board holds every simulated peripheral, keyed by GPIO number (UARTs by
+# id), so a test can find them :
+#
+#    board.pwm[6].history   [(t_us,duty_u16),...] every duty change
+#    board.pin[17].drive(1)  set an input, firing any irq on the edge
+#    board.adc[26].setWaveform(lambda t: ...)   t in seconds
+#    board.uart[1].feed(b'L100 ')   bytes arrive at the baud rate
+#    board.pwmSkew([6],[18,19],t0)  us between L and R duty changes
+#    board.driven[6]         (t_us,level) pin first driven, as output or PWM
+#
+# board.reset() forgets everything, and restarts the clock.
+
+import simtime
+from simtime import clock,uncharged
+
+class Board() :
+    def __init__(self) :
+        self.reset()
+
+    def reset(self) :
+        clock.reset()
+        self.pin  = {}
+        self.pwm  = {}
+        self.adc  = {}
+        self.uart = {}
+        self.driven = {}      # GPIO : (t_us,level) first driven
+        self.timers = set()   # active timers
+        self.record = True    # keep PWM/pin histories
+        self.tReset = None    # t_us the watchdog reset the board
+        mem32.regs.clear()
+        self.uartIdleIRQ(True)
+
+    # firmware before 1.23 has no UART.IRQ_RXIDLE.  Hide it to emulate that
+    def uartIdleIRQ(self,enable) :
+        if enable : UART.IRQ_RXIDLE = UART._IRQ_RXIDLE
+        elif hasattr(UART,'IRQ_RXIDLE') : del UART.IRQ_RXIDLE
+
+    def pendingTimers(self) :
+        return len(self.timers)
+
+    # when the first of pins changed to a non-zero duty (or to duty, if
+    # given), at or after t0, t_us, or None.  e.g. a motor starting.
+    # latched : when the output changed, at the slice's next counter wrap
+    def pwmStart(self,pins,t0,duty=None,latched=False) :
+        ts = [next((t for t,d in self.pwm[p].history
+                    if t >= t0 and (d == duty if duty is not None else d)),None)
+              for p in pins]
+        if latched :
+            ts = [self.pwm[p].wrapAfter(t) if t is not None else None
+                  for p,t in zip(pins,ts)]
+        ts = [t for t in ts if t is not None]
+        return min(ts) if ts else None
+
+    # us between the left and right motors' PWM changes, after t0.
+    # Each side is a list of its PWM pins.  None if one did not change
+    def pwmSkew(self,left,right,t0,duty=None,latched=False) :
+        tL = self.pwmStart(left,t0,duty,latched)
+        tR = self.pwmStart(right,t0,duty,latched)
+        if tL is None or tR is None : return None
+        return abs(tL - tR)
+
+board = None  # made after classes below
+
+def _pinID(p) :
+    if isinstance(p,Pin) : return p.id
+    return p
+
+class Pin() :
+    IN  = 0
+    OUT = 1
+    OPEN_DRAIN = 2
+    ALT = 3
+    PULL_UP   = 1
+    PULL_DOWN = 2
+    IRQ_FALLING = 4
+    IRQ_RISING  = 8
+
+    def __init__(self,id,mode=-1,pull=-1,value=None) :
+        self.id = id
+        if id not in board.pin :
+            self.v = 0
+            self.handler = None
+            self.trigger = 0
+            self.history = []
+        else :  # same pin again.  share state, like the hardware
+            self.__dict__ = board.pin[id].__dict__
+        self.init(mode,pull,value)
+        board.pin[id] = self
+
+    def init(self,mode=-1,pull=-1,value=None) :
+        if mode != -1 : self.mode = mode
+        if pull == Pin.PULL_UP and getattr(self,'mode',Pin.IN) == Pin.IN :
+            self.v = 1
+        if value is not None : self.value(value)
+        if getattr(self,'mode',Pin.IN) == Pin.OUT and self.id not in board.driven :
+            board.driven[self.id] = (clock.now(),self.v)
+
+    def value(self,v=None) :
+        if v is None : return self.v
+        self.set(1 if v else 0)
+
+    def set(self,v) :
+        prev = self.v
+        self.v = v
+        if board.record and v != prev : self.history.append((clock.now(),v))
+        if self.handler is not None :
+            if ((prev == 0 and v == 1 and self.trigger & Pin.IRQ_RISING) or
+                (prev == 1 and v == 0 and self.trigger & Pin.IRQ_FALLING)) :
+                if self.hard : self.handler(self)
+                else         : clock.after(0,lambda : self.handler(self))
+
+    def drive(self,v) :  # simulation side.  external signal on input
+        self.set(1 if v else 0)
+
+    def on(self)  : self.value(1)
+    def off(self) : self.value(0)
+    def low(self) : self.value(0)
+    def high(self): self.value(1)
+    def toggle(self) : self.value(not self.v)
+    __call__ = value
+
+    def irq(self,handler=None,trigger=IRQ_FALLING|IRQ_RISING,hard=False) :
+        self.handler = handler
+        self.trigger = trigger
+        self.hard = hard
+
+class PWM() :
+    def __init__(self,pin,freq=None,duty_u16=None) :
+        self.id = _pinID(pin)
+        self.f = 1000
+        self.d = 0
+        self.history = []   # (t_us,duty_u16)
+        self.freqHistory = []
+        self.t0 = clock.now()  # counter started.  see wrapAfter()
+        board.pwm[self.id] = self
+        if self.id not in board.driven :
+            board.driven[self.id] = (clock.now(),0)
+        if freq is not None : self.freq(freq)
+        if duty_u16 is not None : self.duty_u16(duty_u16)
+
+    def freq(self,f=None) :
+        if f is None : return self.f
+        self.f = int(f)
+        if board.record : self.freqHistory.append((clock.now(),self.f))
+
+    @uncharged
+    def duty_u16(self,d=None) :
+        if d is None : return self.d
+        d = int(d)
+        if d < 0 or d > 65535 : raise ValueError("duty_u16 out of range")
+        if board.record and d != self.d : self.history.append((clock.now(),d))
+        self.d = d
+
+    # t_us a duty written at t reaches the output : the slice latches it
+    # when its counter next wraps, every period from t0
+    def wrapAfter(self,t) :
+        period = 1000000 / self.f
+        return self.t0 + (int((t - self.t0) // period) + 1) * period
+
+    def duty_ns(self,ns=None) :
+        period = 1000000000 // self.f
+        if ns is None : return self.d * period // 65535
+        self.duty_u16(min(65535,ns * 65535 // period))
+
+    def deinit(self) :
+        self.duty_u16(0)
+
+class ADC() :
+    CORE_TEMP = 4
+
+    def __init__(self,pin) :
+        p = _pinID(pin)
+        if p >= 26 : p -= 26   # GPIO 26..29 are channels 0..3
+        self.channel = p
+        self.id = p + 26
+        if self.id in board.adc :
+            self.__dict__ = board.adc[self.id].__dict__
+        else :
+            self.v = 32768
+            self.wave = None
+            board.adc[self.id] = self
+        self.nRead = 0
+
+    # fn(t_seconds) -> u16, or a sequence of samples, replayed one
+    # per read (last one held), or a constant
+    def setWaveform(self,wave) :
+        self.wave = wave
+        self.k = 0
+
+    def read_u16(self) :
+        self.nRead += 1
+        w = self.wave
+        if w is None : return self.v
+        if callable(w) :
+            v = w(clock.now() * 1e-6)
+        elif isinstance(w,int) :
+            v = w
+        else :
+            v = w[min(self.k,len(w) - 1)]
+            self.k += 1
+        v = int(v)
+        if v < 0 : v = 0
+        if v > 65535 : v = 65535
+        v >>= 4  # 12-bit ADC, scaled to u16 like the Pico firmware
+        return (v << 4) | (v >> 8)
+
+class UART() :
+    _IRQ_RXIDLE = 64
+    IRQ_RXIDLE  = 64
+    IRQ_TXIDLE  = 32
+    IRQ_RX      = 1
+
+    def __init__(self,id,baudrate=115200,bits=8,parity=None,stop=1,
+                 tx=None,rx=None,txbuf=256,rxbuf=256,timeout=0,**kw) :
+        self.id = id
+        self.rxq = []       # [(t_us,byte)], arrival time order
+        self.rxEnd = 0      # arrival time of last byte fed
+        self.tx = bytearray()  # everything written
+        self.txFree = 0     # time tx fifo drains
+        self.handler = None
+        self.trigger = 0
+        self.idleEvent = None
+        self.rxOverflow = 0
+        self.init(baudrate,bits,parity,stop,txbuf=txbuf,rxbuf=rxbuf)
+        board.uart[id] = self
+
+    def init(self,baudrate=115200,bits=8,parity=None,stop=1,txbuf=256,rxbuf=256,**kw) :
+        self.baud = baudrate
+        self.charTime = 10 * 1000000 / baudrate   # us per byte, 8N1
+        self.txbuf = txbuf
+        self.rxbuf = rxbuf
+
+    # ------ simulation side
+    def feed(self,data,at_us=None,paced=True) :
+        # data arrives starting at at_us (default now, or after bytes
+        # already in flight), one byte per character time
+        t = clock.us if at_us is None else at_us
+        if t < self.rxEnd : t = self.rxEnd
+        t0 = t
+        for b in data :
+            if paced : t += self.charTime
+            self.rxq.append((int(t),b))
+        self.rxEnd = t
+        if self.handler is not None and self.trigger & UART._IRQ_RXIDLE :
+            # RP2040 raises RX timeout after 32 bit times idle
+            if self.idleEvent is not None and self.idleEvent[0] > t0 :
+                clock.cancel(self.idleEvent)  # line not idle after all
+            self.idleEvent = clock.at(t + 3.2 * self.charTime,self.rxIdle)
+        return int(t)  # arrival time of last byte
+
+    def feedFile(self,fnam,**kw) :
+        with open(fnam,'rb') as f :
+            return self.feed(f.read(),**kw)
+
+    def rxIdle(self) :
+        self.idleEvent = None
+        if self.handler is not None : self.handler(self)
+
+    # ------ MicroPython side
+    def any(self) :
+        n = 0
+        for t,b in self.rxq :
+            if t > clock.us : break
+            n += 1
+        return n
+
+    def read(self,n=-1) :
+        k = self.any()
+        if n is not None and n >= 0 and n < k : k = n
+        if k == 0 : return None
+        b = bytes(x for t,x in self.rxq[:k])
+        del self.rxq[:k]
+        return b
+
+    def readinto(self,buf,nbytes=None) :
+        k = self.any()
+        if nbytes is None : nbytes = len(buf)
+        if nbytes < k : k = nbytes
+        if k == 0 : return None
+        for j in range(k) :
+            buf[j] = self.rxq[j][1]
+        del self.rxq[:k]
+        return k
+
+    def readline(self) :
+        k = self.any()
+        for j in range(k) :
+            if self.rxq[j][1] == 10 :
+                return self.read(j + 1)
+        return None
+
+    def write(self,buf) :
+        # non-blocking beyond the tx buffer, like timeout=0 hardware
+        now = clock.us
+        if self.txFree < now : self.txFree = now
+        queued = int((self.txFree - now) / self.charTime)
+        n = min(len(buf),max(0,self.txbuf - queued))
+        self.tx += bytes(buf[:n])
+        self.txFree += n * self.charTime
+        return n
+
+    def txdone(self) :
+        return self.txFree <= clock.us
+
+    def flush(self) :
+        clock.sleep_us(max(0,int(self.txFree - clock.us)))
+
+    def irq(self,handler=None,trigger=0,hard=False) :
+        self.handler = handler
+        self.trigger = trigger
+
+    def deinit(self) :
+        self.handler = None
+
+class Timer() :
+    ONE_SHOT = 0
+    PERIODIC = 1
+
+    def __init__(self,id=-1,**kw) :
+        self.ev = None
+        if kw : self.init(**kw)
+
+    # hard is taken and ignored : callbacks run when due, either way
+    def init(self,mode=PERIODIC,period=-1,freq=-1,callback=None,tick_hz=1000,hard=False) :
+        self.deinit()
+        if freq > 0 : self.period_us = 1000000 / freq
+        else        : self.period_us = period * 1000000 / tick_hz
+        if self.period_us < 1 : self.period_us = 1
+        self.mode = mode
+        self.callback = callback
+        self.due = clock.us + self.period_us
+        self.ev = clock.at(self.due,self.fire)
+        board.timers.add(self)
+
+    def fire(self) :
+        if self.mode == Timer.PERIODIC :
+            self.due += self.period_us  # no drift, like hardware alarms
+            if self.due < clock.us : self.due = clock.us  # overrun
+            self.ev = clock.at(self.due,self.fire)
+        else :
+            self.ev = None
+            board.timers.discard(self)
+        if self.callback is not None : self.callback(self)
+
+    def deinit(self) :
+        clock.cancel(self.ev)
+        self.ev = None
+        board.timers.discard(self)
+
+# --- odds and ends, enough for code that pokes at them
+
+# registers, as plain words, but for the PWM slices' counters : writing
+# a slice's CTR, or setting its EN bit, restarts its counter (PWM.t0).
+# CTR reads where the counter is now, counting to TOP, 65535
+_PWM_BASE = 0x40050000
+_PWM_EN   = 0x400500A0
+_CH_SIZE  = 0x14
+
+class _Mem32() :
+    def __init__(self) :
+        self.regs = {}
+
+    @uncharged
+    def __getitem__(self,a) :
+        if _PWM_BASE <= a < _PWM_EN :
+            r = (a - _PWM_BASE) % _CH_SIZE
+            if r == 0x10 : return 65535
+            if r == 8 :
+                s = (a - _PWM_BASE) // _CH_SIZE
+                for p in board.pwm.values() :
+                    if (p.id >> 1) & 7 == s :
+                        period = 1000000 / p.f
+                        return int(((clock.now() - p.t0) % period) * 65536 / period)
+        return self.regs.get(a,0)
+
+    @uncharged
+    def __setitem__(self,a,v) :
+        was = self.regs.get(a,0)
+        self.regs[a] = v & 0xFFFFFFFF
+        if a == _PWM_EN :
+            for s in range(8) :
+                if (v >> s) & 1 and not (was >> s) & 1 : self.restart(s)
+        elif _PWM_BASE <= a < _PWM_EN and (a - _PWM_BASE) % _CH_SIZE == 8 :
+            self.restart((a - _PWM_BASE) // _CH_SIZE)
+
+    def restart(self,s) :
+        for p in board.pwm.values() :
+            if (p.id >> 1) & 7 == s : p.t0 = clock.now()
+
+mem32 = _Mem32()
+
+PWRON_RESET = 1
+WDT_RESET   = 3
+_resetCause = PWRON_RESET
+
+# Not fed for timeout ms, it resets the board : every PWM and output to
+# 0 (GPIOs back to inputs, pulled down), and nothing more runs.  The
+# simulation stops there.  reset_cause() is then WDT_RESET, for the
+# next boot (simenv.fresh()).  A callback hung sleeping delays events,
+# this one too, so the reset is dated when it was due, board.tReset
+class WDT() :
+    def __init__(self,id=0,timeout=5000) :
+        if timeout > 8388 : raise ValueError("timeout too long")
+        self.timeout = timeout * 1000
+        self.ev = None
+        self.feed()
+
+    def feed(self) :
+        if board.tReset is not None : return  # reset.  nothing runs now
+        if self.ev is not None and clock.now() > self.due :
+            self.expire()  # a hung callback held the reset event back
+            return
+        clock.cancel(self.ev)
+        self.due = clock.now() + self.timeout
+        self.ev = clock.at(self.due,self.expire,False)
+
+    def expire(self) :
+        global _resetCause
+        t = self.due
+        board.tReset = t
+        self.ev = None
+        for p in list(board.pwm.values()) + list(board.pin.values()) :
+            h = getattr(p,'history',[])
+            while h and h[-1][0] > t : h.pop()  # after the reset : never was
+        for p in board.pwm.values() :
+            if p.d and board.record : p.history.append((t,0))
+            p.d = 0
+        for p in board.pin.values() :
+            if getattr(p,'mode',Pin.IN) == Pin.OUT and p.v :
+                if board.record : p.history.append((t,0))
+                p.v = 0
+        board.timers.clear()
+        del clock.events[:]
+        _resetCause = WDT_RESET
+
+def reset_cause() : return _resetCause
+def freq(hz=None) : return 125000000
+def unique_id()   : return b'\x00SIMPICO'
+def idle() :
+    t = clock.nextEvent()
+    if t is not None : clock.run(t)
+def disable_irq() : return 0
+def enable_irq(state=0) : pass
+
+board = Board()
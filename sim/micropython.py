@@ -0,0 +1,36 @@
+# Simulated micropython module.  See machine.py
+
+from simtime import clock
+
+def const(x) :
+    return x
+
+SCHED_DEPTH = 8  # MICROPY_SCHEDULER_DEPTH, as built for the rp2 port
+
+def schedule(func,arg) :  # run func(arg) soon, outside any callback
+    if clock.sched >= SCHED_DEPTH :
+        raise RuntimeError("schedule queue full")
+    clock.sched += 1
+    def run() :
+        clock.sched -= 1
+        func(arg)
+    clock.after(0,run)
+
+def alloc_emergency_exception_buf(size) :
+    pass
+
+def mem_info(verbose=False) :
+    pass
+
+def opt_level(level=None) :
+    return 0
+
+def heap_lock() :
+    return 0
+
+def heap_unlock() :
+    return 0
+
+# code emitters are just decorators here
+def native(f) : return f
+def viper(f)  : return f
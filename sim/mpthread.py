@@ -0,0 +1,43 @@
+# Simulated MicroPython _thread.  The RP2040 runs one extra thread, on
+# core 1.  See simtime.Core for how it shares the virtual clock.
+#
+# _thread is built into CPython, so sim/ on sys.path cannot shadow it.
+# simtime.install() puts this module in sys.modules['_thread'] instead.
+# threading has already bound the real one by then, and anything else
+# is passed through to it.
+
+import sys
+from simtime import Core
+
+_real = sys.modules['_thread']
+
+def __getattr__(name) :
+    return getattr(_real,name)
+
+cores = []  # started, for tests to inspect
+
+def start_new_thread(fn,args) :
+    if any(c.running for c in cores) :
+        raise OSError(16)  # EBUSY : core 1 already in use
+    cores.append(Core(fn,args))
+
+def stack_size(n=0) :
+    return 0
+
+class LockType() :
+    def __init__(self) :
+        self.held = False
+    def acquire(self,waitflag=1,timeout=-1) :
+        if self.held : return False  # single-threaded at any instant
+        self.held = True
+        return True
+    def release(self) :
+        self.held = False
+    def locked(self) :
+        return self.held
+    __enter__ = acquire
+    def __exit__(self,*a) :
+        self.release()
+
+def allocate_lock() :
+    return LockType()
@@ -0,0 +1,124 @@
+# Simulated DC motor and tread, with a quadrature encoder, for tuning
+# closed-loop speed control on the host.
+#
+# A MotorPlant reads its H-bridge's simulated pins every dt_us, moves
+# the wheel, and drives the encoder's A/B input pins through each
+# quadrature state it passed, so QuadEncoder counts it like real edges.
+#
+#    p = MotorPlant(boimDrive(6,7,8),2,3,fullCps=2000)
+#    p.start()
+#    ...  p.cps   speed, counts/s ;  p.history  [(t_us,cps),...]
+#    board.adc[28].setWaveform(p.isWave())   IBT-2 current sense
+#
+# Model, speed w in encoder counts/s :
+#    driven   dw/dt = (u*fullCps - w)/tau - drag
+#    coasting dw/dt = -w/tauCoast - drag
+#    braking  dw/dt = -w/tauBrake - drag
+# u is signed duty, -1..1.  drag (counts/s/s) is friction and load,
+# always against the motion, and never reverses it.  Current is
+# iStall * (u - w/fullCps) driven, iStall * -w/fullCps braking, amps.
+
+from machine import board,Pin
+from simtime import clock
+
+def boimDrive(pwm,fwd,rev) : # MotorDriveBoim pins -> (u,brake)
+    def drive() :
+        d = board.pwm[pwm].d / 65535.0
+        f = board.pin[fwd].v
+        r = board.pin[rev].v
+        if f and not r : return d,False
+        if r and not f : return -d,False
+        return 0.0,(d > 0 and not f)  # Fwd=Rev=0, PWM on : brake
+    return drive
+
+def ibt2Drive(pwmL,pwmR) : # MotorDriveIBT2 pins -> (u,brake)
+    def drive() :
+        l = board.pwm[pwmL].d
+        r = board.pwm[pwmR].d
+        if l and r : return 0.0,True
+        return (l - r) / 65535.0,False
+    return drive
+
+# quadrature (A,B), forward order.  A leads B
+_QUAD = ((0,0),(1,0),(1,1),(0,1))
+
+class MotorPlant() :
+    def __init__(self,drive,pinA,pinB,fullCps=2000,tau_ms=80,
+                 tauCoast_ms=600,tauBrake_ms=40,drag=0.0,dt_us=250,
+                 record_us=1000,iStall=40.0) :
+        self.drive = drive
+        self.pinA = pinA
+        self.pinB = pinB
+        self.fullCps = fullCps
+        self.tau = tau_ms * 1e-3
+        self.tauCoast = tauCoast_ms * 1e-3
+        self.tauBrake = tauBrake_ms * 1e-3
+        self.drag = drag
+        self.dt = dt_us
+        self.record = record_us  # history sample period, 0 : none
+        self.cps = 0.0
+        self.iStall = iStall
+        self.amps = 0.0
+        self.pos = 0.0    # counts, one per A edge
+        self.q = 0        # quadrature state, 2 per count
+        self.history = []
+        self.tRec = 0
+        self.ev = None
+
+    def start(self) :
+        # start from the quadrature state the pins are in, e.g. pulled up.
+        # Pins not set up yet (encoders made later, or never) start low
+        for p in (self.pinA,self.pinB) :
+            if p not in board.pin : Pin(p)
+        ab = (board.pin[self.pinA].v,board.pin[self.pinB].v)
+        self.q = _QUAD.index(ab)
+        self.pos = self.q * 0.5
+        self.tRec = clock.us
+        self.ev = clock.at(clock.us + self.dt,self.step,charge=False)
+
+    def stop(self) :
+        clock.cancel(self.ev)
+        self.ev = None
+
+    def step(self) :
+        dt = self.dt * 1e-6
+        u,brake = self.drive()
+        w = self.cps
+        if u :
+            dw = (u * self.fullCps - w) / self.tau
+            self.amps = self.iStall * (u - w / self.fullCps)
+        elif brake :
+            dw = -w / self.tauBrake
+            self.amps = -self.iStall * w / self.fullCps
+        else :
+            dw = -w / self.tauCoast
+            self.amps = 0.0
+        w1 = w + dw * dt
+        if   w1 > 0 : w1 = max(0.0,w1 - self.drag * dt)
+        elif w1 < 0 : w1 = min(0.0,w1 + self.drag * dt)
+        self.cps = w1
+        self.pos += (w + w1) * 0.5 * dt
+        self.edges()
+        if self.record and clock.us - self.tRec >= self.record :
+            self.tRec = clock.us
+            self.history.append((clock.us,self.cps))
+        self.ev = clock.at(clock.us + self.dt,self.step,charge=False)
+
+    def edges(self) : # step the encoder pins up to the wheel position
+        q = int(self.pos * 2 // 1)  # floor
+        while self.q != q :
+            self.q += 1 if q > self.q else -1
+            a,b = _QUAD[self.q & 3]
+            board.pin[self.pinB].drive(b)  # only one changes per state
+            board.pin[self.pinA].drive(a)
+
+    # ADC waveform : IBT-2 IS pins, |amps| scaled to u16, maFull at 3.3V
+    def isWave(self,maFull=28000) :
+        return lambda t : min(65535,abs(self.amps) * 1000.0 * 65535 / maFull)
+
+    def speedAt(self,t) : # recorded cps at t_us
+        v = 0.0
+        for tt,w in self.history :
+            if tt > t : break
+            v = w
+        return v
@@ -0,0 +1,64 @@
+# CPython asyncio on the virtual clock (simtime.py).
+#
+# install() makes asyncio.run() use SimLoop.  Its time() is the virtual
+# clock.  Where a real loop would block, waiting for its next timer,
+# SimLoop runs the clock's events (Timers, UART bytes, pin edges) up to
+# then instead, and stops early if one of them made a task ready.  So
+# Runtime.py's tasks run against the simulated board as fast as the
+# host can go, the same every run.
+#
+# Host CPU time spent in tasks is charged to the clock times
+# clock.cpuScale, as for callbacks, so with it set a slow task makes the
+# others late.
+#
+# With nothing scheduled on the loop or the clock, select() raises
+# RuntimeError rather than wait forever.
+
+import asyncio,selectors,time
+from simtime import clock
+
+class SimSelector(selectors.SelectSelector) :
+    loop = None
+
+    def select(self,timeout=None) :
+        # charge the tasks run since the last select()
+        clock.us = clock.now()
+        clock.live = False
+        if timeout is None :
+            end = clock.nextEvent()
+            if end is None :
+                raise RuntimeError("simulation idle : no events, no timers")
+        else :
+            dt = timeout * 1e6
+            end = clock.us + int(dt) + (dt > int(dt))  # round up
+        while True :
+            t = clock.nextEvent()
+            if t is None or t > end : break
+            clock.run(t)
+            if self.loop._ready : break  # a callback woke a task
+        if not self.loop._ready and end > clock.us : clock.us = end
+        if clock.cpuScale :
+            clock.t0 = time.perf_counter()
+            clock.live = True
+        return []
+
+class SimLoop(asyncio.SelectorEventLoop) :
+    def __init__(self) :
+        sel = SimSelector()
+        super().__init__(sel)
+        sel.loop = self
+
+    def time(self) :
+        return clock.now() / 1e6
+
+class SimPolicy(asyncio.DefaultEventLoopPolicy) :
+    def new_event_loop(self) :
+        return SimLoop()
+
+def install() :
+    asyncio.set_event_loop_policy(SimPolicy())
+
+def uninstall() :
+    clock.us = clock.now()
+    clock.live = False
+    asyncio.set_event_loop_policy(None)
@@ -0,0 +1,210 @@
+# Deterministic virtual clock for running the TankDrive modules on a host.
+#
+# install() adds the MicroPython time functions (ticks_ms, ticks_us,
+# ticks_diff, ticks_add, sleep_ms, sleep_us) to CPython's time module,
+# all driven from this clock rather than the wall clock, and swaps in
+# the simulated _thread (mpthread.py).
+#
+# Time only moves when something sleeps, or the host calls advance().
+# Timer, UART and Pin callbacks are events on the clock.  Like the
+# MicroPython scheduler, callbacks do not nest : time spent sleeping
+# inside a callback just delays any events falling due meanwhile.
+#
+# Core runs a function as a second CPU core, e.g. from _thread.  It keeps
+# its own time, in lockstep with the clock : it runs only from a wake-up
+# event, and only until it sleeps again.  Work on the main core (the
+# callbacks) does not delay it, nor it them.
+
+import sys,time,heapq,threading,traceback
+
+TICKS_PERIOD = 1 << 30  # MicroPython ticks wrap here
+TICKS_MAX    = TICKS_PERIOD - 1
+TICKS_HALF   = TICKS_PERIOD // 2
+
+class Clock() :
+    def __init__(self) :
+        self.reset()
+
+    def reset(self) :
+        self.us = 0          # virtual time, microseconds
+        self.events = []     # heap of [t_us, seq, callback, alive]
+        self.seq = 0
+        self.busy = False    # running a callback
+        self.cpuScale = 0    # charge host CPU time * this to virtual time
+        self.live = False    # charging a callback.  now() moves during it
+        self.t0 = 0.0        # host time the charged callback started
+        self.nRun = 0        # callbacks run
+        self.sched = 0       # micropython.schedule() calls queued
+
+    def now(self) : # time on the calling core
+        c = threading.current_thread()
+        if isinstance(c,Core) : return c.now()
+        if self.live :
+            return self.us + int((time.perf_counter() - self.t0) * 1e6 * self.cpuScale)
+        return self.us
+
+    # schedule cb() at virtual time t_us.  returns event.
+    # charge=False for events whose CPU time is not the main core's
+    def at(self,t_us,cb,charge=True) :
+        ev = [int(t_us),self.seq,cb,True,charge]
+        self.seq += 1
+        heapq.heappush(self.events,ev)
+        return ev
+
+    def after(self,dt_us,cb) :
+        return self.at(self.us + dt_us,cb)
+
+    @staticmethod
+    def cancel(ev) :
+        if ev is not None : ev[3] = False
+
+    def pending(self) :
+        return sum(1 for ev in self.events if ev[3])
+
+    def runEvent(self,ev) :
+        self.busy = True
+        try :
+            if self.cpuScale and ev[4] :
+                # ticks_us() advances through the callback, so time
+                # measured inside it (e.g. by Profiler.py) is charged too
+                self.t0 = time.perf_counter()
+                self.live = True
+                try :
+                    ev[2]()
+                finally :
+                    self.us = self.now()
+                    self.live = False
+            else :
+                ev[2]()
+        finally :
+            self.busy = False
+        self.nRun += 1
+
+    def run(self,until_us) : # run all events due up to until_us
+        while self.events and self.events[0][0] <= until_us :
+            ev = heapq.heappop(self.events)
+            if not ev[3] : continue
+            if ev[0] > self.us : self.us = ev[0]
+            self.runEvent(ev)
+        if until_us > self.us : self.us = until_us
+
+    def advance(self,dt_us) :
+        self.run(self.us + dt_us)
+
+    def advance_ms(self,dt_ms) :
+        self.run(self.us + int(dt_ms * 1000))
+
+    def nextEvent(self) :  # time of next live event, or None
+        while self.events and not self.events[0][3] :
+            heapq.heappop(self.events)
+        if self.events : return self.events[0][0]
+        return None
+
+    def sleep_us(self,dt_us) :
+        if self.busy : self.us += dt_us  # callbacks do not nest
+        else         : self.advance(dt_us)
+
+class Core(threading.Thread) :
+    def __init__(self,fn,args=()) :
+        super().__init__(daemon=True)
+        self.fn = fn
+        self.args = args
+        self.us = clock.us
+        self.running = True
+        self.error = None
+        self.frozen = False  # clock stopped.  see uncharged()
+        self.go = threading.Semaphore(0)    # core may run
+        self.back = threading.Semaphore(0)  # core slept, or finished
+        self.start()
+        clock.at(self.us,self.resume,False)
+
+    def run(self) :
+        self.go.acquire()
+        self.t0 = time.thread_time()
+        try :
+            self.fn(*self.args)
+        except BaseException as e :
+            self.error = e
+            traceback.print_exc()
+        finally :
+            self.running = False
+            self.back.release()
+
+    def resume(self) : # clock event.  run the core until it sleeps
+        self.go.release()
+        self.back.acquire()
+
+    def now(self) : # called on the core.  charges its own CPU time only
+        if clock.cpuScale and not self.frozen :
+            t = time.thread_time()
+            self.us += int((t - self.t0) * 1e6 * clock.cpuScale)
+            self.t0 = t
+        return self.us
+
+    def sleep_us(self,dt_us) : # called on the core
+        self.us = self.now() + dt_us
+        clock.at(self.us,self.resume,False)
+        self.back.release()
+        self.go.acquire()
+        self.t0 = time.thread_time()
+
+clock = Clock()
+
+# decorator : the calling core's clock stands still through fn, its host
+# time not charged.  For simulated hardware, e.g. a register access,
+# which costs the real CPU next to nothing however long the simulator takes
+def uncharged(fn) :
+    def call(*args) :
+        c = threading.current_thread()
+        if isinstance(c,Core) :
+            c.now()
+            c.frozen = True
+            try     : return fn(*args)
+            finally :
+                c.frozen = False
+                c.t0 = time.thread_time()
+        if not clock.live : return fn(*args)
+        clock.us = clock.now()
+        clock.live = False
+        try     : return fn(*args)
+        finally :
+            clock.t0 = time.perf_counter()
+            clock.live = True
+    return call
+
+def ticks_us() :
+    return clock.now() & TICKS_MAX
+
+def ticks_ms() :
+    return (clock.now() // 1000) & TICKS_MAX
+
+def ticks_cpu() :
+    return ticks_us()
+
+def ticks_add(t,dt) :
+    return (t + dt) & TICKS_MAX
+
+def ticks_diff(a,b) :
+    return ((a - b + TICKS_HALF) & TICKS_MAX) - TICKS_HALF
+
+def sleep_us(us) :
+    c = threading.current_thread()
+    if isinstance(c,Core) : c.sleep_us(int(us))
+    else                  : clock.sleep_us(int(us))
+
+def sleep_ms(ms) :
+    sleep_us(ms * 1000)
+
+def install() :
+    time.ticks_us   = ticks_us
+    time.ticks_ms   = ticks_ms
+    time.ticks_cpu  = ticks_cpu
+    time.ticks_add  = ticks_add
+    time.ticks_diff = ticks_diff
+    time.sleep_us   = sleep_us
+    time.sleep_ms   = sleep_ms
+    if 'mpthread' not in sys.modules :
+        import mpthread
+        sys.modules['_thread'] = mpthread
+
+install()
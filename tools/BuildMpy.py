@@ -0,0 +1,73 @@
+# Cross-compile TankDrive's modules to .mpy bytecode for the Pico.
+#
+#   python tools/BuildMpy.py [-o build/mpy] [-O N] [--deploy]
+#
+# Compiles every module listed in manifest.py with mpy-cross
+# (pip install mpy-cross, matched to the firmware's MicroPython
+# version), for -march=armv6m, the RP2040's Cortex-M0+.  The board then
+# loads bytecode, and skips compiling source at every boot, which takes
+# RAM, and time before the motors are driven.  main.py stays source.
+# Prints each module's source and .mpy sizes.
+#
+# --deploy copies the .mpy files and main.py to the board with mpremote.
+# MicroPython imports X.py before X.mpy, so remove any .py copies of
+# these modules from the board first.
+#
+# For frozen bytecode, built into the firmware, see manifest.py.
+
+import os,sys,shutil,subprocess
+
+ROOT = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)),'..'))
+
+def modules() : # names, in manifest.py order
+    names = []
+    def module(fnam,**kw) : names.append(fnam[:-3])
+    def include(path,**kw) : pass
+    with open(os.path.join(ROOT,'manifest.py')) as f :
+        exec(f.read(),{'module' : module,'include' : include})
+    return names
+
+def main(argv) :
+    out = os.path.join(ROOT,'build','mpy')
+    opt = None
+    deploy = False
+    k = 1
+    while k < len(argv) :
+        if   argv[k] == '-o' : out = argv[k + 1]; k += 1
+        elif argv[k] == '-O' : opt = argv[k + 1]; k += 1
+        elif argv[k] == '--deploy' : deploy = True
+        else :
+            print("usage : python tools/BuildMpy.py [-o dir] [-O N] [--deploy]")
+            return 2
+        k += 1
+    mpyCross = shutil.which('mpy-cross')
+    if mpyCross is None :
+        print("mpy-cross not found.  pip install mpy-cross")
+        return 1
+    os.makedirs(out,exist_ok=True)
+    print(subprocess.run([mpyCross,'--version'],capture_output=True,text=True).stdout.strip())
+    files = []
+    total = [0,0]
+    for m in modules() :
+        src = os.path.join(ROOT,m + '.py')
+        dst = os.path.join(out,m + '.mpy')
+        cmd = [mpyCross,'-march=armv6m','-s',m + '.py','-o',dst]
+        if opt is not None : cmd.append('-O' + opt)
+        r = subprocess.run(cmd + [src],capture_output=True,text=True)
+        if r.returncode :
+            print(r.stderr.strip())
+            return 1
+        a = os.path.getsize(src)
+        b = os.path.getsize(dst)
+        total[0] += a
+        total[1] += b
+        print("%-16s %7d -> %6d bytes" % (m,a,b))
+        files.append(dst)
+    print("%-16s %7d -> %6d bytes, in %s" % ("total",total[0],total[1],out))
+    if deploy :
+        files.append(os.path.join(ROOT,'main.py'))
+        return subprocess.run(['mpremote','cp'] + files + [':']).returncode
+    return 0
+
+if __name__ == '__main__' :
+    sys.exit(main(sys.argv))
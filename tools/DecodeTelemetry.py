@@ -0,0 +1,87 @@
+# Decode TankDrive telemetry frames (see Telemetry.py) into CSV.
+#
+#   python tools/DecodeTelemetry.py capture.bin > telemetry.csv
+#   python tools/DecodeTelemetry.py --serial /dev/ttyUSB0 115200 > t.csv
+#
+# The stream may have other bytes mixed in.  Frames are found by SYNC,
+# and kept only if the length their mask gives and the CRC check out.
+# Columns are seq, t_ms, then every field's pair, empty when a frame
+# did not carry it.  Bad frames and seq gaps are counted on stderr.
+# --serial needs pyserial, and runs until interrupted.
+
+import os,sys,struct
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),'..'))
+from Telemetry import FIELDS,N_FIELDS,F_ALL,HEAD_FMT,HEAD_LEN,frameLen
+from WordParser import SYNC,crc8
+
+def header() :
+    cols = ["seq","t_ms"]
+    for names,signed in FIELDS : cols += names
+    return cols
+
+class Decoder() :
+    def __init__(self) :
+        self.buf = bytearray()
+        self.bad = 0
+        self.lost = 0
+        self.seq = -1
+
+    def feed(self,data) : # yields rows
+        buf = self.buf
+        buf += data
+        k = 0
+        while True :
+            k = buf.find(bytes([SYNC]),k)
+            if k < 0 or len(buf) - k < HEAD_LEN :
+                break
+            sync,seq,mask,t = struct.unpack_from(HEAD_FMT,buf,k)
+            if mask & ~F_ALL :
+                k += 1   # not a frame
+                continue
+            n = frameLen(mask)
+            if len(buf) - k < n :
+                break
+            if crc8(buf[k + 1:k + n - 1],n - 2) != buf[k + n - 1] :
+                self.bad += 1
+                k += 1
+                continue
+            if self.seq >= 0 : self.lost += (seq - self.seq - 1) & 0xFF
+            self.seq = seq
+            row = [seq,t]
+            o = k + HEAD_LEN
+            for i in range(N_FIELDS) :
+                if mask & (1 << i) :
+                    row += struct.unpack_from('<hh' if FIELDS[i][1] else '<HH',buf,o)
+                    o += 4
+                else :
+                    row += ["",""]
+            yield row
+            k += n
+        if k < 0 : k = len(buf)  # no SYNC left
+        del buf[:k]  # keep a partial frame for the next feed()
+
+def decode(data) : # all rows in bytes data
+    d = Decoder()
+    return list(d.feed(data)),d
+
+def main(argv) :
+    out = sys.stdout
+    out.write(",".join(header()) + "\n")
+    d = Decoder()
+    if len(argv) > 1 and argv[1] == '--serial' :
+        import serial
+        port = serial.Serial(argv[2],int(argv[3]) if len(argv) > 3 else 115200,timeout=0.1)
+        try :
+            while True :
+                for row in d.feed(port.read(256)) :
+                    out.write(",".join(str(v) for v in row) + "\n")
+        except KeyboardInterrupt :
+            pass
+    else :
+        f = open(argv[1],'rb') if len(argv) > 1 and argv[1] != '-' else sys.stdin.buffer
+        for row in d.feed(f.read()) :
+            out.write(",".join(str(v) for v in row) + "\n")
+    sys.stderr.write("bad frames %d, lost %d\n" % (d.bad,d.lost))
+
+if __name__ == '__main__' :
+    main(sys.argv)